@@ -1,29 +1,39 @@
+import csv
 import json
 import os
 import random
 import re
 import string
+import tempfile
+import threading
 import time
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.header import Header
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Dict, Any, List, Optional
+from psycopg2.extras import RealDictCursor, execute_values
+from typing import Dict, Any, List, Optional, Tuple
 import base64
 import uuid
 import boto3
 import requests
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 SCHEMA = 't_p73771717_multi_page_site_proj'
 CABINET_URL = 'https://индиго-арт.рф/participant-cabinet'
 SUPPORT_EMAIL = 'indigo_fest@mail.ru'
-EXPO_PUSH_URL = 'https://exp.host/--/api/v2/push/send'
+NOTIFICATION_KICK_TIMEOUT = 0.5
 VK_API_URL = 'https://api.vk.com/method'
 VK_VERSION = '5.199'
-VK_CHUNK_SIZE = 8  # 3 API-вызова на участника (resolve + likes.isLiked + groups.isMember) => 24 <= 25 лимит execute
+MAX_APPLICATIONS_PAGE = 500
+EXPORT_BATCH_SIZE = 500
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+CSV_PHONE_RE = re.compile(r'^[+\-]?[\d\s()\-]+$')
+MAX_BULK_APPLICATIONS = 1000
+VK_CHUNK_SIZE = 12  # 2 API-вызова на участника (likes.isLiked + groups.isMember) => 24 <= 25 лимит execute
+VK_RESOLVE_CHUNK_SIZE = 25  # только utils.resolveScreenName для участников без сохранённого vk_user_id
+VK_RATE_PER_SECOND = 3  # лимит VK API для пользовательского токена; execute считается одним запросом
+VK_CHECK_WORKERS = 3
+VK_CHECK_TIME_BUDGET_SECONDS = 20  # остаток проверки продолжится при следующем вызове run_check
+VK_CHECK_LEASE_SECONDS = 120
+VK_RESULTS_FLUSH_SIZE = 500
 
 STATUS_LABELS = {
     'approved': 'одобрена',
@@ -32,94 +42,22 @@ STATUS_LABELS = {
 }
 
 
-def send_push_notification(push_token: str, title: str, body: str, data: dict = None) -> None:
-    '''Отправляет push-уведомление через Expo Push Service одному пользователю'''
-    if not push_token:
+def kick_notification_dispatcher() -> None:
+    '''Будит диспетчер очереди уведомлений; ответа не ждём — иначе он всё равно заберёт очередь по расписанию'''
+    url = os.environ.get('NOTIFICATION_DISPATCHER_URL')
+    if not url:
         return
-    message = {'to': push_token, 'title': title, 'body': body}
-    if data:
-        message['data'] = data
     try:
-        resp = requests.post(
-            EXPO_PUSH_URL,
-            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
-            json=message,
-            timeout=10,
-        )
-        result = resp.json()
-        ticket = result.get('data', {})
-        if isinstance(ticket, dict) and ticket.get('status') == 'error':
-            print(f"[PUSH ERROR] token={push_token} error={ticket.get('message')} details={ticket.get('details')}")
-        else:
-            print(f"[PUSH OK] token={push_token} response={result}")
-    except Exception as e:
-        print(f"[PUSH EXCEPTION] token={push_token} error={e}")
-
-
-def send_status_update_email(to_email: str, full_name: str, contest_title: str, new_status: str, admin_comment: str = '') -> None:
-    '''Отправляет участнику письмо об изменении статуса его заявки'''
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = os.environ.get('SMTP_PORT')
-    smtp_user = os.environ.get('SMTP_USER')
-    smtp_password = os.environ.get('SMTP_PASSWORD')
-    if not all([smtp_host, smtp_port, smtp_user, smtp_password, to_email]):
-        return
-
-    status_label = STATUS_LABELS.get(new_status, new_status)
-    status_color = '#16a34a' if new_status == 'approved' else ('#dc2626' if new_status in ('rejected', 'pending') else '#6d28d9')
-
-    comment_html = ''
-    if admin_comment and new_status in ('rejected', 'pending'):
-        comment_html = f"""
-      <div style="background: #fef2f2; border-left: 4px solid #dc2626; padding: 12px 16px; margin: 16px 0; border-radius: 4px;">
-        <p style="margin: 0 0 4px 0; font-weight: bold; color: #991b1b;">Комментарий организатора:</p>
-        <p style="margin: 0; white-space: pre-wrap;">{admin_comment}</p>
-      </div>
-        """
-
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = Header(f'Статус заявки на конкурс «{contest_title}» изменён — ИНДИГО', 'utf-8')
-    msg['From'] = smtp_user
-    msg['To'] = to_email
-
-    html = f"""
-    <div style="font-family: Arial, sans-serif; max-width: 560px; margin: 0 auto;">
-      <h2 style="color: #6d28d9;">Статус заявки обновлён</h2>
-      <p>Здравствуйте, {full_name}!</p>
-      <p>Статус вашей заявки на участие в конкурсе «<b>{contest_title}</b>» изменён:</p>
-      <p style="font-size: 20px; font-weight: bold; color: {status_color};">Заявка {status_label}</p>
-      {comment_html}
-      <p>Подробности можно посмотреть в <a href="{CABINET_URL}" style="color:#6d28d9;">личном кабинете участника</a>.</p>
-      <p style="color:#6b7280; font-size: 14px; margin-top: 24px;">
-        Если у вас есть вопросы, напишите нам в чат поддержки личного кабинета
-        или на почту <a href="mailto:{SUPPORT_EMAIL}" style="color:#6d28d9;">{SUPPORT_EMAIL}</a>.
-      </p>
-    </div>
-    """
-    msg.attach(MIMEText(html, 'html'))
-
-    if int(smtp_port) == 465:
-        with smtplib.SMTP_SSL(smtp_host, int(smtp_port)) as server:
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, to_email, msg.as_string())
-    else:
-        with smtplib.SMTP(smtp_host, int(smtp_port)) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, to_email, msg.as_string())
+        requests.post(url, headers={'X-Api-Key': os.environ.get('ADMIN_API_KEY', '')}, timeout=NOTIFICATION_KICK_TIMEOUT)
+    except requests.RequestException:
+        pass
 
 
 def generate_diploma_number(conn) -> str:
-    '''Генерация уникального номера диплома: 2 случайные буквы + 6 цифр (сквозная нумерация)'''
+    '''Генерация уникального номера диплома: 2 случайные буквы + 6 цифр (сквозная нумерация из diploma_number_seq)'''
     series = ''.join(random.choices(string.ascii_uppercase, k=2))
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(f'''
-            SELECT COALESCE(MAX(CAST(SUBSTRING(diploma_number FROM 3) AS INTEGER)), 0) + 1 AS next_num
-            FROM {SCHEMA}.contest_program
-            WHERE diploma_number ~ '^[A-Z]{{2}}[0-9]{{6}}$'
-        ''')
+        cur.execute(f"SELECT nextval('{SCHEMA}.diploma_number_seq') AS next_num")
         next_num = cur.fetchone()['next_num']
     return f'{series}{str(next_num).zfill(6)}'
 
@@ -408,49 +346,66 @@ def get_region_major_cities(region_id: int, token: str) -> List[Dict[str, Any]]:
     return [{'id': c['id'], 'title': c.get('title', '')} for c in major]
 
 
-def vk_build_check_code(screen_names: List[str], owner_id: int, post_id: int, group_id: int) -> str:
-    '''Формирует VKScript для резолва профилей и проверки лайка/репоста/подписки на группу'''
+def vk_build_resolve_code(screen_names: List[str]) -> str:
+    '''Формирует VKScript для резолва screen_name в id пользователей (0 — не найден или не пользователь)'''
     names_json = json.dumps(screen_names)
     return f'''
-    var ids = {names_json};
+    var names = {names_json};
+    var result = [];
+    var i = 0;
+    while (i < names.length) {{
+      var resolved = API.utils.resolveScreenName({{"screen_name": names[i]}});
+      var uid = 0;
+      if (resolved.type == "user") {{ uid = resolved.object_id; }}
+      result.push(uid);
+      i = i + 1;
+    }}
+    return result;
+    '''
+
+
+def vk_build_check_code(user_ids: List[int], owner_id: int, post_id: int, group_id: int) -> str:
+    '''Формирует VKScript для проверки лайка/репоста/подписки на группу по id пользователей'''
+    ids_json = json.dumps(user_ids)
+    return f'''
+    var ids = {ids_json};
     var owner_id = {owner_id};
     var item_id = {post_id};
     var group_id = {group_id};
     var result = [];
     var i = 0;
     while (i < ids.length) {{
-      var sn = ids[i];
-      var resolved = API.utils.resolveScreenName({{"screen_name": sn}});
-      var uid = 0;
-      if (resolved.type == "user") {{ uid = resolved.object_id; }}
-      var liked = 0;
-      var copied = 0;
-      var member = 0;
-      if (uid > 0) {{
-        var lk = API.likes.isLiked({{"type":"post","owner_id":owner_id,"item_id":item_id,"user_id":uid}});
-        liked = lk.liked;
-        copied = lk.copied;
-        member = API.groups.isMember({{"group_id":group_id,"user_id":uid}});
-      }}
-      result.push({{"screen_name": sn, "user_id": uid, "liked": liked, "copied": copied, "member": member}});
+      var uid = ids[i];
+      var lk = API.likes.isLiked({{"type":"post","owner_id":owner_id,"item_id":item_id,"user_id":uid}});
+      var member = API.groups.isMember({{"group_id":group_id,"user_id":uid}});
+      result.push({{"user_id": uid, "liked": lk.liked, "copied": lk.copied, "member": member}});
       i = i + 1;
     }}
     return result;
     '''
 
 
-def vk_fetch_all_commenters(owner_id: int, post_id: int, token: str) -> set:
-    '''Собирает id всех, кто оставил комментарий под постом (до 1000 комментариев)'''
+def vk_fetch_all_commenters(owner_id: int, post_id: int, token: str, limiter: Optional['TokenBucket'] = None,
+                            deadline: Optional[float] = None) -> Optional[set]:
+    '''
+    Собирает id всех, кто оставил комментарий под постом (до 1000 комментариев).
+    Возвращает None, если список не собран целиком: ошибка VK или истёк deadline (time.monotonic()).
+    '''
     commenter_ids = set()
     offset = 0
     count = 100
     for _ in range(10):
+        if limiter:
+            limiter.acquire()
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
         data = vk_call('wall.getComments', {
             'owner_id': owner_id, 'post_id': post_id, 'count': count, 'offset': offset, 'need_likes': 0,
         }, token)
         response = data.get('response')
         if not response:
-            break
+            print(f'[VK ERROR] wall.getComments error={data.get("error")}')
+            return None
         items = response.get('items', [])
         for item in items:
             from_id = item.get('from_id')
@@ -460,10 +415,210 @@ def vk_fetch_all_commenters(owner_id: int, post_id: int, token: str) -> set:
         offset += count
         if offset >= total or not items:
             break
-        time.sleep(0.34)
+        if not limiter:
+            time.sleep(0.34)
     return commenter_ids
 
 
+class TokenBucket:
+    '''Потокобезопасный ограничитель частоты запросов: rate в секунду, без всплесков сверх capacity'''
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+def vk_resolve_user_ids(screen_names: List[str], token: str, limiter: TokenBucket,
+                        deadline: float) -> Tuple[Dict[str, int], set]:
+    '''
+    Резолв screen_name -> id пользователя ВК пачками по VK_RESOLVE_CHUNK_SIZE. Имена, которые VK определил
+    как не пользователя, попадают в результат с id 0. Вторым значением возвращает имена из пачек, завершившихся
+    ошибкой VK или не запущенных до deadline, — их резолв откладывается до следующего вызова.
+    '''
+    chunks = [screen_names[i:i + VK_RESOLVE_CHUNK_SIZE] for i in range(0, len(screen_names), VK_RESOLVE_CHUNK_SIZE)]
+
+    def run_chunk(chunk: List[str]) -> Optional[Dict[str, int]]:
+        limiter.acquire()
+        if time.monotonic() >= deadline:
+            return None
+        try:
+            exec_result = vk_execute(vk_build_resolve_code(chunk), token)
+        except requests.RequestException as e:
+            print(f'[VK ERROR] resolve chunk_exception={e}')
+            return None
+        if 'error' in exec_result:
+            print(f'[VK ERROR] resolve chunk_error={exec_result["error"]}')
+            return None
+        uids = exec_result.get('response')
+        if not isinstance(uids, list) or len(uids) != len(chunk):
+            print(f'[VK ERROR] resolve chunk_response={uids}')
+            return None
+        return {name: uid if uid and uid > 0 else 0 for name, uid in zip(chunk, uids)}
+
+    resolved: Dict[str, int] = {}
+    skipped = set()
+    with ThreadPoolExecutor(max_workers=VK_CHECK_WORKERS) as pool:
+        for chunk, part in zip(chunks, pool.map(run_chunk, chunks)):
+            if part is None:
+                skipped.update(chunk)
+            else:
+                resolved.update(part)
+    return resolved, skipped
+
+
+def vk_check_chunks(participants: List[Dict[str, Any]], owner_id: int, post_id: int, group_id: int, token: str,
+                    commenter_ids: set, limiter: TokenBucket, on_chunk, deadline: float) -> bool:
+    '''
+    Проверка участников с известным vk_user_id пачками по VK_CHUNK_SIZE через execute: до VK_CHECK_WORKERS
+    пачек в полёте, частота вызовов ограничена limiter. Результаты каждой пачки сразу отдаются в on_chunk
+    (в этом потоке); участники без vk_user_id (VK ответил, что это не пользователь) отдаются как не найденные
+    без обращения к API.
+    Новые пачки не запускаются после deadline (time.monotonic()). Возвращает False, если проверены не все:
+    пачки, не запущенные до deadline или завершившиеся ошибкой VK, остаются непроверенными до следующего вызова.
+    '''
+    unresolved = [p for p in participants if not p.get('vk_user_id')]
+    if unresolved:
+        on_chunk([{
+            'application_id': p['application_id'], 'vk_user_id': None, 'vk_resolved': False,
+            'liked': False, 'reposted': False, 'commented': False, 'subscribed': False,
+        } for p in unresolved])
+    resolved = [p for p in participants if p.get('vk_user_id')]
+    chunks = [resolved[i:i + VK_CHUNK_SIZE] for i in range(0, len(resolved), VK_CHUNK_SIZE)]
+
+    def run_chunk(chunk: List[Dict[str, Any]]) -> Dict[str, Any]:
+        code = vk_build_check_code([p['vk_user_id'] for p in chunk], owner_id, post_id, group_id)
+        limiter.acquire()
+        return vk_execute(code, token)
+
+    next_chunk = 0
+    failed = False
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=VK_CHECK_WORKERS) as pool:
+        while in_flight or next_chunk < len(chunks):
+            while next_chunk < len(chunks) and len(in_flight) < VK_CHECK_WORKERS and time.monotonic() < deadline:
+                in_flight[pool.submit(run_chunk, chunks[next_chunk])] = chunks[next_chunk]
+                next_chunk += 1
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = in_flight.pop(future)
+                try:
+                    exec_result = future.result()
+                except requests.RequestException as e:
+                    print(f'[VK ERROR] run_check chunk_exception={e}')
+                    failed = True
+                    continue
+                if 'error' in exec_result:
+                    print(f'[VK ERROR] run_check chunk_error={exec_result["error"]}')
+                    failed = True
+                    continue
+                results = []
+                for p, r in zip(chunk, exec_result.get('response', [])):
+                    uid = p['vk_user_id']
+                    results.append({
+                        'application_id': p['application_id'],
+                        'vk_user_id': uid,
+                        'vk_resolved': True,
+                        'liked': bool(r.get('liked')),
+                        'reposted': bool(r.get('copied')),
+                        'commented': uid in commenter_ids,
+                        'subscribed': bool(r.get('member')),
+                    })
+                on_chunk(results)
+    return next_chunk >= len(chunks) and not failed
+
+
+def vk_auto_reject(conn, contest_id: int, started_at, custom_comment: str) -> int:
+    '''Отклонение заявок на рассмотрении, не выполнивших условия в прогоне проверки, начатом в started_at'''
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'''
+            SELECT r.application_id, r.vk_resolved, r.liked, r.reposted, r.subscribed,
+                   p.full_name, p.email, p.push_token, c.title AS contest_title
+            FROM {SCHEMA}.vk_check_results r
+            JOIN {SCHEMA}.applications a ON a.id = r.application_id
+            JOIN {SCHEMA}.participants p ON p.id = a.participant_id
+            JOIN {SCHEMA}.contests c ON c.id = a.contest_id
+            WHERE r.contest_id = %s AND r.checked_at >= %s AND a.status = 'pending'
+            ORDER BY r.application_id
+        ''', (contest_id, started_at))
+        results = cur.fetchall()
+    comments = {}
+    for r in results:
+        if r['vk_resolved'] and r['liked'] and r['reposted'] and r['subscribed']:
+            continue
+        reasons = []
+        if not r['vk_resolved']:
+            reasons.append('не удалось найти профиль ВК по указанной ссылке')
+        else:
+            if not r['liked']:
+                reasons.append('не поставлен лайк на пост')
+            if not r['reposted']:
+                reasons.append('не сделан репост поста')
+            if not r['subscribed']:
+                reasons.append('нет подписки на сообщество')
+        reason_text = '; '.join(reasons)
+        comment = f'Автоматический отказ по итогам проверки ВК: {reason_text}.'
+        if custom_comment:
+            comment += f' {custom_comment}'
+        comments[r['application_id']] = comment
+    if not comments:
+        return 0
+
+    participants_by_id = {r['application_id']: r for r in results}
+    outbox = []
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            rejected_ids = execute_values(cur, f'''
+                UPDATE {SCHEMA}.applications a
+                SET status = 'rejected', admin_comment = v.admin_comment
+                FROM (VALUES %s) AS v(id, admin_comment)
+                WHERE a.id = v.id AND a.status = 'pending'
+                RETURNING a.id
+            ''', list(comments.items()), page_size=len(comments), fetch=True)
+
+            for (application_id,) in sorted(rejected_ids):
+                p = participants_by_id[application_id]
+                if p.get('email'):
+                    outbox.append(('status_email', {
+                        'to_email': p['email'], 'full_name': p.get('full_name'),
+                        'contest_title': p.get('contest_title'), 'new_status': 'rejected',
+                        'admin_comment': comments[application_id],
+                    }))
+                if p.get('push_token'):
+                    outbox.append(('push', {
+                        'push_token': p['push_token'],
+                        'title': 'Заявка отклонена',
+                        'body': f"Заявка на «{p.get('contest_title')}» отклонена по итогам проверки ВК",
+                        'data': {'screen': 'MyApplications', 'applicationId': application_id, 'contestId': contest_id},
+                    }))
+            enqueue_notifications(cur, outbox)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+    kick_notification_dispatcher()
+    return len(rejected_ids)
+
+
 def handle_vk_check(event: Dict[str, Any], conn) -> Dict[str, Any]:
     '''Обработка эндпоинта endpoint=vk_check: настройка поста и проверка лайков/репостов/комментариев'''
     method = event.get('httpMethod', 'GET')
@@ -471,6 +626,19 @@ def handle_vk_check(event: Dict[str, Any], conn) -> Dict[str, Any]:
     action = query_params.get('action', '')
     cors = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
 
+    if method == 'GET' and action == 'status':
+        contest_id = query_params.get('contest_id')
+        if not contest_id:
+            return {'statusCode': 400, 'headers': cors, 'body': json.dumps({'error': 'contest_id обязателен'}), 'isBase64Encoded': False}
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f'''
+                SELECT contest_id, status, total, processed, rejected, auto_reject, started_at, finished_at, updated_at,
+                       COALESCE(locked_until > CURRENT_TIMESTAMP, FALSE) AS in_progress
+                FROM {SCHEMA}.vk_check_runs WHERE contest_id = %s
+            ''', (int(contest_id),))
+            run = cur.fetchone()
+        return {'statusCode': 200, 'headers': cors, 'body': json.dumps({'run': run}, default=str), 'isBase64Encoded': False}
+
     if method == 'GET':
         contest_id = query_params.get('contest_id')
         if not contest_id:
@@ -546,123 +714,576 @@ def handle_vk_check(event: Dict[str, Any], conn) -> Dict[str, Any]:
         post_id = post['post_id']
         group_id = abs(owner_id)
 
+        # Прогон проверки по конкурсу: новый или продолжение прерванного (по таймауту функции).
+        # Аренда locked_until не даёт двум вызовам одновременно проверять одни и те же заявки.
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(f'''
-                SELECT a.id AS application_id, a.status, p.vk_link, p.full_name, p.email, p.push_token, c.title AS contest_title
+                INSERT INTO {SCHEMA}.vk_check_runs AS r
+                    (contest_id, status, auto_reject, reject_comment, started_at, updated_at, locked_until)
+                VALUES (%(contest_id)s, 'running', %(auto_reject)s, %(comment)s,
+                        CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP + make_interval(secs => %(lease)s))
+                ON CONFLICT (contest_id) DO UPDATE SET
+                    status = 'running',
+                    auto_reject = EXCLUDED.auto_reject,
+                    reject_comment = EXCLUDED.reject_comment,
+                    started_at = CASE WHEN r.status = 'running' AND NOT %(restart)s THEN r.started_at ELSE CURRENT_TIMESTAMP END,
+                    rejected = CASE WHEN r.status = 'running' AND NOT %(restart)s THEN r.rejected ELSE 0 END,
+                    finished_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP,
+                    locked_until = EXCLUDED.locked_until
+                WHERE r.locked_until IS NULL OR r.locked_until < CURRENT_TIMESTAMP
+                RETURNING started_at
+            ''', {
+                'contest_id': int(contest_id), 'auto_reject': auto_reject, 'comment': custom_comment,
+                'lease': VK_CHECK_LEASE_SECONDS, 'restart': bool(body_data.get('restart')),
+            })
+            run = cur.fetchone()
+            if not run:
+                cur.execute(f'SELECT * FROM {SCHEMA}.vk_check_runs WHERE contest_id = %s', (int(contest_id),))
+                return {'statusCode': 409, 'headers': cors, 'body': json.dumps({
+                    'error': 'Проверка этого конкурса уже выполняется', 'run': cur.fetchone(),
+                }, default=str), 'isBase64Encoded': False}
+            started_at = run['started_at']
+
+            cur.execute(f'''
+                SELECT a.id AS application_id, a.participant_id, p.vk_link,
+                       CASE WHEN p.vk_user_id_link = p.vk_link THEN p.vk_user_id END AS vk_user_id,
+                       COALESCE(r.checked_at >= %s, FALSE) AS done
                 FROM {SCHEMA}.applications a
                 JOIN {SCHEMA}.participants p ON p.id = a.participant_id
-                JOIN {SCHEMA}.contests c ON c.id = a.contest_id
+                LEFT JOIN {SCHEMA}.vk_check_results r ON r.application_id = a.id AND r.contest_id = a.contest_id
                 WHERE a.contest_id = %s AND p.vk_link IS NOT NULL AND p.vk_link != ''
-            ''', (int(contest_id),))
+                ORDER BY a.id
+            ''', (started_at, int(contest_id)))
             participants = cur.fetchall()
 
-        commenter_ids = vk_fetch_all_commenters(owner_id, post_id, token)
-
-        results = []
-        for i in range(0, len(participants), VK_CHUNK_SIZE):
-            chunk = participants[i:i + VK_CHUNK_SIZE]
-            screen_names = []
-            valid_chunk = []
-            for p in chunk:
-                sn = vk_extract_screen_name(p['vk_link'])
-                if sn:
-                    screen_names.append(sn)
-                    valid_chunk.append(p)
-            if not screen_names:
-                continue
-            code = vk_build_check_code(screen_names, owner_id, post_id, group_id)
-            exec_result = vk_execute(code, token)
-            if 'error' in exec_result:
-                print(f'[VK ERROR] run_check chunk_error={exec_result["error"]}')
-                time.sleep(0.5)
-                continue
-            response = exec_result.get('response', [])
-            for p, r in zip(valid_chunk, response):
-                uid = r.get('user_id', 0)
-                resolved = uid > 0
-                results.append({
-                    'application_id': p['application_id'],
-                    'vk_user_id': uid if resolved else None,
-                    'vk_resolved': resolved,
-                    'liked': bool(r.get('liked')),
-                    'reposted': bool(r.get('copied')),
-                    'commented': resolved and uid in commenter_ids,
-                    'subscribed': bool(r.get('member')),
-                })
-            time.sleep(0.34)
-
-        with conn.cursor() as cur:
-            for r in results:
+        pending = [p for p in participants if not p['done'] and vk_extract_screen_name(p['vk_link'])]
+        processed = len(participants) - len(pending)
+        limiter = TokenBucket(VK_RATE_PER_SECOND)
+        # Общий бюджет времени на сбор комментаторов, резолв и проверку; остаток — при следующем вызове
+        deadline = time.monotonic() + VK_CHECK_TIME_BUDGET_SECONDS
+        commenter_ids = vk_fetch_all_commenters(owner_id, post_id, token, limiter, deadline) if pending else set()
+        # Без полного списка комментаторов проверять нельзя — все ожидающие остаются до следующего вызова
+        deferred = set() if commenter_ids is not None else {p['application_id'] for p in pending}
+
+        # id пользователей ВК хранятся у участника вместе со ссылкой, по которой получены;
+        # резолвим только новых/сменивших ссылку и сохраняем результат
+        to_resolve = {vk_extract_screen_name(p['vk_link']) for p in pending if not p['vk_user_id']}
+        if to_resolve and not deferred:
+            resolved_ids, retry_names = vk_resolve_user_ids(sorted(to_resolve), token, limiter, deadline)
+            deferred = {
+                p['application_id'] for p in pending
+                if not p['vk_user_id'] and vk_extract_screen_name(p['vk_link']) in retry_names
+            }
+            cache_rows = {}
+            for p in pending:
+                if not p['vk_user_id'] and p['application_id'] not in deferred:
+                    p['vk_user_id'] = resolved_ids.get(vk_extract_screen_name(p['vk_link']))
+                    if p['vk_user_id']:
+                        cache_rows[p['participant_id']] = (p['participant_id'], p['vk_user_id'], p['vk_link'])
+            if cache_rows:
+                with conn.cursor() as cur:
+                    execute_values(cur, f'''
+                        UPDATE {SCHEMA}.participants p
+                        SET vk_user_id = v.vk_user_id, vk_user_id_link = v.vk_link
+                        FROM (VALUES %s) AS v(id, vk_user_id, vk_link)
+                        WHERE p.id = v.id AND p.vk_link = v.vk_link
+                    ''', list(cache_rows.values()), page_size=len(cache_rows))
+
+        # Результаты копятся в буфере и пишутся одним многострочным upsert на VK_RESULTS_FLUSH_SIZE строк
+        buffered: List[Dict[str, Any]] = []
+
+        def save_progress(results: List[Dict[str, Any]]) -> None:
+            buffered.extend(results)
+            if len(buffered) >= VK_RESULTS_FLUSH_SIZE:
+                flush_results()
+
+        def flush_results() -> None:
+            nonlocal processed
+            results = buffered[:]
+            buffered.clear()
+            processed += len(results)
+            with conn.cursor() as cur:
+                if results:
+                    execute_values(cur, f'''
+                        INSERT INTO {SCHEMA}.vk_check_results (contest_id, application_id, vk_user_id, vk_resolved, liked, reposted, commented, subscribed, checked_at)
+                        VALUES %s
+                        ON CONFLICT (contest_id, application_id) DO UPDATE SET
+                            vk_user_id = EXCLUDED.vk_user_id, vk_resolved = EXCLUDED.vk_resolved,
+                            liked = EXCLUDED.liked, reposted = EXCLUDED.reposted, commented = EXCLUDED.commented,
+                            subscribed = EXCLUDED.subscribed, checked_at = CURRENT_TIMESTAMP
+                    ''', [
+                        (int(contest_id), r['application_id'], r['vk_user_id'], r['vk_resolved'], r['liked'], r['reposted'], r['commented'], r['subscribed'])
+                        for r in results
+                    ], template='(%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)', page_size=len(results))
                 cur.execute(f'''
-                    INSERT INTO {SCHEMA}.vk_check_results (contest_id, application_id, vk_user_id, vk_resolved, liked, reposted, commented, subscribed, checked_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                    ON CONFLICT (contest_id, application_id) DO UPDATE SET
-                        vk_user_id = EXCLUDED.vk_user_id, vk_resolved = EXCLUDED.vk_resolved,
-                        liked = EXCLUDED.liked, reposted = EXCLUDED.reposted, commented = EXCLUDED.commented,
-                        subscribed = EXCLUDED.subscribed, checked_at = CURRENT_TIMESTAMP
-                ''', (int(contest_id), r['application_id'], r['vk_user_id'], r['vk_resolved'], r['liked'], r['reposted'], r['commented'], r['subscribed']))
+                    UPDATE {SCHEMA}.vk_check_runs
+                    SET processed = %s, total = %s, updated_at = CURRENT_TIMESTAMP,
+                        locked_until = CURRENT_TIMESTAMP + make_interval(secs => %s)
+                    WHERE contest_id = %s
+                ''', (processed, len(participants), VK_CHECK_LEASE_SECONDS, int(contest_id)))
+
+        to_check = [p for p in pending if p['application_id'] not in deferred]
+        finished = vk_check_chunks(to_check, owner_id, post_id, group_id, token, commenter_ids or set(), limiter,
+                                   save_progress, deadline)
+        finished = finished and not deferred
+        flush_results()
 
         rejected_count = 0
-        if auto_reject:
-            participants_by_id = {p['application_id']: p for p in participants}
-            with conn.cursor() as cur:
-                for r in results:
-                    if r['vk_resolved'] and r['liked'] and r['reposted'] and r['subscribed']:
-                        continue
-                    reasons = []
-                    if not r['vk_resolved']:
-                        reasons.append('не удалось найти профиль ВК по указанной ссылке')
-                    else:
-                        if not r['liked']:
-                            reasons.append('не поставлен лайк на пост')
-                        if not r['reposted']:
-                            reasons.append('не сделан репост поста')
-                        if not r['subscribed']:
-                            reasons.append('нет подписки на сообщество')
-                    reason_text = '; '.join(reasons)
-                    comment = f'Автоматический отказ по итогам проверки ВК: {reason_text}.'
-                    if custom_comment:
-                        comment += f' {custom_comment}'
-
-                    cur.execute(
-                        f"UPDATE {SCHEMA}.applications SET status = 'rejected', admin_comment = %s WHERE id = %s AND status = 'pending'",
-                        (comment, r['application_id'])
-                    )
-                    if cur.rowcount == 0:
-                        continue
-                    rejected_count += 1
-
-                    p = participants_by_id.get(r['application_id'])
-                    if p:
-                        try:
-                            send_status_update_email(p.get('email'), p.get('full_name'), p.get('contest_title'), 'rejected', comment)
-                        except Exception as email_err:
-                            print(f'[VK AUTO-REJECT EMAIL ERROR] {email_err}')
-                        try:
-                            send_push_notification(
-                                p.get('push_token'),
-                                'Заявка отклонена',
-                                f"Заявка на «{p.get('contest_title')}» отклонена по итогам проверки ВК",
-                                {'screen': 'MyApplications', 'applicationId': r['application_id'], 'contestId': int(contest_id)}
-                            )
-                        except Exception as push_err:
-                            print(f'[VK AUTO-REJECT PUSH ERROR] {push_err}')
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if finished:
+                if auto_reject:
+                    rejected_count = vk_auto_reject(conn, int(contest_id), started_at, custom_comment)
+                cur.execute(f'''
+                    UPDATE {SCHEMA}.vk_check_runs
+                    SET status = 'done', processed = %s, total = %s, rejected = rejected + %s,
+                        finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP, locked_until = NULL
+                    WHERE contest_id = %s
+                    RETURNING rejected
+                ''', (processed, len(participants), rejected_count, int(contest_id)))
+            else:
+                cur.execute(f'''
+                    UPDATE {SCHEMA}.vk_check_runs
+                    SET processed = %s, total = %s, updated_at = CURRENT_TIMESTAMP, locked_until = NULL
+                    WHERE contest_id = %s
+                    RETURNING rejected
+                ''', (processed, len(participants), int(contest_id)))
+            rejected_total = cur.fetchone()['rejected']
 
         return {'statusCode': 200, 'headers': cors, 'body': json.dumps({
             'success': True,
-            'checked': len(results),
+            'status': 'done' if finished else 'running',
+            'processed': processed,
+            'checked': processed,
             'total_with_vk_link': len(participants),
-            'rejected': rejected_count,
+            'rejected': rejected_total,
         }), 'isBase64Encoded': False}
 
     return {'statusCode': 404, 'headers': cors, 'body': json.dumps({'error': 'Неизвестный эндпоинт'}), 'isBase64Encoded': False}
 
 
+def applications_filter(params: Dict[str, Any]) -> tuple:
+    '''Условия WHERE по заявкам (алиас a) из параметров contest_id, status, search — без JOIN'''
+    filters = ''
+    filter_params = []
+
+    if params.get('contest_id'):
+        filters += " AND a.contest_id = %s"
+        filter_params.append(int(params['contest_id']))
+
+    if params.get('status'):
+        filters += " AND a.status = %s"
+        filter_params.append(params['status'])
+
+    search_query = (params.get('search') or '').strip()
+    if search_query:
+        # Поиск по подстроке; участники и номинации отбираются подзапросами, чтобы каждое
+        # условие шло по своему триграммному индексу (V0091), а COUNT оставался без JOIN
+        pattern = '%' + search_query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        filters += f'''
+            AND (
+                a.performance_title ILIKE %s
+                OR a.nomination ILIKE %s
+                OR a.participant_id IN (
+                    SELECT id FROM {SCHEMA}.participants
+                    WHERE full_name ILIKE %s OR email ILIKE %s OR phone ILIKE %s OR city ILIKE %s
+                )
+                OR a.nomination_id IN (SELECT id FROM {SCHEMA}.nominations WHERE name ILIKE %s)'''
+        filter_params.extend([pattern] * 7)
+        # Номер заявки ищется по подстроке, как раньше на клиенте; только для цифр, чтобы текстовый
+        # поиск не терял триграммные индексы из-за условия без индекса
+        if search_query.isdigit():
+            filters += '\n                OR a.id::text LIKE %s'
+            filter_params.append(pattern)
+        filters += '\n            )'
+
+    return filters, filter_params
+
+
+EXPORT_COLUMNS = [
+    ('id', 'ID заявки'),
+    ('submitted_at', 'Дата подачи'),
+    ('status', 'Статус'),
+    ('contest_title', 'Конкурс'),
+    ('full_name', 'Участник'),
+    ('contact_position', 'Контактное лицо'),
+    ('email', 'Email'),
+    ('phone', 'Телефон'),
+    ('city', 'Город'),
+    ('vk_link', 'ВКонтакте'),
+    ('category', 'Категория'),
+    ('nomination_name', 'Номинация'),
+    ('performance_title', 'Название номера'),
+    ('participation_format', 'Формат участия'),
+    ('experience', 'Опыт'),
+    ('achievements', 'Достижения'),
+    ('additional_info', 'Дополнительно'),
+    ('admin_comment', 'Комментарий администратора'),
+]
+
+
+def _export_value(value: Any) -> Any:
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        value = ', '.join(str(v) for v in value)
+    elif isinstance(value, dict):
+        value = json.dumps(value, ensure_ascii=False)
+    elif hasattr(value, 'isoformat'):
+        return value.strftime('%d.%m.%Y %H:%M')
+    return value
+
+
+def _csv_value(value: Any) -> Any:
+    '''
+    Текст, начинающийся с =, +, -, @, Excel при открытии CSV выполнит как формулу — экранируем апострофом.
+    Телефоны и числа (только цифры, пробелы, скобки, + и -) оставляем как есть.
+    '''
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES) and not CSV_PHONE_RE.match(value):
+        return "'" + value
+    return value
+
+
+def _xlsx_value(sheet, value: Any) -> Any:
+    '''openpyxl превращает в формулу только строки с =, такие ячейки явно сохраняются как текст'''
+    if isinstance(value, str) and value.startswith('='):
+        from openpyxl.cell import WriteOnlyCell
+        cell = WriteOnlyCell(sheet, value)
+        cell.data_type = 's'
+        return cell
+    return value
+
+
+def export_applications(conn, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Выгрузка заявок в CSV/XLSX: строки читаются серверным (именованным) курсором пачками
+    по EXPORT_BATCH_SIZE и сразу пишутся во временный файл, который затем загружается в бакет —
+    потребление памяти не зависит от размера конкурса
+    '''
+    fmt = params.get('format', 'csv')
+    if fmt not in ('csv', 'xlsx'):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'format должен быть csv или xlsx'}),
+            'isBase64Encoded': False
+        }
+    filters, filter_params = applications_filter(params)
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        # Колонки пользовательских полей анкеты: ключи custom_fields выбранных заявок,
+        # подписи и порядок — из конструктора формы конкурса
+        cur.execute(f'''
+            SELECT k.key, MIN(f.field_label) AS label
+            FROM {SCHEMA}.applications a
+            CROSS JOIN LATERAL jsonb_object_keys(a.custom_fields) AS k(key)
+            JOIN {SCHEMA}.contests c ON c.id = a.contest_id
+            LEFT JOIN {SCHEMA}.application_form_fields f
+                ON f.template_id = c.form_template_id AND f.field_name = k.key
+            WHERE jsonb_typeof(a.custom_fields) = 'object'{filters}
+            GROUP BY k.key
+            ORDER BY MIN(f.sort_order) NULLS LAST, k.key
+        ''', filter_params)
+        custom_columns = [(row['key'], row['label'] or row['key']) for row in cur.fetchall()]
+
+    header = [label for _, label in EXPORT_COLUMNS] + [label for _, label in custom_columns] + ['Файлы']
+    select_sql = f'''
+        SELECT
+            a.id, a.submitted_at, a.status, c.title AS contest_title,
+            p.full_name, p.contact_position, p.email, p.phone, p.city, p.vk_link,
+            a.category, COALESCE(n.name, a.nomination) AS nomination_name, a.performance_title,
+            a.participation_format, a.experience, a.achievements, a.additional_info, a.admin_comment,
+            a.custom_fields,
+            (SELECT string_agg(f.file_url, ' ' ORDER BY f.id)
+             FROM {SCHEMA}.application_files f WHERE f.application_id = a.id) AS file_urls
+        FROM {SCHEMA}.applications a
+        JOIN {SCHEMA}.participants p ON a.participant_id = p.id
+        JOIN {SCHEMA}.contests c ON a.contest_id = c.id
+        LEFT JOIN {SCHEMA}.nominations n ON n.id = a.nomination_id
+        WHERE 1=1{filters}
+        ORDER BY a.submitted_at DESC, a.id DESC
+    '''
+
+    with tempfile.NamedTemporaryFile(suffix=f'.{fmt}') as tmp:
+        if fmt == 'csv':
+            out = open(tmp.name, 'w', encoding='utf-8-sig', newline='')
+            writer = csv.writer(out, delimiter=';')
+
+            def write_row(values: List[Any]) -> None:
+                writer.writerow([_csv_value(v) for v in values])
+        else:
+            from openpyxl import Workbook
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet('Заявки')
+
+            def write_row(values: List[Any]) -> None:
+                sheet.append([_xlsx_value(sheet, v) for v in values])
+        write_row(header)
+
+        count = 0
+        # Именованный курсор работает только внутри транзакции
+        conn.autocommit = False
+        try:
+            with conn.cursor(name='applications_export', cursor_factory=RealDictCursor) as cur:
+                cur.itersize = EXPORT_BATCH_SIZE
+                cur.execute(select_sql, filter_params)
+                while True:
+                    rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                    if not rows:
+                        break
+                    for row in rows:
+                        custom = row['custom_fields'] if isinstance(row['custom_fields'], dict) else {}
+                        write_row(
+                            [_export_value(row[key]) for key, _ in EXPORT_COLUMNS]
+                            + [_export_value(custom.get(key)) for key, _ in custom_columns]
+                            + [row['file_urls'] or '']
+                        )
+                    count += len(rows)
+            conn.rollback()
+        finally:
+            conn.autocommit = True
+
+        if fmt == 'csv':
+            out.close()
+            content_type = 'text/csv; charset=utf-8'
+        else:
+            workbook.save(tmp.name)
+            content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+        key = f"exports/applications/{uuid.uuid4()}.{fmt}"
+        s3 = boto3.client('s3',
+            endpoint_url='https://bucket.poehali.dev',
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+        )
+        s3.upload_file(tmp.name, 'files', key, ExtraArgs={'ContentType': content_type})
+
+    url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'url': url, 'count': count, 'format': fmt}),
+        'isBase64Encoded': False
+    }
+
+
+def program_row_values(application: Dict[str, Any], system_fields: List[Dict[str, Any]]) -> Dict[str, Any]:
+    '''Значения строки программы по заявке: системные поля формы (custom_fields -> system_key) важнее полей заявки'''
+    custom_fields = application.get('custom_fields') or {}
+    if isinstance(custom_fields, str):
+        custom_fields = json.loads(custom_fields)
+
+    system_values = {}
+    for row in system_fields:
+        value = custom_fields.get(row['field_name'], '')
+        if value:
+            system_values[row['system_key']] = value
+
+    return {
+        'participant_name': system_values.get('participant_name') or application['full_name'],
+        'nomination': system_values.get('nomination') or application.get('nomination', ''),
+        'nomination_id': application.get('nomination_id'),
+        'piece_title': system_values.get('piece_title') or application.get('performance_title', ''),
+        'participation_format': system_values.get('participation_format') or application.get('participation_format', ''),
+        'region': system_values.get('region') or application.get('city', ''),
+        'directing_party': system_values.get('directing_party', ''),
+        'duration': system_values.get('duration', ''),
+        'director_name': system_values.get('director_name') or application.get('contact_position', ''),
+        'age': system_values.get('age_category', ''),
+    }
+
+
+def enqueue_notifications(cur, items: List[tuple]) -> None:
+    '''Постановка уведомлений (kind, payload) в notification_outbox в текущей транзакции'''
+    if not items:
+        return
+    execute_values(
+        cur,
+        f'INSERT INTO {SCHEMA}.notification_outbox (kind, payload) VALUES %s',
+        [(kind, json.dumps(payload, ensure_ascii=False)) for kind, payload in items],
+        page_size=len(items)
+    )
+
+
+def handle_bulk_status(event: Dict[str, Any], conn) -> Dict[str, Any]:
+    '''
+    Массовая смена статуса заявок одной транзакцией: статусы — одним UPDATE, при одобрении участники
+    и строки программы (сквозные номера по конкурсу) — по одному запросу на всю пачку, письма и push
+    ставятся в notification_outbox вместо отправки прямо в запросе
+    '''
+    body = json.loads(event.get('body') or '{}')
+    new_status = body.get('status')
+    admin_comment = body.get('admin_comment', '')
+    try:
+        app_ids = sorted({int(i) for i in body.get('application_ids') or []})
+    except (TypeError, ValueError):
+        app_ids = []
+
+    if not app_ids or new_status not in STATUS_LABELS:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'application_ids и status (approved, rejected, pending) обязательны'}),
+            'isBase64Encoded': False
+        }
+    if len(app_ids) > MAX_BULK_APPLICATIONS:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'Не более {MAX_BULK_APPLICATIONS} заявок за раз'}),
+            'isBase64Encoded': False
+        }
+
+    program_created = 0
+    conn.autocommit = False
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f'''
+                UPDATE {SCHEMA}.applications a
+                SET status = %s, admin_comment = %s
+                FROM {SCHEMA}.participants p, {SCHEMA}.contests c
+                WHERE a.id = ANY(%s) AND p.id = a.participant_id AND c.id = a.contest_id
+                RETURNING a.id, a.participant_id, a.contest_id, a.category, a.custom_fields,
+                          a.nomination, a.nomination_id, a.performance_title, a.participation_format,
+                          p.full_name, p.contact_position, p.email, p.city, p.push_token,
+                          c.title AS contest_title
+            ''', (new_status, admin_comment if new_status in ('rejected', 'pending') else None, app_ids))
+            applications = sorted(cur.fetchall(), key=lambda a: a['id'])
+
+            if new_status == 'approved' and applications:
+                contest_ids = sorted({a['contest_id'] for a in applications})
+                # Блокируем конкурсы, чтобы параллельное одобрение не выдало те же номера в программе
+                cur.execute(f'SELECT id FROM {SCHEMA}.contests WHERE id = ANY(%s) ORDER BY id FOR UPDATE', (contest_ids,))
+                cur.execute(f'''
+                    SELECT c.id AS contest_id, f.system_key, f.field_name
+                    FROM {SCHEMA}.application_form_fields f
+                    JOIN {SCHEMA}.contests c ON c.form_template_id = f.template_id
+                    WHERE c.id = ANY(%s) AND f.system_key IS NOT NULL
+                ''', (contest_ids,))
+                fields_by_contest: Dict[int, List[Dict[str, Any]]] = {}
+                for row in cur.fetchall():
+                    fields_by_contest.setdefault(row['contest_id'], []).append(row)
+
+                program_rows = []
+                participant_rows = {}
+                for app in applications:
+                    values = program_row_values(app, fields_by_contest.get(app['contest_id'], []))
+                    program_rows.append((
+                        app['id'], app['contest_id'], values['region'], values['directing_party'],
+                        values['participant_name'], values['age'], values['nomination'], values['nomination_id'],
+                        values['piece_title'], values['duration'], values['director_name'], values['participation_format'],
+                    ))
+                    # У участника с несколькими заявками остаётся последняя, как при одобрении по одной
+                    participant_rows[app['participant_id']] = (
+                        app['participant_id'], app['contest_id'], app['category'],
+                        values['piece_title'] or 'Не указано', values['participation_format'], values['nomination'],
+                    )
+
+                execute_values(cur, f'''
+                    UPDATE {SCHEMA}.participants p
+                    SET contest_id = v.contest_id, category = v.category, performance_title = v.performance_title,
+                        participation_format = v.participation_format, nomination = v.nomination, status = 'approved'
+                    FROM (VALUES %s) AS v(id, contest_id, category, performance_title, participation_format, nomination)
+                    WHERE p.id = v.id
+                ''', list(participant_rows.values()), page_size=len(participant_rows))
+
+                # Заявки, уже стоящие в программе, только синхронизируют номинацию; новые встают в конец
+                # программы своего конкурса в порядке id заявок
+                execute_values(cur, f'''
+                    WITH v (application_id, contest_id, region, directing_party, participant_name, age,
+                            nomination, nomination_id, piece_title, duration, director_name, participation_format) AS (
+                        VALUES %s
+                    ),
+                    synced AS (
+                        UPDATE {SCHEMA}.contest_program cp
+                        SET nomination = v.nomination, nomination_id = v.nomination_id::int,
+                            award_computed_at = CASE WHEN cp.nomination_id IS DISTINCT FROM v.nomination_id::int
+                                                     THEN NULL ELSE cp.award_computed_at END
+                        FROM v
+                        WHERE cp.application_id = v.application_id
+                        RETURNING cp.application_id
+                    ),
+                    new_rows AS (
+                        SELECT v.*, ROW_NUMBER() OVER (PARTITION BY v.contest_id ORDER BY v.application_id) AS rn
+                        FROM v
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM {SCHEMA}.contest_program cp WHERE cp.application_id = v.application_id
+                        )
+                    ),
+                    base AS (
+                        SELECT contest_id, MAX(order_number) AS max_order
+                        FROM {SCHEMA}.contest_program
+                        WHERE contest_id IN (SELECT contest_id FROM v)
+                        GROUP BY contest_id
+                    )
+                    INSERT INTO {SCHEMA}.contest_program
+                      (contest_id, order_number, region, directing_party, participant_name, age, nomination, nomination_id,
+                       piece_title, duration, diploma_number, director_name, application_id, participation_format)
+                    SELECT n.contest_id, COALESCE(b.max_order, 0) + n.rn, n.region, n.directing_party, n.participant_name,
+                           n.age, n.nomination, n.nomination_id::int, n.piece_title, n.duration,
+                           chr(65 + floor(random() * 26)::int) || chr(65 + floor(random() * 26)::int)
+                           || LPAD(nextval('{SCHEMA}.diploma_number_seq')::text, 6, '0'),
+                           n.director_name, n.application_id, n.participation_format
+                    FROM new_rows n
+                    LEFT JOIN base b ON b.contest_id = n.contest_id
+                    ORDER BY n.contest_id, n.rn
+                ''', program_rows, page_size=len(program_rows))
+                program_created = cur.rowcount
+
+            status_label = STATUS_LABELS.get(new_status, new_status)
+            push_title = 'Статус заявки изменён'
+            notifications = []
+            outbox = []
+            for app in applications:
+                push_body = f"Заявка на «{app['contest_title']}» {status_label}"
+                notifications.append((push_title, push_body, app['contest_id'], app['participant_id']))
+                if app.get('email'):
+                    outbox.append(('status_email', {
+                        'to_email': app['email'], 'full_name': app['full_name'], 'contest_title': app['contest_title'],
+                        'new_status': new_status, 'admin_comment': admin_comment,
+                    }))
+                if app.get('push_token'):
+                    outbox.append(('push', {
+                        'push_token': app['push_token'], 'title': push_title, 'body': push_body,
+                        'data': {'screen': 'MyApplications', 'applicationId': app['id'], 'contestId': app['contest_id']},
+                    }))
+            if notifications:
+                execute_values(
+                    cur,
+                    f'INSERT INTO {SCHEMA}.notifications (title, body, contest_id, participant_id) VALUES %s',
+                    notifications,
+                    page_size=len(notifications)
+                )
+            enqueue_notifications(cur, outbox)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+
+    kick_notification_dispatcher()
+    updated_ids = {a['id'] for a in applications}
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({
+            'success': True,
+            'updated': len(updated_ids),
+            'program_created': program_created,
+            'not_found': [i for i in app_ids if i not in updated_ids],
+        }),
+        'isBase64Encoded': False
+    }
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Админ API для заявок и галереи
-    GET /applications - получить все заявки с фильтрацией (требует X-Api-Key)
+    GET /applications - получить заявки с фильтрацией (contest_id, status), поиском (search) и постранично (limit, before_submitted_at, before_id) (требует X-Api-Key)
+    GET /applications?action=export&format=csv|xlsx - выгрузка заявок (те же фильтры contest_id, status, search) в бакет, возвращает url (требует X-Api-Key)
     PUT /applications - обновить статус заявки (status, admin_comment) или заморозку (editing_locked) (требует X-Api-Key)
+    PUT /applications?action=bulk_status - массовая смена статуса (body: {application_ids, status, admin_comment}); письма и push уходят через очередь (требует X-Api-Key)
     PUT /applications?action=update_fields - редактирование админом полей заявки и контактных данных участника (требует X-Api-Key)
     GET /gallery - получить элементы галереи (публично)
     POST /gallery - создать элемент галереи (загрузка файла) (требует X-Api-Key)
@@ -670,7 +1291,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     DELETE /gallery/{id} - удалить элемент галереи (требует X-Api-Key)
     GET /?endpoint=vk_check&contest_id=X - получить пост и результаты проверки ВК по конкурсу (требует X-Api-Key)
     POST /?endpoint=vk_check&action=set_post - сохранить ссылку на пост ВК для конкурса (требует X-Api-Key)
-    POST /?endpoint=vk_check&action=run_check - запустить проверку лайков/репостов/комментариев/подписки ВК, опционально с авто-отклонением (body: {contest_id, auto_reject, reject_comment}) (требует X-Api-Key)
+    POST /?endpoint=vk_check&action=run_check - запустить или продолжить проверку лайков/репостов/комментариев/подписки ВК, опционально с авто-отклонением (body: {contest_id, auto_reject, reject_comment, restart}); возвращает status running/done — при running вызвать повторно (требует X-Api-Key)
+    GET /?endpoint=vk_check&action=status&contest_id=X - прогресс проверки ВК по конкурсу (требует X-Api-Key)
     GET /?endpoint=vk_parser&action=cities&q=... - подсказка городов VK по названию (требует X-Api-Key)
     GET /?endpoint=vk_parser&action=regions&q=... - подсказка регионов/субъектов РФ по названию (требует X-Api-Key)
     POST /?endpoint=vk_parser&action=search - поиск сообществ ВК по ключевым словам/городу/региону со сбором email (body: {query, city_id, region_id, count, offset}) (требует X-Api-Key)
@@ -901,15 +1523,33 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         # === APPLICATIONS ENDPOINTS ===
         if endpoint != 'gallery' and method == 'GET':
-            # Получение всех заявок
+            # Получение заявок: файлы агрегируются в том же запросе (json_agg), страницы — по ключу
+            # (submitted_at, id) от новых к старым; без limit возвращаются все заявки, как раньше
             params = event.get('queryStringParameters') or {}
-            contest_filter = params.get('contest_id')
-            status_filter = params.get('status')
-            search_query = params.get('search', '').lower()
+            try:
+                if params.get('contest_id'):
+                    int(params['contest_id'])
+                limit = max(1, min(int(params['limit']), MAX_APPLICATIONS_PAGE)) if params.get('limit') else None
+                before_id = int(params['before_id']) if params.get('before_id') else None
+            except ValueError:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'contest_id, limit и before_id должны быть целыми числами'}),
+                    'isBase64Encoded': False
+                }
+            if params.get('action') == 'export':
+                return export_applications(conn, params)
+            before_submitted_at = params.get('before_submitted_at')
             
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Полный запрос с JOIN для получения всех данных
-                query = '''
+                filters, filter_params = applications_filter(params)
+
+                # Общее количество — отдельным запросом только по applications, без JOIN и файлов
+                cur.execute(f'SELECT COUNT(*) AS total FROM applications a WHERE 1=1{filters}', filter_params)
+                total = cur.fetchone()['total']
+
+                query = f'''
                     SELECT 
                         a.id, 
                         a.participant_id,
@@ -935,42 +1575,48 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         p.city,
                         c.title as contest_title,
                         c.applications_locked,
-                        n.name as nomination_name
+                        n.name as nomination_name,
+                        COALESCE((
+                            SELECT json_agg(json_build_object(
+                                'file_name', f.file_name, 'file_type', f.file_type,
+                                'file_size', f.file_size, 'file_url', f.file_url
+                            ) ORDER BY f.id)
+                            FROM application_files f
+                            WHERE f.application_id = a.id
+                        ), '[]'::json) AS files
                     FROM applications a
                     JOIN participants p ON a.participant_id = p.id
                     JOIN contests c ON a.contest_id = c.id
                     LEFT JOIN nominations n ON n.id = a.nomination_id
-                    WHERE 1=1
+                    WHERE 1=1{filters}
                 '''
-                query_params = []
-                
-                if contest_filter:
-                    query += " AND a.contest_id = %s"
-                    query_params.append(int(contest_filter))
-                
-                if status_filter:
-                    query += " AND a.status = %s"
-                    query_params.append(status_filter)
+                query_params = list(filter_params)
+
+                if before_submitted_at and before_id:
+                    query += " AND (a.submitted_at, a.id) < (%s, %s)"
+                    query_params.extend([before_submitted_at, before_id])
                 
-                query += ' ORDER BY a.submitted_at DESC'
+                query += ' ORDER BY a.submitted_at DESC, a.id DESC'
+                if limit:
+                    query += ' LIMIT %s'
+                    query_params.append(limit + 1)
                 
                 cur.execute(query, query_params)
                 applications = cur.fetchall()
+
+                next_cursor = None
+                if limit and len(applications) > limit:
+                    applications = applications[:limit]
+                    next_cursor = {
+                        'before_submitted_at': applications[-1]['submitted_at'].isoformat(),
+                        'before_id': applications[-1]['id'],
+                    }
                 
                 # Конвертация datetime в строки
                 for app in applications:
                     if app.get('submitted_at'):
                         app['submitted_at'] = app['submitted_at'].isoformat()
                 
-                # Получаем файлы для каждой заявки отдельным курсором
-                for app in applications:
-                    with conn.cursor(cursor_factory=RealDictCursor) as files_cur:
-                        files_cur.execute(
-                            'SELECT file_name, file_type, file_size, file_url FROM application_files WHERE application_id = %s',
-                            (app['id'],)
-                        )
-                        app['files'] = files_cur.fetchall()
-                
                 return {
                     'statusCode': 200,
                     'headers': {
@@ -979,11 +1625,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     },
                     'body': json.dumps({
                         'applications': applications,
-                        'total': len(applications)
+                        'total': total,
+                        'next_cursor': next_cursor
                     }),
                     'isBase64Encoded': False
                 }
         
+        elif endpoint != 'gallery' and method == 'PUT' and query_string_params.get('action') == 'bulk_status':
+            return handle_bulk_status(event, conn)
+
         elif endpoint != 'gallery' and method == 'PUT' and query_string_params.get('action') == 'update_fields':
             # Редактирование админом полей заявки и контактных данных участника
             body = json.loads(event.get('body', '{}'))
@@ -1051,6 +1701,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     cur.execute(f'''
                         UPDATE {SCHEMA}.contest_program
                         SET participant_name = %s, nomination = %s, nomination_id = %s,
+                            award_computed_at = CASE WHEN nomination_id IS DISTINCT FROM %s::int THEN NULL ELSE award_computed_at END,
                             piece_title = %s, participation_format = %s, director_name = %s,
                             region = %s, updated_at = CURRENT_TIMESTAMP
                         WHERE application_id = %s
@@ -1058,6 +1709,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         body.get('full_name', ''),
                         body.get('nomination', ''),
                         nomination_id,
+                        nomination_id,
                         body.get('performance_title', ''),
                         body.get('participation_format', ''),
                         body.get('contact_position', ''),
@@ -1122,6 +1774,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
+            # Смена статуса, строка программы и уведомления пишутся одной транзакцией
+            conn.autocommit = False
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 # Получаем данные заявки
                 cur.execute(
@@ -1153,33 +1807,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 
                 # Если заявка одобрена - обновляем участника для системы оценивания
                 if new_status == 'approved':
-                    # Достаём значения системных полей формы заявки (custom_fields -> system_key)
-                    custom_fields = application.get('custom_fields') or {}
-                    if isinstance(custom_fields, str):
-                        custom_fields = json.loads(custom_fields)
-
-                    system_values = {}
                     cur.execute(f'''
                         SELECT f.system_key, f.field_name
                         FROM {SCHEMA}.application_form_fields f
                         JOIN {SCHEMA}.contests c ON c.form_template_id = f.template_id
                         WHERE c.id = %s AND f.system_key IS NOT NULL
                     ''', (application['contest_id'],))
-                    for row in cur.fetchall():
-                        value = custom_fields.get(row['field_name'], '')
-                        if value:
-                            system_values[row['system_key']] = value
-
-                    participant_name = system_values.get('participant_name') or application['full_name']
-                    nomination = system_values.get('nomination') or application.get('nomination', '')
-                    nomination_id = application.get('nomination_id')
-                    piece_title = system_values.get('piece_title') or application.get('performance_title', '')
-                    participation_format = system_values.get('participation_format') or application.get('participation_format', '')
-                    region = system_values.get('region') or application.get('city', '')
-                    directing_party = system_values.get('directing_party', '')
-                    duration = system_values.get('duration', '')
-                    director_name = system_values.get('director_name') or application.get('contact_position', '')
-                    age_category = system_values.get('age_category', '')
+                    values = program_row_values(application, cur.fetchall())
+                    participant_name = values['participant_name']
+                    nomination = values['nomination']
+                    nomination_id = values['nomination_id']
+                    piece_title = values['piece_title']
+                    participation_format = values['participation_format']
+                    region = values['region']
+                    directing_party = values['directing_party']
+                    duration = values['duration']
+                    director_name = values['director_name']
+                    age_category = values['age']
 
                     # Обновляем участника: добавляем contest_id, category, performance_title, participation_format, nomination, status
                     cur.execute(
@@ -1232,32 +1876,31 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         # Заявка уже в программе (например, была одобрена ранее) — синхронизируем номинацию
                         cur.execute(f'''
                             UPDATE {SCHEMA}.contest_program
-                            SET nomination = %s, nomination_id = %s
+                            SET nomination = %s, nomination_id = %s,
+                                award_computed_at = CASE WHEN nomination_id IS DISTINCT FROM %s::int THEN NULL ELSE award_computed_at END
                             WHERE application_id = %s
-                        ''', (nomination, nomination_id, app_id))
+                        ''', (nomination, nomination_id, nomination_id, app_id))
             
-            try:
-                send_status_update_email(application['email'], application['full_name'], application['contest_title'], new_status, admin_comment)
-            except Exception as email_err:
-                print(f'[EMAIL ERROR] {email_err}')
-
-            try:
                 status_label = STATUS_LABELS.get(new_status, new_status)
                 push_title = 'Статус заявки изменён'
                 push_body = f"Заявка на «{application['contest_title']}» {status_label}"
-                send_push_notification(
-                    application.get('push_token'),
-                    push_title,
-                    push_body,
-                    {'screen': 'MyApplications', 'applicationId': app_id, 'contestId': application['contest_id']}
+                cur.execute(
+                    f'INSERT INTO {SCHEMA}.notifications (title, body, contest_id, participant_id) VALUES (%s, %s, %s, %s)',
+                    (push_title, push_body, application['contest_id'], application.get('participant_id'))
                 )
-                with conn.cursor() as ncur:
-                    ncur.execute(
-                        f'INSERT INTO {SCHEMA}.notifications (title, body, contest_id, participant_id) VALUES (%s, %s, %s, %s)',
-                        (push_title, push_body, application['contest_id'], application.get('participant_id'))
-                    )
-            except Exception as push_err:
-                print(f'[PUSH ERROR] {push_err}')
+                outbox = [('status_email', {
+                    'to_email': application['email'], 'full_name': application['full_name'],
+                    'contest_title': application['contest_title'], 'new_status': new_status, 'admin_comment': admin_comment,
+                })]
+                if application.get('push_token'):
+                    outbox.append(('push', {
+                        'push_token': application['push_token'], 'title': push_title, 'body': push_body,
+                        'data': {'screen': 'MyApplications', 'applicationId': app_id, 'contestId': application['contest_id']},
+                    }))
+                enqueue_notifications(cur, outbox)
+            conn.commit()
+            conn.autocommit = True
+            kick_notification_dispatcher()
             
             return {
                 'statusCode': 200,
@@ -1,20 +1,14 @@
 import json
 import os
 import re
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.header import Header
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from datetime import datetime
 import hashlib
 import requests
 
-CABINET_URL = 'https://индиго-арт.рф/participant-cabinet'
-SUPPORT_EMAIL = 'indigo_fest@mail.ru'
-EXPO_PUSH_URL = 'https://exp.host/--/api/v2/push/send'
+NOTIFICATION_KICK_TIMEOUT = 0.5
 VK_API_URL = 'https://api.vk.com/method'
 VK_VERSION = '5.199'
 
@@ -50,19 +44,25 @@ def vk_call(method: str, params: Dict[str, Any], token: str) -> Dict[str, Any]:
     return resp.json()
 
 
-def check_vk_activity(vk_link: str, owner_id: int, post_id: int, group_id: int, token: str) -> Dict[str, Any]:
-    '''Проверяет лайк, репост и подписку на сообщество для одного участника по ссылке ВК'''
+def check_vk_activity(vk_link: str, owner_id: int, post_id: int, group_id: int, token: str,
+                      vk_user_id: Optional[int] = None) -> Dict[str, Any]:
+    '''
+    Проверяет лайк, репост и подписку на сообщество для одного участника по ссылке ВК.
+    vk_user_id — сохранённый у участника id для этой же ссылки; если передан, resolveScreenName не вызывается.
+    '''
     result = {'vk_resolved': False, 'vk_user_id': None, 'liked': False, 'reposted': False, 'subscribed': False}
-    screen_name = vk_extract_screen_name(vk_link)
-    if not screen_name:
-        return result
-    resolved = vk_call('utils.resolveScreenName', {'screen_name': screen_name}, token)
-    resp = resolved.get('response') or {}
-    if resp.get('type') != 'user':
-        return result
-    uid = resp.get('object_id')
+    uid = vk_user_id
     if not uid:
-        return result
+        screen_name = vk_extract_screen_name(vk_link)
+        if not screen_name:
+            return result
+        resolved = vk_call('utils.resolveScreenName', {'screen_name': screen_name}, token)
+        resp = resolved.get('response') or {}
+        if resp.get('type') != 'user':
+            return result
+        uid = resp.get('object_id')
+        if not uid:
+            return result
     result['vk_resolved'] = True
     result['vk_user_id'] = uid
 
@@ -77,26 +77,25 @@ def check_vk_activity(vk_link: str, owner_id: int, post_id: int, group_id: int,
     return result
 
 
-def send_push_notification(push_token: str, title: str, body: str, data: dict = None) -> None:
-    '''Отправляет push-уведомление через Expo Push Service одному пользователю'''
-    if not push_token:
+def enqueue_notifications(cur, items: List[tuple]) -> None:
+    '''Постановка уведомлений (kind, payload) в notification_outbox в текущей транзакции'''
+    for kind, payload in items:
+        cur.execute(
+            'INSERT INTO notification_outbox (kind, payload) VALUES (%s, %s)',
+            (kind, json.dumps(payload, ensure_ascii=False))
+        )
+
+
+def kick_notification_dispatcher() -> None:
+    '''Будит диспетчер очереди уведомлений; ответа не ждём — иначе он всё равно заберёт очередь по расписанию'''
+    url = os.environ.get('NOTIFICATION_DISPATCHER_URL')
+    if not url:
         return
-    message = {'to': push_token, 'title': title, 'body': body}
-    if data:
-        message['data'] = data
     try:
-        resp = requests.post(
-            EXPO_PUSH_URL,
-            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
-            json=message,
-            timeout=10,
-        )
-        result = resp.json()
-        ticket = result.get('data', {})
-        if isinstance(ticket, dict) and ticket.get('status') == 'error':
-            print(f"[PUSH ERROR] token={push_token} error={ticket.get('message')} details={ticket.get('details')}")
-    except Exception as e:
-        print(f"[PUSH EXCEPTION] token={push_token} error={e}")
+        requests.post(url, headers={'X-Api-Key': os.environ.get('ADMIN_API_KEY', '')}, timeout=NOTIFICATION_KICK_TIMEOUT)
+    except requests.RequestException:
+        pass
+
 
 def get_db_connection():
     '''Создает подключение к базе данных'''
@@ -109,7 +108,7 @@ def run_vk_check_and_maybe_reject(cur, conn, contest_id: int, application_id: in
     '''
     Если для конкурса задан пост ВК — проверяет лайк/репост/подписку участника.
     Если условия не выполнены — переводит заявку в статус rejected, пишет комментарий,
-    отправляет email, сообщение в чат ЛК и push-уведомление.
+    ставит в очередь email и push-уведомление, пишет сообщение в чат ЛК.
     Возвращает итоговый статус заявки ('rejected' или None если проверка не проводилась/прошла).
     '''
     try:
@@ -119,12 +118,21 @@ def run_vk_check_and_maybe_reject(cur, conn, contest_id: int, application_id: in
         if not vk_post or not vk_token:
             return None
 
-        cur.execute('SELECT vk_link, push_token FROM participants WHERE id = %s', (participant_id,))
+        cur.execute('''
+            SELECT vk_link, push_token, CASE WHEN vk_user_id_link = vk_link THEN vk_user_id END AS vk_user_id
+            FROM participants WHERE id = %s
+        ''', (participant_id,))
         participant_row = cur.fetchone() or {}
         vk_link = participant_row.get('vk_link') or ''
         push_token = participant_row.get('push_token')
 
-        check = check_vk_activity(vk_link, vk_post['owner_id'], vk_post['post_id'], abs(vk_post['owner_id']), vk_token)
+        check = check_vk_activity(vk_link, vk_post['owner_id'], vk_post['post_id'], abs(vk_post['owner_id']), vk_token,
+                                  participant_row.get('vk_user_id'))
+        if check['vk_resolved'] and not participant_row.get('vk_user_id'):
+            cur.execute(
+                'UPDATE participants SET vk_user_id = %s, vk_user_id_link = vk_link WHERE id = %s AND vk_link = %s',
+                (check['vk_user_id'], participant_id, vk_link)
+            )
 
         cur.execute(
             '''
@@ -159,7 +167,19 @@ def run_vk_check_and_maybe_reject(cur, conn, contest_id: int, application_id: in
             "UPDATE applications SET status = 'rejected', admin_comment = %s WHERE id = %s",
             (comment, application_id)
         )
+        outbox = [('vk_reject_email', {
+            'to_email': email, 'full_name': full_name, 'contest_title': contest_title, 'reason_text': reason_text,
+        })]
+        if push_token:
+            outbox.append(('push', {
+                'push_token': push_token,
+                'title': 'Заявка отклонена',
+                'body': f'Заявка на «{contest_title}» отклонена по итогам проверки ВК',
+                'data': {'screen': 'MyApplications', 'applicationId': application_id, 'contestId': contest_id},
+            }))
+        enqueue_notifications(cur, outbox)
         conn.commit()
+        kick_notification_dispatcher()
 
         chat_text = f'Заявка на «{contest_title}» автоматически отклонена: {reason_text}. Пожалуйста, выполните условия и подайте заявку повторно.'
         try:
@@ -171,109 +191,11 @@ def run_vk_check_and_maybe_reject(cur, conn, contest_id: int, application_id: in
         except Exception as chat_err:
             print(f'[VK CHECK CHAT ERROR] {chat_err}')
 
-        try:
-            send_vk_reject_email(email, full_name, contest_title, reason_text)
-        except Exception as reject_email_err:
-            print(f'[VK CHECK EMAIL ERROR] {reject_email_err}')
-
-        try:
-            send_push_notification(
-                push_token,
-                'Заявка отклонена',
-                f'Заявка на «{contest_title}» отклонена по итогам проверки ВК',
-                {'screen': 'MyApplications', 'applicationId': application_id, 'contestId': contest_id}
-            )
-        except Exception as push_err:
-            print(f'[VK CHECK PUSH ERROR] {push_err}')
-
         return 'rejected'
     except Exception as vk_check_err:
         print(f'[VK CHECK ERROR] {vk_check_err}')
         return None
 
-def send_application_received_email(to_email: str, full_name: str, contest_title: str) -> None:
-    '''Отправляет участнику письмо о том, что заявка принята к рассмотрению'''
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = os.environ.get('SMTP_PORT')
-    smtp_user = os.environ.get('SMTP_USER')
-    smtp_password = os.environ.get('SMTP_PASSWORD')
-    if not all([smtp_host, smtp_port, smtp_user, smtp_password, to_email]):
-        return
-
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = Header(f'Заявка на конкурс «{contest_title}» принята к рассмотрению — ИНДИГО', 'utf-8')
-    msg['From'] = smtp_user
-    msg['To'] = to_email
-
-    html = f"""
-    <div style="font-family: Arial, sans-serif; max-width: 560px; margin: 0 auto;">
-      <h2 style="color: #6d28d9;">Заявка получена!</h2>
-      <p>Здравствуйте, {full_name}!</p>
-      <p>Ваша заявка на участие в конкурсе «<b>{contest_title}</b>» успешно отправлена и находится на рассмотрении организаторов.</p>
-      <p>Как только заявка будет одобрена, мы пришлём вам уведомление на эту электронную почту.</p>
-      <p>Статус заявки в любой момент можно проверить в <a href="{CABINET_URL}" style="color:#6d28d9;">личном кабинете участника</a>.</p>
-      <p style="color:#6b7280; font-size: 14px; margin-top: 24px;">
-        Если статус заявки не обновится в течение 24 часов, пожалуйста, напишите нам в чат поддержки личного кабинета
-        или на почту <a href="mailto:{SUPPORT_EMAIL}" style="color:#6d28d9;">{SUPPORT_EMAIL}</a>.
-      </p>
-    </div>
-    """
-    msg.attach(MIMEText(html, 'html'))
-
-    if int(smtp_port) == 465:
-        with smtplib.SMTP_SSL(smtp_host, int(smtp_port)) as server:
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, to_email, msg.as_string())
-    else:
-        with smtplib.SMTP(smtp_host, int(smtp_port)) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, to_email, msg.as_string())
-
-
-def send_vk_reject_email(to_email: str, full_name: str, contest_title: str, reason_text: str) -> None:
-    '''Отправляет участнику письмо об автоматическом отклонении заявки по итогам проверки ВК'''
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = os.environ.get('SMTP_PORT')
-    smtp_user = os.environ.get('SMTP_USER')
-    smtp_password = os.environ.get('SMTP_PASSWORD')
-    if not all([smtp_host, smtp_port, smtp_user, smtp_password, to_email]):
-        return
-
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = Header(f'Заявка на конкурс «{contest_title}» отклонена — ИНДИГО', 'utf-8')
-    msg['From'] = smtp_user
-    msg['To'] = to_email
-
-    html = f"""
-    <div style="font-family: Arial, sans-serif; max-width: 560px; margin: 0 auto;">
-      <h2 style="color: #dc2626;">Заявка отклонена</h2>
-      <p>Здравствуйте, {full_name}!</p>
-      <p>Ваша заявка на участие в конкурсе «<b>{contest_title}</b>» была автоматически отклонена: {reason_text}.</p>
-      <p>Пожалуйста, выполните условия участия и подайте заявку заново из <a href="{CABINET_URL}" style="color:#6d28d9;">личного кабинета участника</a>.</p>
-      <p style="color:#6b7280; font-size: 14px; margin-top: 24px;">
-        Если у вас есть вопросы, напишите нам в чат поддержки личного кабинета
-        или на почту <a href="mailto:{SUPPORT_EMAIL}" style="color:#6d28d9;">{SUPPORT_EMAIL}</a>.
-      </p>
-    </div>
-    """
-    msg.attach(MIMEText(html, 'html'))
-
-    if int(smtp_port) == 465:
-        with smtplib.SMTP_SSL(smtp_host, int(smtp_port)) as server:
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, to_email, msg.as_string())
-    else:
-        with smtplib.SMTP(smtp_host, int(smtp_port)) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, to_email, msg.as_string())
-
-
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     API для работы с заявками участников конкурсов
@@ -445,30 +367,33 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                          participation_format, application_id)
                     )
 
+                if resubmit:
+                    cur.execute('SELECT push_token FROM participants WHERE id = %s', (updated['participant_id'],))
+                    push_token = (cur.fetchone() or {}).get('push_token')
+                    outbox = [('application_received_email', {
+                        'to_email': existing['email'], 'full_name': existing['full_name'], 'contest_title': existing['contest_title'],
+                    })]
+                    if push_token:
+                        outbox.append(('push', {
+                            'push_token': push_token,
+                            'title': 'Заявка отправлена повторно',
+                            'body': f"Заявка на «{existing['contest_title']}» снова на рассмотрении",
+                            'data': {'screen': 'MyApplications', 'applicationId': updated['id'], 'contestId': updated['contest_id']},
+                        }))
+                    enqueue_notifications(cur, outbox)
+
                 conn.commit()
 
                 final_status = updated['status']
 
                 if resubmit:
+                    kick_notification_dispatcher()
                     try:
-                        cur.execute('SELECT push_token FROM participants WHERE id = %s', (updated['participant_id'],))
-                        push_row = cur.fetchone() or {}
-                        push_token = push_row.get('push_token')
-
                         cur.execute(
                             "INSERT INTO chat_messages (participant_id, sender, message) VALUES (%s, 'admin', %s)",
                             (updated['participant_id'], f"Заявка на «{existing['contest_title']}» отправлена повторно на рассмотрение.")
                         )
                         conn.commit()
-
-                        send_push_notification(
-                            push_token,
-                            'Заявка отправлена повторно',
-                            f"Заявка на «{existing['contest_title']}» снова на рассмотрении",
-                            {'screen': 'MyApplications', 'applicationId': updated['id'], 'contestId': updated['contest_id']}
-                        )
-
-                        send_application_received_email(existing['email'], existing['full_name'], existing['contest_title'])
                     except Exception as resubmit_notify_err:
                         print(f'[RESUBMIT NOTIFY ERROR] {resubmit_notify_err}')
 
@@ -590,13 +515,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     (participant_id, contest_id, category, performance_title, participation_format, nomination, nomination_id, experience, achievements, additional_info, json.dumps(custom_fields))
                 )
                 application = cur.fetchone()
+                enqueue_notifications(cur, [('application_received_email', {
+                    'to_email': email, 'full_name': full_name, 'contest_title': contest_title,
+                })])
 
                 conn.commit()
-
-                try:
-                    send_application_received_email(email, full_name, contest_title)
-                except Exception as email_err:
-                    print(f'[EMAIL ERROR] {email_err}')
+                kick_notification_dispatcher()
 
                 final_status = application['status']
 
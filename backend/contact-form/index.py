@@ -1,13 +1,27 @@
 import json
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import urllib.request
+import psycopg2
+
+SCHEMA = 't_p73771717_multi_page_site_proj'
+
+
+def kick_notification_dispatcher() -> None:
+    '''Будит диспетчер очереди уведомлений; если адрес не задан, письмо уйдёт при запуске по расписанию'''
+    url = os.environ.get('NOTIFICATION_DISPATCHER_URL')
+    if not url:
+        return
+    try:
+        request = urllib.request.Request(url, data=b'', method='POST',
+                                         headers={'X-Api-Key': os.environ.get('ADMIN_API_KEY', '')})
+        urllib.request.urlopen(request, timeout=0.5)
+    except Exception:
+        pass
 
 
 def handler(event: dict, context) -> dict:
     """
-    Форма обратной связи — отправляет письмо на почту организации.
+    Форма обратной связи — ставит письмо на почту организации в очередь уведомлений.
     POST {"name": "...", "email": "...", "subject": "...", "message": "..."}
     """
     if event.get('httpMethod') == 'OPTIONS':
@@ -35,42 +49,18 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({'error': 'Заполните все обязательные поля'})
         }
 
-    smtp_host = os.environ['SMTP_HOST']
-    smtp_port = int(os.environ['SMTP_PORT'])
-    smtp_user = os.environ['SMTP_USER']
-    smtp_password = os.environ['SMTP_PASSWORD']
-    to_email = os.environ.get('SMTP_USER')
-
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = f'Обратная связь: {subject or "Без темы"}'
-    msg['From'] = smtp_user
-    msg['To'] = to_email
-    msg['Reply-To'] = email
-
-    html = f"""
-    <div style="font-family: Arial, sans-serif; max-width: 600px;">
-      <h2 style="color: #6d28d9;">Новое сообщение с сайта ИНДИГО</h2>
-      <p><b>Имя:</b> {name}</p>
-      <p><b>Email:</b> {email}</p>
-      <p><b>Тема:</b> {subject or '—'}</p>
-      <hr/>
-      <p><b>Сообщение:</b></p>
-      <p style="white-space: pre-wrap;">{message}</p>
-    </div>
-    """
-    msg.attach(MIMEText(html, 'html'))
-
-    if smtp_port == 465:
-        with smtplib.SMTP_SSL(smtp_host, smtp_port) as server:
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, to_email, msg.as_string())
-    else:
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, to_email, msg.as_string())
+    # Письмо организаторам уходит через очередь уведомлений, ответ не ждёт SMTP
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                f'INSERT INTO {SCHEMA}.notification_outbox (kind, payload) VALUES (%s, %s)',
+                ('contact_email', json.dumps({'name': name, 'email': email, 'subject': subject, 'message': message}, ensure_ascii=False))
+            )
+    finally:
+        conn.close()
+    kick_notification_dispatcher()
 
     return {
         'statusCode': 200,
@@ -1,19 +1,42 @@
+import csv
+import hashlib
+import hmac
+import io
 import json
 import os
+import re
 import base64
 import random
 import string
+import tempfile
+import urllib.request
 import uuid
+import zipfile
 import boto3
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Dict, Any
+from psycopg2.extras import RealDictCursor, execute_values
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, List
 from datetime import datetime, date
 from decimal import Decimal
 
 SCHEMA = 't_p73771717_multi_page_site_proj'
 
 MAX_BACKGROUND_SIZE_BYTES = 20 * 1024 * 1024  # 20 МБ
+BACKGROUND_PREVIEW_PX = 1200  # длинная сторона превью подложки для конструктора (WebP)
+BACKGROUND_PRINT_PX = 3508    # длинная сторона версии для печати: A4 при 300 dpi (JPEG)
+MAX_IMPORT_SIZE_BYTES = 10 * 1024 * 1024  # 10 МБ
+MAX_IMPORT_ERRORS = 50
+
+# Колонки строки программы, отдаваемые get_program (fields= выбирает подмножество)
+PROGRAM_COLUMNS = ['id', 'order_number', 'region', 'directing_party', 'participant_name', 'age', 'nomination',
+                   'piece_title', 'duration', 'diploma_number', 'director_name', 'participation_format', 'nomination_id']
+MAX_PROGRAM_PAGE = 500
+
+# Порядок колонок файла импорта программы — совпадает с экспортом в Excel из админки
+IMPORT_COLUMNS = ['order_number', 'region', 'directing_party', 'participant_name', 'director_name',
+                  'age', 'nomination', 'piece_title', 'duration', 'participation_format']
 
 JURY_COUNTS = [1, 2, 3, 4, 5]
 LEVELS = ['grand_prix_min', 'laureate_1_min', 'laureate_2_min', 'laureate_3_min', 'diplom_1_min', 'diplom_2_min', 'diplom_3_min']
@@ -28,6 +51,69 @@ for n in JURY_COUNTS:
     DEFAULT_SCORING[f'jury_count_{n}_diplom_2_min'] = n * 45
     DEFAULT_SCORING[f'jury_count_{n}_diplom_3_min'] = n * 35
 
+# Колонки поля шаблона диплома и значения по умолчанию (порядок важен — по нему строятся VALUES)
+FIELD_DEFAULTS = [
+    ('data_key', 'custom'),
+    ('custom_text', ''),
+    ('prefix_text', ''),
+    ('pos_x', 10),
+    ('pos_y', 10),
+    ('width', 30),
+    ('height', 10),
+    ('font_family', 'Montserrat'),
+    ('font_size', 16),
+    ('font_color', '#000000'),
+    ('font_weight', 'normal'),
+    ('line_height', 1.2),
+    ('text_align', 'center'),
+    ('group_id', None),
+    ('auto_fit', True),
+]
+FIELD_CASTS = {'pos_x': 'numeric', 'pos_y': 'numeric', 'width': 'numeric', 'height': 'numeric',
+               'font_size': 'numeric', 'line_height': 'numeric', 'group_id': 'integer', 'auto_fit': 'boolean'}
+
+# Серверный рендер дипломов: размеры страницы как в src/types/diploma.ts, растр в 2x (как canvas в браузере)
+MM_TO_PX = 3.7795275591
+A4_WIDTH_MM = 210
+A4_HEIGHT_MM = 297
+RENDER_SCALE = 2
+RENDER_WORKERS = 4
+MAX_RENDER_ROWS = 2000
+MAX_FIT_TEXTS = 2000
+RENDER_FALLBACK_FONT = 'Montserrat'
+# Поле шаблона с этим data_key рисуется не текстом, а QR-кодом с подписанным токеном диплома
+DIPLOMA_QR_KEY = 'diploma_qr'
+# Короткие коды званий для подписанного токена диплома — те же, что в jury-scoring и diploma-check
+AWARD_CODES = {
+    'ОБЛАДАТЕЛЯ ГРАН-ПРИ': 'gp',
+    'ЛАУРЕАТА I СТЕПЕНИ': 'l1',
+    'ЛАУРЕАТА II СТЕПЕНИ': 'l2',
+    'ЛАУРЕАТА III СТЕПЕНИ': 'l3',
+    'ДИПЛОМАНТА I СТЕПЕНИ': 'd1',
+    'ДИПЛОМАНТА II СТЕПЕНИ': 'd2',
+    'ДИПЛОМАНТА III СТЕПЕНИ': 'd3',
+    'УЧАСТНИКА': 'p',
+}
+GOOGLE_FONTS_CSS = 'https://fonts.googleapis.com/css2'
+
+# Символы, которые могут прийти из данных программы (ФИО, номинации, регионы): латиница,
+# кириллица, типографские знаки, №, ₽. Подмножество шрифта для шаблона строится из них
+# и статического текста полей; глифы других письменностей в него не попадают.
+SUBSET_UNICODES = (
+    list(range(0x20, 0x7F)) + list(range(0xA0, 0x100)) + list(range(0x400, 0x500))
+    + list(range(0x2010, 0x2028)) + list(range(0x2030, 0x203B)) + [0x2116, 0x20BD]
+)
+
+AWARD_TITLES = [
+    ('grand_prix_min', 'ОБЛАДАТЕЛЯ ГРАН-ПРИ'),
+    ('laureate_1_min', 'ЛАУРЕАТА I СТЕПЕНИ'),
+    ('laureate_2_min', 'ЛАУРЕАТА II СТЕПЕНИ'),
+    ('laureate_3_min', 'ЛАУРЕАТА III СТЕПЕНИ'),
+    ('diplom_1_min', 'ДИПЛОМАНТА I СТЕПЕНИ'),
+    ('diplom_2_min', 'ДИПЛОМАНТА II СТЕПЕНИ'),
+    ('diplom_3_min', 'ДИПЛОМАНТА III СТЕПЕНИ'),
+]
+
 
 def json_serial(obj):
     if isinstance(obj, (datetime, date)):
@@ -46,27 +132,60 @@ def _resp(status: int, data: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def upload_to_s3(file_b64: str, key: str, content_type: str) -> str:
-    file_data = base64.b64decode(file_b64)
-    s3 = boto3.client(
+@contextmanager
+def transaction(conn):
+    '''Выполнение блока в одной транзакции (соединение по умолчанию работает в autocommit)'''
+    conn.autocommit = False
+    try:
+        yield
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+
+
+def _s3_client():
+    return boto3.client(
         's3',
         endpoint_url='https://bucket.poehali.dev',
         aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
         aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
     )
-    s3.put_object(Bucket='files', Key=key, Body=file_data, ContentType=content_type)
+
+
+def put_s3_object(s3, key: str, body, content_type: str) -> str:
+    s3.put_object(Bucket='files', Key=key, Body=body, ContentType=content_type)
     return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
 
 
+def get_s3_object(s3, key: str):
+    '''Содержимое объекта бакета или None, если его нет'''
+    try:
+        return s3.get_object(Bucket='files', Key=key)['Body'].read()
+    except s3.exceptions.NoSuchKey:
+        return None
+
+
+def upload_to_s3(file_b64: str, key: str, content_type: str) -> str:
+    return put_s3_object(_s3_client(), key, base64.b64decode(file_b64), content_type)
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Управление программой конкурса, системой оценивания и конструктором дипломов.
     --- Программа ---
     GET  /?contest_id=X                     — получить программу и правила оценивания конкурса
+         [&nomination_id=N&order_from=A&order_to=B&q=текст&fields=a,b&scoring=0&limit=N&after_order=O&after_id=I]
     POST /                                  — создать строку программы
     PUT  /                                  — обновить строку программы
     DELETE /                                — удалить строку программы
-    POST /?action=scoring                   — сохранить систему оценивания конкурса
+    POST /?action=scoring                   — сохранить систему оценивания конкурса (пересчитывает звания)
+    POST /?action=recompute_awards          — пересчитать сохранённые звания программы { contest_id }
+    POST /?action=allocate_diploma_numbers  — выдать номера дипломов всем строкам конкурса без номера { contest_id }
+    POST /?action=reorder                   — перенумеровать программу { contest_id, row_ids } или { contest_id, move_ids, position }
+    POST /?action=import_program            — импорт программы из CSV/XLSX { contest_id, file_base64, file_name, encoding? }
     --- Номинации и критерии ---
     GET  /?action=nominations&contest_id=X  — список номинаций конкурса с критериями
     POST /?action=nomination_create         — создать номинацию { contest_id, name }
@@ -76,7 +195,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     PUT  /?action=criterion_update&id=X     — обновить критерий { name, max_score }
     DELETE /?action=criterion_delete&id=X   — удалить критерий
     --- Шаблоны номинаций (переиспользуемые наборы) ---
-    GET  /?action=nomination_templates                        — список шаблонов номинаций с номинациями и критериями
+    GET  /?action=nomination_templates[&template_id=N]        — список шаблонов номинаций с номинациями и критериями
     POST /?action=nomination_template_create                  — создать шаблон { name }
     PUT  /?action=nomination_template_update&id=X             — переименовать шаблон { name }
     DELETE /?action=nomination_template_delete&id=X           — удалить шаблон
@@ -93,12 +212,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     POST /?action=template_create           — создать { name, template_type, orientation }
     PUT  /?action=template_update&id=X      — обновить { name, template_type, orientation, background_url }
     DELETE /?action=template_delete&id=X    — удалить шаблон
-    POST /?action=upload_background&id=X    — загрузить фон { file_base64, file_name }
+    POST /?action=upload_background&id=X    — загрузить фон { file_base64, file_name } (+ превью WebP и версия для печати JPEG)
     DELETE /?action=delete_background&id=X  — удалить фон
-    POST /?action=save_fields&template_id=X — сохранить поля шаблона (полная замена)
+    POST /?action=save_fields&template_id=X — сохранить поля шаблона (по разнице с сохранёнными, по id поля)
+    POST /?action=fit_text                  — подбор размера шрифта и переносов по метрикам шрифтов { template_id, rows } | { font_family, ..., texts }
+    POST /?action=render_diplomas           — PDF-дипломы на сервере { contest_id, template_id, nomination_id?, row_ids? } → zip + файлы в бакете
+    GET  /?action=diploma_qr_codes&contest_id=X — QR-коды с подписанными токенами дипломов (PNG data-URL) для печати в браузере
     --- Конструктор дипломов: шрифты ---
     GET  /?action=fonts                     — список загруженных шрифтов
-    POST /?action=upload_font               — загрузить шрифт { name, file_base64, file_name }
+    GET  /?action=font_subsets&template_id=X — подмножества глифов загруженных шрифтов для шаблона (woff2, кэш в бакете)
+    POST /?action=upload_font               — загрузить шрифт { name, file_base64, file_name } (+ WOFF2-версия)
     DELETE /?action=delete_font&id=X        — удалить шрифт
     '''
     method = event.get('httpMethod', 'GET')
@@ -144,15 +267,31 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return get_template(conn, params.get('id'))
             elif action == 'fonts':
                 return list_fonts(conn)
+            elif action == 'font_subsets':
+                return get_font_subsets(conn, params.get('template_id'))
+            elif action == 'diploma_qr_codes':
+                return get_diploma_qr_codes(conn, params.get('contest_id'))
             elif action == 'nominations':
                 return list_nominations(conn, params.get('contest_id'))
             elif action == 'nomination_templates':
-                return list_nomination_templates(conn)
+                return list_nomination_templates(conn, params.get('template_id'))
             else:
                 return get_program(conn, event)
         elif method == 'POST':
             if action == 'scoring':
                 return save_scoring(conn, event)
+            elif action == 'recompute_awards':
+                return recompute_awards_action(conn, event)
+            elif action == 'fit_text':
+                return fit_text(conn, event)
+            elif action == 'render_diplomas':
+                return render_diplomas(conn, event)
+            elif action == 'reorder':
+                return reorder_program(conn, event)
+            elif action == 'import_program':
+                return import_program(conn, event)
+            elif action == 'allocate_diploma_numbers':
+                return allocate_diploma_numbers(conn, event)
             elif action == 'template_create':
                 return create_template(conn, event)
             elif action == 'upload_background':
@@ -216,48 +355,120 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
 
 def generate_diploma_number(conn) -> str:
-    '''Генерация уникального номера диплома: 2 случайные буквы + 6 цифр (сквозная нумерация)'''
+    '''Генерация уникального номера диплома: 2 случайные буквы + 6 цифр (сквозная нумерация из diploma_number_seq)'''
     series = ''.join(random.choices(string.ascii_uppercase, k=2))
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(f'''
-            SELECT COALESCE(MAX(CAST(SUBSTRING(diploma_number FROM 3) AS INTEGER)), 0) + 1 AS next_num
-            FROM {SCHEMA}.contest_program
-            WHERE diploma_number ~ '^[A-Z]{{2}}[0-9]{{6}}$'
-        ''')
+        cur.execute(f"SELECT nextval('{SCHEMA}.diploma_number_seq') AS next_num")
         next_num = cur.fetchone()['next_num']
     return f'{series}{str(next_num).zfill(6)}'
 
 
+def allocate_diploma_numbers(conn, event: Dict[str, Any]) -> Dict[str, Any]:
+    '''Выдача номеров дипломов всем строкам программы конкурса без номера одним UPDATE (в порядке выступлений)'''
+    body = json.loads(event.get('body', '{}'))
+    contest_id = body.get('contest_id')
+    if not contest_id:
+        return _resp(400, {'error': 'contest_id обязателен'})
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'''
+            UPDATE {SCHEMA}.contest_program AS cp
+            SET diploma_number = v.diploma_number, updated_at = NOW()
+            FROM (
+                SELECT id,
+                       chr(65 + floor(random() * 26)::int) || chr(65 + floor(random() * 26)::int)
+                       || LPAD(nextval('{SCHEMA}.diploma_number_seq')::text, 6, '0') AS diploma_number
+                FROM (
+                    SELECT id FROM {SCHEMA}.contest_program
+                    WHERE contest_id = %s AND diploma_number = ''
+                    ORDER BY order_number, id
+                ) ordered
+            ) v
+            WHERE cp.id = v.id
+            RETURNING cp.id, cp.diploma_number
+        ''', (contest_id,))
+        allocated = list(cur.fetchall())
+
+    return _resp(200, {'success': True, 'allocated': len(allocated), 'rows': allocated})
+
+
 def get_program(conn, event: Dict[str, Any]) -> Dict[str, Any]:
-    '''Получение программы и правил оценивания конкурса'''
+    '''Получение программы и правил оценивания конкурса.
+    Необязательные параметры: nomination_id, order_from / order_to, q (поиск по участнику и произведению),
+    fields=a,b,c (набор колонок; id и order_number всегда есть), scoring=0 (без правил оценивания),
+    limit + after_order / after_id (постраничная выдача по ключу (order_number, id)).'''
     params = event.get('queryStringParameters') or {}
     contest_id = params.get('contest_id')
 
     if not contest_id:
         return {'statusCode': 400, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'contest_id обязателен'}), 'isBase64Encoded': False}
 
-    scoring_cols = ', '.join([f'jury_count_{n}_{lvl}' for n in JURY_COUNTS for lvl in LEVELS])
+    columns = PROGRAM_COLUMNS
+    if params.get('fields'):
+        requested = {f.strip() for f in params['fields'].split(',')}
+        columns = ['id', 'order_number'] + [c for c in PROGRAM_COLUMNS if c in requested and c not in ('id', 'order_number')]
+
+    conditions = ['contest_id = %s']
+    args = [contest_id]
+    try:
+        if params.get('nomination_id'):
+            conditions.append('nomination_id = %s')
+            args.append(int(params['nomination_id']))
+        if params.get('order_from'):
+            conditions.append('order_number >= %s')
+            args.append(int(params['order_from']))
+        if params.get('order_to'):
+            conditions.append('order_number <= %s')
+            args.append(int(params['order_to']))
+        if params.get('q'):
+            pattern = '%' + params['q'].strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append('(participant_name ILIKE %s OR piece_title ILIKE %s)')
+            args.extend([pattern, pattern])
+        if params.get('after_order'):
+            conditions.append('(order_number, id) > (%s, %s)')
+            args.extend([int(params['after_order']), int(params.get('after_id') or 0)])
+
+        limit = max(1, min(int(params['limit']), MAX_PROGRAM_PAGE)) if params.get('limit') else None
+    except ValueError:
+        return _resp(400, {'error': 'Числовые параметры должны быть целыми числами'})
+
+    limit_sql = ''
+    if limit:
+        limit_sql = 'LIMIT %s'
+        args.append(limit + 1)
 
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
         cur.execute(f'''
-            SELECT id, order_number, region, directing_party, participant_name, age, nomination, piece_title, duration, diploma_number, director_name, participation_format, nomination_id
+            SELECT {', '.join(columns)}
             FROM {SCHEMA}.contest_program
-            WHERE contest_id = %s
-            ORDER BY order_number
-        ''', (contest_id,))
+            WHERE {' AND '.join(conditions)}
+            ORDER BY order_number, id
+            {limit_sql}
+        ''', args)
         rows = list(cur.fetchall())
 
-        cur.execute(f'''
-            SELECT {scoring_cols}
-            FROM {SCHEMA}.contest_scoring_rules
-            WHERE contest_id = %s
-        ''', (contest_id,))
-        scoring = cur.fetchone()
+        scoring = None
+        if params.get('scoring') != '0':
+            scoring_cols = ', '.join([f'jury_count_{n}_{lvl}' for n in JURY_COUNTS for lvl in LEVELS])
+            cur.execute(f'''
+                SELECT {scoring_cols}
+                FROM {SCHEMA}.contest_scoring_rules
+                WHERE contest_id = %s
+            ''', (contest_id,))
+            scoring = cur.fetchone()
+
+    result = {'rows': rows}
+    if params.get('scoring') != '0':
+        result['scoring'] = dict(scoring) if scoring else DEFAULT_SCORING
+    if limit:
+        has_more = len(rows) > limit
+        rows = result['rows'] = rows[:limit]
+        result['next_cursor'] = {'after_order': rows[-1]['order_number'], 'after_id': rows[-1]['id']} if has_more else None
 
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'rows': rows, 'scoring': dict(scoring) if scoring else DEFAULT_SCORING}),
+        'body': json.dumps(result),
         'isBase64Encoded': False
     }
 
@@ -331,7 +542,12 @@ def update_row(conn, event: Dict[str, Any]) -> Dict[str, Any]:
 
     values.append(row_id)
     with conn.cursor() as cur:
-        cur.execute(f'UPDATE {SCHEMA}.contest_program SET {", ".join(updates)}, updated_at = NOW() WHERE id = %s', values)
+        cur.execute(f'UPDATE {SCHEMA}.contest_program SET {", ".join(updates)}, updated_at = NOW() WHERE id = %s RETURNING contest_id', values)
+        updated = cur.fetchone()
+
+    # От номинации зависит набор критериев, а значит и завершённость оценивания строки
+    if updated and 'nomination_id' in body:
+        recompute_awards(conn, updated[0], [int(row_id)])
 
     return {
         'statusCode': 200,
@@ -359,6 +575,202 @@ def delete_row(conn, event: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def reorder_program(conn, event: Dict[str, Any]) -> Dict[str, Any]:
+    '''Перенумерация программы конкурса одним UPDATE ... FROM (VALUES ...).
+    { contest_id, row_ids: [...] }            — полный новый порядок строк;
+    { contest_id, move_ids: [...], position } — перенести блок строк так, чтобы он начинался с места position.
+    Строки получают номера 1..N подряд, обновляются только те, у кого номер изменился.'''
+    body = json.loads(event.get('body') or '{}')
+    contest_id = body.get('contest_id')
+    row_ids = body.get('row_ids')
+    move_ids = body.get('move_ids')
+    if not contest_id or (row_ids is None and move_ids is None):
+        return _resp(400, {'error': 'contest_id и row_ids или move_ids обязательны'})
+
+    with transaction(conn), conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'''
+            SELECT id, order_number FROM {SCHEMA}.contest_program
+            WHERE contest_id = %s
+            ORDER BY order_number, id
+            FOR UPDATE
+        ''', (contest_id,))
+        current = {r['id']: r['order_number'] for r in cur.fetchall()}
+
+        if row_ids is not None:
+            new_order = [int(i) for i in row_ids]
+            if sorted(new_order) != sorted(current):
+                return _resp(400, {'error': 'row_ids должен содержать все строки программы конкурса ровно по одному разу'})
+        else:
+            block = {int(i) for i in move_ids}
+            if not block or not block <= current.keys():
+                return _resp(400, {'error': 'move_ids содержит строки не из этого конкурса'})
+            rest = [i for i in current if i not in block]
+            position = min(max(int(body.get('position') or 1), 1), len(rest) + 1)
+            new_order = rest[:position - 1] + [i for i in current if i in block] + rest[position - 1:]
+
+        changed = [(row_id, num) for num, row_id in enumerate(new_order, start=1) if current[row_id] != num]
+        if changed:
+            execute_values(cur, f'''
+                UPDATE {SCHEMA}.contest_program AS cp
+                SET order_number = v.order_number, updated_at = NOW()
+                FROM (VALUES %s) AS v (id, order_number)
+                WHERE cp.id = v.id
+            ''', changed, page_size=len(changed))
+
+    return _resp(200, {
+        'success': True,
+        'updated': len(changed),
+        'rows': [{'id': row_id, 'order_number': num} for num, row_id in enumerate(new_order, start=1)],
+    })
+
+
+def _cell_text(value) -> str:
+    '''Значение ячейки импорта в текст: 7.0 из Excel превращается в "7", пустые — в ""'''
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _decode_import_csv(file_data: bytes, encoding: str = '') -> str:
+    '''Текст CSV: в указанной кодировке, иначе UTF-8, а если файл не в UTF-8 — cp1251 (Excel в русской локали).
+    UnicodeDecodeError/LookupError — если файл не читается в заданной кодировке.'''
+    if encoding:
+        return file_data.decode(encoding)
+    try:
+        return file_data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return file_data.decode('cp1251')
+
+
+def _iter_import_rows(file_data: bytes, ext: str, encoding: str = ''):
+    '''Построчное чтение CSV/XLSX без загрузки всего листа в память (первая строка — заголовок)'''
+    if ext == 'xlsx':
+        from openpyxl import load_workbook
+        wb = load_workbook(io.BytesIO(file_data), read_only=True, data_only=True)
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            next(rows, None)
+            for row in rows:
+                yield [_cell_text(v) for v in row]
+        finally:
+            wb.close()
+    else:
+        text = io.StringIO(_decode_import_csv(file_data, encoding), newline='')
+        # Excel в русской локали сохраняет CSV через ";", поэтому разделитель берём по заголовку
+        header = text.readline()
+        delimiter = max(';,\t', key=header.count)
+        reader = csv.reader(text, delimiter=delimiter)
+        for row in reader:
+            yield [_cell_text(v) for v in row]
+
+
+def import_program(conn, event: Dict[str, Any]) -> Dict[str, Any]:
+    '''Импорт программы из CSV/XLSX { contest_id, file_base64, file_name, encoding? }.
+    CSV читается в UTF-8 или, если не декодируется, в cp1251; encoding задаёт кодировку явно.
+    Файл проверяется за один проход и складывается в CSV-буфер, который через COPY
+    загружается во временную таблицу и одним INSERT ... SELECT переносится в программу.
+    При любой ошибке в файле в программу не попадает ни одна строка.'''
+    body = json.loads(event.get('body') or '{}')
+    contest_id = body.get('contest_id')
+    file_b64 = body.get('file_base64', '')
+    file_name = body.get('file_name', 'program.csv')
+    if not contest_id or not file_b64:
+        return _resp(400, {'error': 'contest_id и file_base64 обязательны'})
+
+    ext = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else 'csv'
+    if ext not in ('csv', 'xlsx'):
+        return _resp(400, {'error': 'Поддерживаются только файлы .csv и .xlsx'})
+
+    file_data = base64.b64decode(file_b64)
+    if len(file_data) > MAX_IMPORT_SIZE_BYTES:
+        return _resp(400, {'error': 'Файл слишком большой (максимум 10 МБ)'})
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    errors = []
+    seen_numbers = set()
+    count = 0
+    try:
+        for line_no, cells in enumerate(_iter_import_rows(file_data, ext, (body.get('encoding') or '').strip()), start=2):
+            if not any(cells):
+                continue
+            cells = (cells + [''] * len(IMPORT_COLUMNS))[:len(IMPORT_COLUMNS)]
+            row = dict(zip(IMPORT_COLUMNS, cells))
+
+            if row['order_number']:
+                if not row['order_number'].isdigit() or len(row['order_number']) > 6 or int(row['order_number']) == 0:
+                    errors.append({'line': line_no, 'error': f'Некорректный номер выступления: {row["order_number"]}'})
+                elif row['order_number'] in seen_numbers:
+                    errors.append({'line': line_no, 'error': f'Номер выступления {row["order_number"]} повторяется'})
+                seen_numbers.add(row['order_number'])
+            if not row['participant_name']:
+                errors.append({'line': line_no, 'error': 'Не указано ФИО / коллектив'})
+            if len(errors) >= MAX_IMPORT_ERRORS:
+                break
+
+            count += 1
+            writer.writerow([line_no] + cells)
+    except (UnicodeDecodeError, LookupError):
+        return _resp(400, {'error': 'Не удалось определить кодировку CSV. Сохраните файл в UTF-8 или укажите encoding'})
+    except Exception as e:
+        return _resp(400, {'error': f'Не удалось прочитать файл: {e}'})
+
+    if errors:
+        return _resp(400, {'error': 'Файл содержит ошибки', 'errors': errors})
+    if count == 0:
+        return _resp(400, {'error': 'Не найдено строк для импорта'})
+
+    buf.seek(0)
+    columns = ', '.join(IMPORT_COLUMNS)
+    text_columns = [c for c in IMPORT_COLUMNS if c != 'order_number']
+
+    with transaction(conn), conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'''
+            CREATE TEMP TABLE program_import (
+                line_no INTEGER,
+                order_number TEXT,
+                {', '.join(f'{c} TEXT' for c in text_columns)}
+            ) ON COMMIT DROP
+        ''')
+        cur.copy_expert(f'COPY program_import (line_no, {columns}) FROM STDIN WITH (FORMAT csv)', buf)
+
+        # Строки без номера встают в конец программы в порядке файла; номинация
+        # привязывается к номинации конкурса с тем же названием, если такая есть.
+        cur.execute(f'''
+            WITH base AS (
+                SELECT GREATEST(
+                    (SELECT COALESCE(MAX(order_number), 0) FROM {SCHEMA}.contest_program WHERE contest_id = %(contest_id)s),
+                    (SELECT COALESCE(MAX(NULLIF(order_number, '')::int), 0) FROM program_import)
+                ) AS max_order
+            ),
+            nominations AS (
+                SELECT DISTINCT ON (name) id, name
+                FROM {SCHEMA}.nominations
+                WHERE contest_id = %(contest_id)s
+                ORDER BY name, sort_order, id
+            )
+            INSERT INTO {SCHEMA}.contest_program
+              (contest_id, order_number, {', '.join(text_columns)}, diploma_number, nomination_id)
+            SELECT %(contest_id)s,
+                   COALESCE(NULLIF(s.order_number, '')::int,
+                            base.max_order + ROW_NUMBER() OVER (PARTITION BY s.order_number = '' ORDER BY s.line_no)),
+                   {', '.join(f's.{c}' for c in text_columns)},
+                   chr(65 + floor(random() * 26)::int) || chr(65 + floor(random() * 26)::int)
+                   || LPAD(nextval('{SCHEMA}.diploma_number_seq')::text, 6, '0'),
+                   n.id
+            FROM program_import s
+            CROSS JOIN base
+            LEFT JOIN nominations n ON n.name = s.nomination
+            ORDER BY s.line_no
+            RETURNING id
+        ''', {'contest_id': contest_id})
+        imported = cur.rowcount
+
+    return _resp(200, {'success': True, 'imported': imported})
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # НОМИНАЦИИ И КРИТЕРИИ ОЦЕНИВАНИЯ
 # ══════════════════════════════════════════════════════════════════════════════
@@ -385,8 +797,13 @@ def list_nominations(conn, contest_id) -> Dict[str, Any]:
         ''', (contest_id,))
         criteria = list(cur.fetchall())
 
+    by_nomination = {nom['id']: nom for nom in nominations}
     for nom in nominations:
-        nom['criteria'] = [c for c in criteria if c['nomination_id'] == nom['id']]
+        nom['criteria'] = []
+    for c in criteria:
+        nom = by_nomination.get(c['nomination_id'])
+        if nom is not None:
+            nom['criteria'].append(c)
 
     return _resp(200, {'nominations': nominations})
 
@@ -433,10 +850,12 @@ def delete_nomination(conn, nomination_id) -> Dict[str, Any]:
     if not nomination_id:
         return _resp(400, {'error': 'id обязателен'})
 
+    rows_by_contest = nomination_program_rows(conn, nomination_id)
     with conn.cursor() as cur:
         cur.execute(f'DELETE FROM {SCHEMA}.nomination_criteria WHERE nomination_id = %s', (nomination_id,))
         cur.execute(f'DELETE FROM {SCHEMA}.nominations WHERE id = %s', (nomination_id,))
 
+    recompute_nomination_awards(conn, nomination_id, rows_by_contest)
     return _resp(200, {'success': True})
 
 
@@ -459,6 +878,7 @@ def create_criterion(conn, event: Dict[str, Any]) -> Dict[str, Any]:
         ''', (nomination_id, name, max_score, next_order))
         row = dict(cur.fetchone())
 
+    recompute_nomination_awards(conn, nomination_id)
     return _resp(201, {'success': True, 'criterion': row})
 
 
@@ -491,8 +911,11 @@ def delete_criterion(conn, criterion_id) -> Dict[str, Any]:
         return _resp(400, {'error': 'id обязателен'})
 
     with conn.cursor() as cur:
-        cur.execute(f'DELETE FROM {SCHEMA}.nomination_criteria WHERE id = %s', (criterion_id,))
+        cur.execute(f'DELETE FROM {SCHEMA}.nomination_criteria WHERE id = %s RETURNING nomination_id', (criterion_id,))
+        deleted = cur.fetchone()
 
+    if deleted:
+        recompute_nomination_awards(conn, deleted[0])
     return _resp(200, {'success': True})
 
 
@@ -500,30 +923,51 @@ def delete_criterion(conn, criterion_id) -> Dict[str, Any]:
 # ШАБЛОНЫ НОМИНАЦИЙ (переиспользуемые наборы номинаций+критериев для любых конкурсов)
 # ══════════════════════════════════════════════════════════════════════════════
 
-def list_nomination_templates(conn) -> Dict[str, Any]:
-    '''Список всех шаблонов номинаций с номинациями и критериями внутри'''
+def list_nomination_templates(conn, template_id=None) -> Dict[str, Any]:
+    '''Список шаблонов номинаций с номинациями и критериями внутри.
+    Необязательный template_id ограничивает выборку одним шаблоном.'''
+    tpl_filter = 'WHERE id = %s' if template_id else ''
+    item_filter = 'WHERE template_id = %s' if template_id else ''
+    crit_filter = (
+        f'WHERE template_item_id IN (SELECT id FROM {SCHEMA}.nomination_template_items WHERE template_id = %s)'
+        if template_id else ''
+    )
+    args = (template_id,) if template_id else ()
+
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(f'SELECT id, name FROM {SCHEMA}.nomination_templates ORDER BY id')
+        cur.execute(f'SELECT id, name FROM {SCHEMA}.nomination_templates {tpl_filter} ORDER BY id', args)
         templates = list(cur.fetchall())
 
         cur.execute(f'''
             SELECT id, template_id, name, sort_order
             FROM {SCHEMA}.nomination_template_items
+            {item_filter}
             ORDER BY sort_order, id
-        ''')
+        ''', args)
         items = list(cur.fetchall())
 
         cur.execute(f'''
             SELECT id, template_item_id, name, max_score, sort_order
             FROM {SCHEMA}.nomination_template_criteria
+            {crit_filter}
             ORDER BY sort_order, id
-        ''')
+        ''', args)
         criteria = list(cur.fetchall())
 
-    for item in items:
-        item['criteria'] = [c for c in criteria if c['template_item_id'] == item['id']]
+    # Группировка за один проход: словари id -> запись вместо вложенных фильтров
+    by_template = {tpl['id']: tpl for tpl in templates}
+    by_item = {item['id']: item for item in items}
     for tpl in templates:
-        tpl['items'] = [i for i in items if i['template_id'] == tpl['id']]
+        tpl['items'] = []
+    for item in items:
+        item['criteria'] = []
+        tpl = by_template.get(item['template_id'])
+        if tpl is not None:
+            tpl['items'].append(item)
+    for c in criteria:
+        item = by_item.get(c['template_item_id'])
+        if item is not None:
+            item['criteria'].append(c)
 
     return _resp(200, {'templates': templates})
 
@@ -692,47 +1136,57 @@ def apply_nomination_template(conn, event: Dict[str, Any]) -> Dict[str, Any]:
     if not contest_id or not template_id:
         return _resp(400, {'error': 'contest_id и template_id обязательны'})
 
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(f'SELECT name FROM {SCHEMA}.nominations WHERE contest_id = %s', (contest_id,))
-        existing_names = {r['name'] for r in cur.fetchall()}
-
-        cur.execute(f'SELECT COALESCE(MAX(sort_order), 0) AS max_order FROM {SCHEMA}.nominations WHERE contest_id = %s', (contest_id,))
-        next_order = cur.fetchone()['max_order']
-
+    # Копирование целиком на стороне БД: номинации вставляются INSERT ... SELECT, а критерии
+    # сопоставляются с новыми номинациями по sort_order (он уникален среди вставленных строк).
+    # Блокировка строки конкурса не даёт двум одновременным назначениям задублировать номинации.
+    with transaction(conn), conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'SELECT id FROM {SCHEMA}.contests WHERE id = %s FOR UPDATE', (contest_id,))
         cur.execute(f'''
-            SELECT id, name, sort_order
-            FROM {SCHEMA}.nomination_template_items
-            WHERE template_id = %s
-            ORDER BY sort_order, id
-        ''', (template_id,))
-        template_items = list(cur.fetchall())
-
-        created_count = 0
-        for item in template_items:
-            if item['name'] in existing_names:
-                continue
-            next_order += 1
-            cur.execute(f'''
+            WITH base AS (
+                SELECT COALESCE(MAX(sort_order), 0) AS max_order
+                FROM {SCHEMA}.nominations
+                WHERE contest_id = %(contest_id)s
+            ),
+            items AS (
+                SELECT id, name, sort_order
+                FROM {SCHEMA}.nomination_template_items
+                WHERE template_id = %(template_id)s
+            ),
+            new_items AS (
+                SELECT i.id AS item_id, i.name,
+                       base.max_order + ROW_NUMBER() OVER (ORDER BY i.sort_order, i.id) AS new_order
+                FROM items i CROSS JOIN base
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {SCHEMA}.nominations n
+                    WHERE n.contest_id = %(contest_id)s AND n.name = i.name
+                )
+            ),
+            inserted AS (
                 INSERT INTO {SCHEMA}.nominations (contest_id, name, sort_order)
-                VALUES (%s, %s, %s)
+                SELECT %(contest_id)s, name, new_order FROM new_items ORDER BY new_order
+                RETURNING id, sort_order
+            ),
+            inserted_criteria AS (
+                INSERT INTO {SCHEMA}.nomination_criteria (nomination_id, name, max_score, sort_order)
+                SELECT ins.id, tc.name, tc.max_score, tc.sort_order
+                FROM inserted ins
+                JOIN new_items ni ON ni.new_order = ins.sort_order
+                JOIN {SCHEMA}.nomination_template_criteria tc ON tc.template_item_id = ni.item_id
+                ORDER BY ins.sort_order, tc.sort_order, tc.id
                 RETURNING id
-            ''', (contest_id, item['name'], next_order))
-            new_nomination_id = cur.fetchone()['id']
-            created_count += 1
-
-            cur.execute(f'''
-                SELECT name, max_score, sort_order
-                FROM {SCHEMA}.nomination_template_criteria
-                WHERE template_item_id = %s
-                ORDER BY sort_order, id
-            ''', (item['id'],))
-            for crit in cur.fetchall():
-                cur.execute(f'''
-                    INSERT INTO {SCHEMA}.nomination_criteria (nomination_id, name, max_score, sort_order)
-                    VALUES (%s, %s, %s, %s)
-                ''', (new_nomination_id, crit['name'], crit['max_score'], crit['sort_order']))
+            )
+            SELECT (SELECT COUNT(*) FROM items) AS total,
+                   (SELECT COUNT(*) FROM inserted) AS created,
+                   (SELECT COUNT(*) FROM inserted_criteria) AS criteria_created
+        ''', {'contest_id': contest_id, 'template_id': template_id})
+        counts = cur.fetchone()
 
-    return _resp(200, {'success': True, 'created': created_count, 'skipped': len(template_items) - created_count})
+    return _resp(200, {
+        'success': True,
+        'created': counts['created'],
+        'skipped': counts['total'] - counts['created'],
+        'criteria_created': counts['criteria_created'],
+    })
 
 
 def save_scoring(conn, event: Dict[str, Any]) -> Dict[str, Any]:
@@ -755,9 +1209,144 @@ def save_scoring(conn, event: Dict[str, Any]) -> Dict[str, Any]:
             placeholders = ', '.join(['%s'] * (len(cols) + 1))
             cur.execute(f'INSERT INTO {SCHEMA}.contest_scoring_rules (contest_id, {", ".join(cols)}) VALUES ({placeholders})', [contest_id] + values)
 
+    recompute_awards(conn, contest_id)
     return _resp(200, {'success': True})
 
 
+# ══════════════════════════════════════════════════════════════════════════════
+# СОХРАНЁННЫЕ ЗВАНИЯ (contest_program.award / total_score / all_scored)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def get_award(total: float, jury_count: int, scoring: Dict[str, Any]) -> str:
+    '''Звание по сумме баллов и количеству судей (пороги — в колонках jury_count_N_*)'''
+    if jury_count < 1 or jury_count > 5:
+        return ''
+    for lvl, title in AWARD_TITLES:
+        if total >= scoring[f'jury_count_{jury_count}_{lvl}']:
+            return title
+    return 'УЧАСТНИКА'
+
+
+def recompute_awards(conn, contest_id, row_ids=None) -> int:
+    '''
+    Пересчёт сохранённых звания, суммы баллов и признака завершённости оценивания
+    для строк программы конкурса (всех или только row_ids). Возвращает число строк.
+    '''
+    row_filter = ' AND cp.id = ANY(%s)' if row_ids is not None else ''
+    row_params = (contest_id, row_ids) if row_ids is not None else (contest_id,)
+    scoring_cols = ', '.join([f'jury_count_{n}_{lvl}' for n in JURY_COUNTS for lvl in LEVELS])
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'''
+            SELECT cp.id, COALESCE(cc.cnt, 0) AS criteria_count
+            FROM {SCHEMA}.contest_program cp
+            LEFT JOIN (
+                SELECT nomination_id, COUNT(*) AS cnt FROM {SCHEMA}.nomination_criteria GROUP BY nomination_id
+            ) cc ON cc.nomination_id = cp.nomination_id
+            WHERE cp.contest_id = %s{row_filter}
+        ''', row_params)
+        rows = list(cur.fetchall())
+        if not rows:
+            return 0
+
+        cur.execute(f'''
+            SELECT pja.program_row_id, pja.jury_member_id
+            FROM {SCHEMA}.program_jury_assignments pja
+            JOIN {SCHEMA}.contest_program cp ON cp.id = pja.program_row_id
+            WHERE pja.contest_id = %s{row_filter}
+        ''', row_params)
+        assignments = {}
+        for a in cur.fetchall():
+            assignments.setdefault(a['program_row_id'], []).append(a['jury_member_id'])
+
+        cur.execute(f'''
+            SELECT pcs.program_row_id, pcs.jury_member_id, SUM(pcs.score) AS total_score, COUNT(*) AS scored_count
+            FROM {SCHEMA}.program_criteria_scores pcs
+            JOIN {SCHEMA}.contest_program cp ON cp.id = pcs.program_row_id
+            WHERE pcs.contest_id = %s{row_filter}
+            GROUP BY pcs.program_row_id, pcs.jury_member_id
+        ''', row_params)
+        criteria_scores = {(s['program_row_id'], s['jury_member_id']): s for s in cur.fetchall()}
+
+        cur.execute(f'''
+            SELECT ps.program_row_id, ps.jury_member_id, ps.score
+            FROM {SCHEMA}.program_scores ps
+            JOIN {SCHEMA}.contest_program cp ON cp.id = ps.program_row_id
+            WHERE ps.contest_id = %s{row_filter}
+        ''', row_params)
+        plain_scores = {(s['program_row_id'], s['jury_member_id']): float(s['score']) for s in cur.fetchall()}
+
+        cur.execute(f'SELECT {scoring_cols} FROM {SCHEMA}.contest_scoring_rules WHERE contest_id = %s', (contest_id,))
+        scoring = cur.fetchone() or DEFAULT_SCORING
+
+        values = []
+        for r in rows:
+            jury_ids = assignments.get(r['id'], [])
+            total = 0.0
+            all_scored = len(jury_ids) > 0
+            for jury_id in jury_ids:
+                if r['criteria_count'] > 0:
+                    crit = criteria_scores.get((r['id'], jury_id))
+                    score = float(crit['total_score']) if crit and crit['scored_count'] >= r['criteria_count'] else None
+                else:
+                    score = plain_scores.get((r['id'], jury_id))
+                if score is None:
+                    all_scored = False
+                    break
+                total += score
+            award = get_award(total, len(jury_ids), scoring) if all_scored else ''
+            values.append((r['id'], award, round(total, 2) if all_scored else None, all_scored))
+
+        execute_values(cur, f'''
+            UPDATE {SCHEMA}.contest_program AS cp
+            SET award = v.award, total_score = v.total_score, all_scored = v.all_scored, award_computed_at = NOW()
+            FROM (VALUES %s) AS v (id, award, total_score, all_scored)
+            WHERE cp.id = v.id
+        ''', values, template='(%s, %s, %s::numeric, %s)')
+    return len(values)
+
+
+def nomination_program_rows(conn, nomination_id) -> Dict[int, List[int]]:
+    '''id строк программы с данной номинацией, сгруппированные по конкурсу'''
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT contest_id, id FROM {SCHEMA}.contest_program WHERE nomination_id = %s', (nomination_id,))
+        by_contest = {}
+        for contest_id, row_id in cur.fetchall():
+            by_contest.setdefault(contest_id, []).append(row_id)
+    return by_contest
+
+
+def recompute_stale_awards(conn, contest_id) -> int:
+    '''Пересчёт строк конкурса, звания которых ещё не сохранялись (award_computed_at IS NULL):
+    строки до появления сохранённых званий, из импорта и одобрения заявок, со сменённой номинацией'''
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT id FROM {SCHEMA}.contest_program WHERE contest_id = %s AND award_computed_at IS NULL',
+                    (contest_id,))
+        row_ids = [r[0] for r in cur.fetchall()]
+    return recompute_awards(conn, contest_id, row_ids) if row_ids else 0
+
+
+def recompute_nomination_awards(conn, nomination_id, rows_by_contest=None) -> None:
+    '''
+    Пересчёт званий строк программы с данной номинацией (после изменения набора критериев).
+    rows_by_contest — строки, собранные заранее (если номинация удаляется вместе со ссылками на неё).
+    '''
+    if rows_by_contest is None:
+        rows_by_contest = nomination_program_rows(conn, nomination_id)
+    for contest_id, row_ids in rows_by_contest.items():
+        recompute_awards(conn, contest_id, row_ids)
+
+
+def recompute_awards_action(conn, event: Dict[str, Any]) -> Dict[str, Any]:
+    '''Явный пересчёт сохранённых званий всей программы конкурса { contest_id }'''
+    body = json.loads(event.get('body', '{}'))
+    contest_id = body.get('contest_id')
+    if not contest_id:
+        return _resp(400, {'error': 'contest_id обязателен'})
+    updated = recompute_awards(conn, contest_id)
+    return _resp(200, {'success': True, 'updated': updated})
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # КОНСТРУКТОР ДИПЛОМОВ: ШАБЛОНЫ
 # ══════════════════════════════════════════════════════════════════════════════
@@ -821,6 +1410,9 @@ def update_template(conn, tid, event) -> Dict[str, Any]:
             vals.append(json.dumps(body[f]) if f == 'guides' else body[f])
     if not sets:
         return _resp(400, {'error': 'nothing to update'})
+    if 'background_url' in body:
+        # Подложка задана напрямую ссылкой — уменьшенных вариантов для неё нет
+        sets.append("background_preview_url = '', background_print_url = ''")
     sets.append('updated_at = NOW()')
     vals.append(tid)
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -837,10 +1429,40 @@ def delete_template(conn, tid) -> Dict[str, Any]:
         return _resp(400, {'error': 'id required'})
     with conn.cursor() as cur:
         cur.execute(f'DELETE FROM {SCHEMA}.diploma_template_fields WHERE template_id = %s', (tid,))
+        cur.execute(f'DELETE FROM {SCHEMA}.diploma_font_subsets WHERE template_id = %s', (tid,))
         cur.execute(f'DELETE FROM {SCHEMA}.diploma_templates WHERE id = %s', (tid,))
     return _resp(200, {'ok': True})
 
 
+def make_background_variants(file_data: bytes) -> Dict[str, tuple]:
+    '''Превью (WebP) и версия для печати (JPEG) подложки: {вариант: (байты, content-type, расширение)}.
+    Если Pillow не может прочитать файл — вариантов нет, везде используется оригинал.'''
+    from PIL import Image, ImageOps
+    try:
+        img = ImageOps.exif_transpose(Image.open(io.BytesIO(file_data)))
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            flat = Image.new('RGB', img.size, 'white')
+            flat.paste(img, (0, 0), img)
+            img = flat
+        else:
+            img = img.convert('RGB')
+    except Exception:
+        return {}
+
+    variants = {}
+    for variant, max_px, fmt, content_type, ext, opts in (
+        ('preview', BACKGROUND_PREVIEW_PX, 'WEBP', 'image/webp', 'webp', {'quality': 80, 'method': 4}),
+        ('print', BACKGROUND_PRINT_PX, 'JPEG', 'image/jpeg', 'jpg', {'quality': 90, 'progressive': True, 'optimize': True}),
+    ):
+        resized = img.copy()
+        resized.thumbnail((max_px, max_px), Image.LANCZOS)
+        buf = io.BytesIO()
+        resized.save(buf, fmt, **opts)
+        variants[variant] = (buf.getvalue(), content_type, ext)
+    return variants
+
+
 def upload_background(conn, tid, event) -> Dict[str, Any]:
     body = json.loads(event.get('body') or '{}')
     file_b64 = body.get('file_base64', '')
@@ -853,60 +1475,122 @@ def upload_background(conn, tid, event) -> Dict[str, Any]:
     ext = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else 'jpg'
     content_type = f'image/{ext}' if ext != 'jpg' else 'image/jpeg'
     version = uuid.uuid4().hex[:8]
-    url = upload_to_s3(file_b64, f'diploma-templates/{tid}/background_{version}.{ext}', content_type)
+    file_data = base64.b64decode(file_b64)
+    s3 = _s3_client()
+    urls = {'background_url': put_s3_object(s3, f'diploma-templates/{tid}/background_{version}.{ext}', file_data, content_type)}
+    for variant, (data, variant_type, variant_ext) in make_background_variants(file_data).items():
+        key = f'diploma-templates/{tid}/background_{version}_{variant}.{variant_ext}'
+        urls[f'background_{variant}_url'] = put_s3_object(s3, key, data, variant_type)
+    urls.setdefault('background_preview_url', '')
+    urls.setdefault('background_print_url', '')
     with conn.cursor() as cur:
-        cur.execute(f'UPDATE {SCHEMA}.diploma_templates SET background_url = %s, updated_at = NOW() WHERE id = %s', (url, tid))
-    return _resp(200, {'background_url': url})
+        cur.execute(f'''
+            UPDATE {SCHEMA}.diploma_templates
+            SET background_url = %s, background_preview_url = %s, background_print_url = %s, updated_at = NOW()
+            WHERE id = %s
+        ''', (urls['background_url'], urls['background_preview_url'], urls['background_print_url'], tid))
+    return _resp(200, urls)
 
 
 def delete_background(conn, tid) -> Dict[str, Any]:
     if not tid:
         return _resp(400, {'error': 'id required'})
     with conn.cursor() as cur:
-        cur.execute(f"UPDATE {SCHEMA}.diploma_templates SET background_url = '', updated_at = NOW() WHERE id = %s", (tid,))
+        cur.execute(f'''
+            UPDATE {SCHEMA}.diploma_templates
+            SET background_url = '', background_preview_url = '', background_print_url = '', updated_at = NOW()
+            WHERE id = %s
+        ''', (tid,))
     return _resp(200, {'ok': True})
 
 
+def _field_values(f: Dict[str, Any], sort_order: int) -> tuple:
+    '''Значения колонок поля шаблона в порядке FIELD_DEFAULTS (+ sort_order), числа приведены к float'''
+    values = []
+    for col, default in FIELD_DEFAULTS:
+        value = f.get(col, default)
+        if FIELD_CASTS.get(col) == 'numeric' and value is not None:
+            value = float(value)
+        values.append(value)
+    values.append(sort_order)
+    return tuple(values)
+
+
 def save_fields(conn, tid, event) -> Dict[str, Any]:
+    '''
+    Сохранение полей шаблона диплома по разнице с сохранёнными: поля сопоставляются по id,
+    новые вставляются, изменённые обновляются, отсутствующие удаляются — каждый вид
+    изменений одним многострочным запросом в одной транзакции. Возвращает поля и новую версию.
+    '''
     body = json.loads(event.get('body') or '{}')
     fields = body.get('fields', [])
     if not tid:
         return _resp(400, {'error': 'template_id required'})
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(f'SELECT id FROM {SCHEMA}.diploma_templates WHERE id = %s', (tid,))
-        if not cur.fetchone():
+
+    columns = [col for col, _ in FIELD_DEFAULTS] + ['sort_order']
+    casts = [f"%s::{FIELD_CASTS[col]}" if col in FIELD_CASTS else '%s' for col in columns]
+
+    with transaction(conn), conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'SELECT id, fields_version FROM {SCHEMA}.diploma_templates WHERE id = %s FOR UPDATE', (tid,))
+        template = cur.fetchone()
+        if not template:
             return _resp(404, {'error': 'template not found'})
-        cur.execute(f'DELETE FROM {SCHEMA}.diploma_template_fields WHERE template_id = %s', (tid,))
-        saved = []
+        version = template['fields_version']
+
+        cur.execute(f'SELECT * FROM {SCHEMA}.diploma_template_fields WHERE template_id = %s', (tid,))
+        existing = {r['id']: _field_values(r, r['sort_order']) for r in cur.fetchall()}
+
+        to_insert, to_update, kept_ids = [], [], set()
         for i, f in enumerate(fields):
+            values = _field_values(f, i)
+            field_id = f.get('id')
+            if field_id in existing and field_id not in kept_ids:
+                kept_ids.add(field_id)
+                if existing[field_id] != values:
+                    to_update.append((field_id,) + values)
+            else:
+                to_insert.append((int(tid),) + values)
+        to_delete = [fid for fid in existing if fid not in kept_ids]
+
+        if to_delete:
+            cur.execute(f'DELETE FROM {SCHEMA}.diploma_template_fields WHERE template_id = %s AND id = ANY(%s)', (tid, to_delete))
+        if to_update:
+            # id в to_update взяты из полей этого же шаблона, поэтому фильтр по template_id не нужен
+            execute_values(cur, f'''
+                UPDATE {SCHEMA}.diploma_template_fields AS f
+                SET {', '.join(f'{col} = v.{col}' for col in columns)}
+                FROM (VALUES %s) AS v (id, {', '.join(columns)})
+                WHERE f.id = v.id
+            ''', to_update, template=f"(%s, {', '.join(casts)})")
+        if to_insert:
+            execute_values(cur, f'''
+                INSERT INTO {SCHEMA}.diploma_template_fields (template_id, {', '.join(columns)})
+                VALUES %s
+            ''', to_insert, template=f"(%s, {', '.join(casts)})")
+
+        # Автосохранение без изменений версию не сдвигает
+        if to_delete or to_update or to_insert:
             cur.execute(f'''
-                INSERT INTO {SCHEMA}.diploma_template_fields
-                  (template_id, data_key, custom_text, prefix_text, pos_x, pos_y, width, height,
-                   font_family, font_size, font_color, font_weight, line_height, text_align, sort_order,
-                   group_id, auto_fit)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                RETURNING *
-            ''', (
-                tid,
-                f.get('data_key', 'custom'),
-                f.get('custom_text', ''),
-                f.get('prefix_text', ''),
-                f.get('pos_x', 10),
-                f.get('pos_y', 10),
-                f.get('width', 30),
-                f.get('height', 10),
-                f.get('font_family', 'Montserrat'),
-                f.get('font_size', 16),
-                f.get('font_color', '#000000'),
-                f.get('font_weight', 'normal'),
-                f.get('line_height', 1.2),
-                f.get('text_align', 'center'),
-                i,
-                f.get('group_id'),
-                f.get('auto_fit', True),
-            ))
-            saved.append(dict(cur.fetchone()))
-    return _resp(200, {'fields': saved})
+                UPDATE {SCHEMA}.diploma_templates
+                SET fields_version = fields_version + 1, updated_at = NOW()
+                WHERE id = %s
+                RETURNING fields_version
+            ''', (tid,))
+            version = cur.fetchone()['fields_version']
+
+        cur.execute(f'''
+            SELECT * FROM {SCHEMA}.diploma_template_fields
+            WHERE template_id = %s ORDER BY sort_order, id
+        ''', (tid,))
+        saved = [dict(r) for r in cur.fetchall()]
+
+    return _resp(200, {
+        'fields': saved,
+        'version': version,
+        'inserted': len(to_insert),
+        'updated': len(to_update),
+        'deleted': len(to_delete),
+    })
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -972,6 +1656,21 @@ def repair_font_bytes(file_data: bytes, ext: str) -> bytes:
             return file_data
 
 
+def font_to_woff2(file_data: bytes, ext: str):
+    '''WOFF2-версия TTF/OTF (сжатие brotli, обычно в 2-3 раза меньше исходника); None, если не получилось'''
+    if ext not in ('ttf', 'otf'):
+        return None
+    try:
+        from fontTools.ttLib import TTFont
+        font = TTFont(io.BytesIO(file_data), fontNumber=0)
+        font.flavor = 'woff2'
+        buf = io.BytesIO()
+        font.save(buf)
+        return buf.getvalue()
+    except Exception:
+        return None
+
+
 def upload_font(conn, event) -> Dict[str, Any]:
     body = json.loads(event.get('body') or '{}')
     name = (body.get('name') or '').strip()
@@ -985,21 +1684,775 @@ def upload_font(conn, event) -> Dict[str, Any]:
 
     file_data = base64.b64decode(file_b64)
     file_data = repair_font_bytes(file_data, ext)
-    file_b64_fixed = base64.b64encode(file_data).decode()
 
     # Уникальный суффикс в ключе файла — чтобы при повторной загрузке шрифта с тем же именем
     # получался новый URL и браузер/CDN не отдавали закэшированную старую версию файла.
     version = uuid.uuid4().hex[:8]
-    url = upload_to_s3(file_b64_fixed, f'diploma-fonts/{safe_name}_{version}.{ext}', content_type)
+    s3 = _s3_client()
+    url = put_s3_object(s3, f'diploma-fonts/{safe_name}_{version}.{ext}', file_data, content_type)
+    woff2_data = font_to_woff2(file_data, ext)
+    woff2_url = put_s3_object(s3, f'diploma-fonts/{safe_name}_{version}.woff2', woff2_data, 'font/woff2') if woff2_data else ''
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(f'INSERT INTO {SCHEMA}.diploma_fonts (name, font_url) VALUES (%s, %s) RETURNING *', (name, url))
+        cur.execute(f'''
+            INSERT INTO {SCHEMA}.diploma_fonts (name, font_url, woff2_url) VALUES (%s, %s, %s) RETURNING *
+        ''', (name, url, woff2_url))
         font = dict(cur.fetchone())
     return _resp(200, {'font': font})
 
 
+def subset_font_bytes(file_data: bytes, unicodes, flavor: str = 'woff2') -> bytes:
+    '''Подмножество шрифта только с нужными символами (без хинтинга, со всеми OpenType-фичами)'''
+    from fontTools.ttLib import TTFont
+    from fontTools import subset
+
+    font = TTFont(io.BytesIO(file_data), fontNumber=0)
+    options = subset.Options()
+    options.hinting = False
+    options.notdef_outline = True
+    options.name_IDs = ['*']
+    options.layout_features = ['*']
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=unicodes)
+    subsetter.subset(font)
+    font.flavor = flavor
+    buf = io.BytesIO()
+    font.save(buf)
+    return buf.getvalue()
+
+
+def _template_font_unicodes(fields, font_name: str) -> list:
+    '''Символы, которые шрифт может встретить в шаблоне: если все его поля — статический текст,
+    то только символы этого текста, иначе ещё и весь SUBSET_UNICODES для данных из программы'''
+    own = [f for f in fields if f['font_family'] == font_name]
+    chars = {ord(c) for f in own for c in (f.get('custom_text') or '') + (f.get('prefix_text') or '') + ' —'}
+    if any(f['data_key'] != 'custom' for f in own):
+        chars.update(SUBSET_UNICODES)
+    return sorted(chars)
+
+
+def ensure_font_subsets(conn, template_id, fields=None) -> list:
+    '''Подмножества загруженных шрифтов, используемых шаблоном, — из кэша diploma_font_subsets
+    или построенные заново, если кэша нет или поля шаблона с тех пор менялись (fields_version)'''
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'SELECT fields_version FROM {SCHEMA}.diploma_templates WHERE id = %s', (template_id,))
+        template = cur.fetchone()
+        if not template:
+            return []
+        fields_version = template['fields_version']
+        if fields is None:
+            cur.execute(f'''
+                SELECT data_key, custom_text, prefix_text, font_family
+                FROM {SCHEMA}.diploma_template_fields WHERE template_id = %s
+            ''', (template_id,))
+            fields = [dict(f) for f in cur.fetchall()]
+
+        # При одинаковых именах берём последний загруженный шрифт
+        cur.execute(f'''
+            SELECT DISTINCT ON (f.name) f.id AS font_id, f.name, f.font_url, s.subset_url, s.fields_version
+            FROM {SCHEMA}.diploma_fonts f
+            LEFT JOIN {SCHEMA}.diploma_font_subsets s ON s.font_id = f.id AND s.template_id = %s
+            WHERE f.name = ANY(%s)
+            ORDER BY f.name, f.id DESC
+        ''', (template_id, list({f['font_family'] for f in fields})))
+        fonts = list(cur.fetchall())
+
+    result, s3 = [], None
+    for font in fonts:
+        if font['subset_url'] and font['fields_version'] == fields_version:
+            result.append({'font_id': font['font_id'], 'name': font['name'], 'subset_url': font['subset_url']})
+            continue
+        try:
+            data = subset_font_bytes(_http_get(font['font_url']), _template_font_unicodes(fields, font['name']))
+        except Exception:
+            continue
+        s3 = s3 or _s3_client()
+        key = f"diploma-fonts/subsets/{font['font_id']}_{template_id}_v{fields_version}.woff2"
+        url = put_s3_object(s3, key, data, 'font/woff2')
+        with conn.cursor() as cur:
+            cur.execute(f'''
+                INSERT INTO {SCHEMA}.diploma_font_subsets (font_id, template_id, fields_version, subset_url, size_bytes)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (font_id, template_id) DO UPDATE
+                SET fields_version = EXCLUDED.fields_version, subset_url = EXCLUDED.subset_url,
+                    size_bytes = EXCLUDED.size_bytes, created_at = NOW()
+            ''', (font['font_id'], template_id, fields_version, url, len(data)))
+        result.append({'font_id': font['font_id'], 'name': font['name'], 'subset_url': url})
+    return result
+
+
+def get_font_subsets(conn, template_id) -> Dict[str, Any]:
+    if not template_id:
+        return _resp(400, {'error': 'template_id required'})
+    return _resp(200, {'fonts': ensure_font_subsets(conn, template_id)})
+
+
 def delete_font(conn, fid) -> Dict[str, Any]:
     if not fid:
         return _resp(400, {'error': 'id required'})
     with conn.cursor() as cur:
+        cur.execute(f'DELETE FROM {SCHEMA}.diploma_font_subsets WHERE font_id = %s', (fid,))
+        cur.execute(f"DELETE FROM {SCHEMA}.diploma_font_metrics WHERE font_key = %s", (f'font:{fid}',))
         cur.execute(f'DELETE FROM {SCHEMA}.diploma_fonts WHERE id = %s', (fid,))
-    return _resp(200, {'ok': True})
\ No newline at end of file
+    return _resp(200, {'ok': True})
+
+# ══════════════════════════════════════════════════════════════════════════════
+# КОНСТРУКТОР ДИПЛОМОВ: МЕТРИКИ ШРИФТОВ И ПОДБОР РАЗМЕРА ТЕКСТА
+# ══════════════════════════════════════════════════════════════════════════════
+# Ширины глифов и кернинг каждого шрифта извлекаются через fontTools один раз и хранятся
+# в diploma_font_metrics компактными массивами. По ним ширина строки считается сложением
+# чисел, без растеризации, — этим пользуются и API подбора текста, и серверный рендер.
+
+def _kerning_pairs(font, glyphs: set) -> Dict[tuple, int]:
+    '''Горизонтальный кернинг между глифами из glyphs: таблица kern и пары GPOS-фичи kern'''
+    pairs: Dict[tuple, int] = {}
+    if 'kern' in font:
+        for table in font['kern'].kernTables:
+            for (left, right), value in getattr(table, 'kernTable', {}).items():
+                if value and left in glyphs and right in glyphs:
+                    pairs.setdefault((left, right), value)
+    if 'GPOS' in font and font['GPOS'].table.FeatureList:
+        gpos = font['GPOS'].table
+        lookup_ids = sorted({i for fr in gpos.FeatureList.FeatureRecord if fr.FeatureTag == 'kern'
+                             for i in fr.Feature.LookupListIndex})
+        for li in lookup_ids:
+            lookup = gpos.LookupList.Lookup[li]
+            for st in lookup.SubTable:
+                if lookup.LookupType == 9:
+                    if st.ExtensionLookupType != 2:
+                        continue
+                    st = st.ExtSubTable
+                elif lookup.LookupType != 2:
+                    continue
+                firsts = [g for g in st.Coverage.glyphs if g in glyphs]
+                if st.Format == 1:
+                    index = {g: i for i, g in enumerate(st.Coverage.glyphs)}
+                    for first in firsts:
+                        for rec in st.PairSet[index[first]].PairValueRecord:
+                            value = getattr(rec.Value1, 'XAdvance', 0) if rec.Value1 else 0
+                            if value and rec.SecondGlyph in glyphs:
+                                pairs.setdefault((first, rec.SecondGlyph), value)
+                elif st.Format == 2:
+                    class1, class2 = st.ClassDef1.classDefs, st.ClassDef2.classDefs
+                    for first in firsts:
+                        row = st.Class1Record[class1.get(first, 0)].Class2Record
+                        for second in glyphs:
+                            value = row[class2.get(second, 0)].Value1
+                            value = getattr(value, 'XAdvance', 0) if value else 0
+                            if value:
+                                pairs.setdefault((first, second), value)
+    return pairs
+
+
+def extract_font_metrics(file_data: bytes) -> Dict[str, Any]:
+    '''Метрики шрифта компактными массивами: кодовые точки и ширины в единицах em,
+    кернинг — плоским списком троек (левая, правая, поправка) для символов из SUBSET_UNICODES'''
+    from fontTools.ttLib import TTFont
+    font = TTFont(io.BytesIO(file_data), fontNumber=0)
+    cmap = font.getBestCmap() or {}
+    hmtx = font['hmtx'].metrics
+    cps = sorted(cmap)
+
+    kern_cps = [cp for cp in SUBSET_UNICODES if cp in cmap]
+    cp_by_glyph: Dict[str, list] = {}
+    for cp in kern_cps:
+        cp_by_glyph.setdefault(cmap[cp], []).append(cp)
+    kern = []
+    for (left, right), value in _kerning_pairs(font, set(cp_by_glyph)).items():
+        for a in cp_by_glyph[left]:
+            for b in cp_by_glyph[right]:
+                kern.extend((a, b, value))
+
+    return {
+        'upem': font['head'].unitsPerEm,
+        'default': hmtx[font.getGlyphOrder()[0]][0],
+        'cps': cps,
+        'adv': [hmtx[cmap[cp]][0] for cp in cps],
+        'kern': kern,
+    }
+
+
+def _unpack_metrics(packed: Dict[str, Any]) -> Dict[str, Any]:
+    kern = packed['kern']
+    return {
+        'upem': packed['upem'],
+        'default': packed['default'],
+        'adv': dict(zip(packed['cps'], packed['adv'])),
+        'kern': {(kern[i], kern[i + 1]): kern[i + 2] for i in range(0, len(kern), 3)},
+    }
+
+
+def metrics_text_width(metrics: Dict[str, Any], text: str, size: float) -> float:
+    '''Ширина однострочного текста в пикселях при размере шрифта size'''
+    adv, kern, default = metrics['adv'], metrics['kern'], metrics['default']
+    total, prev = 0, None
+    for ch in text:
+        cp = ord(ch)
+        total += adv.get(cp, default)
+        if prev is not None:
+            total += kern.get((prev, cp), 0)
+        prev = cp
+    return total * size / metrics['upem']
+
+
+def load_font_metrics(conn, families) -> Dict[tuple, Any]:
+    '''Метрики для набора (семейство, жирность) из кэша diploma_font_metrics; недостающие
+    извлекаются из файла шрифта (загруженного или Google Fonts) и сохраняются в кэш'''
+    families = set(families)
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'''
+            SELECT DISTINCT ON (name) id, name, font_url
+            FROM {SCHEMA}.diploma_fonts WHERE name = ANY(%s)
+            ORDER BY name, id DESC
+        ''', (list({family for family, _ in families}),))
+        custom = {r['name']: r for r in cur.fetchall()}
+        keys = {
+            (family, bold): f"font:{custom[family]['id']}" if family in custom else f"google:{family}:{700 if bold else 400}"
+            for family, bold in families
+        }
+        cur.execute(f'''
+            SELECT font_key, metrics FROM {SCHEMA}.diploma_font_metrics WHERE font_key = ANY(%s)
+        ''', (list(set(keys.values())),))
+        cached = {r['font_key']: json.loads(r['metrics']) for r in cur.fetchall()}
+
+    for (family, bold), key in keys.items():
+        if key in cached:
+            continue
+        try:
+            data = _http_get(custom[family]['font_url']) if family in custom else _google_font_bytes(family, bold)
+            if not data:
+                continue
+            cached[key] = extract_font_metrics(data)
+        except Exception:
+            continue
+        with conn.cursor() as cur:
+            cur.execute(f'''
+                INSERT INTO {SCHEMA}.diploma_font_metrics (font_key, metrics) VALUES (%s, %s)
+                ON CONFLICT (font_key) DO NOTHING
+            ''', (key, json.dumps(cached[key], separators=(',', ':'))))
+
+    return {pair: _unpack_metrics(cached[key]) for pair, key in keys.items() if key in cached}
+
+
+def fit_text(conn, event: Dict[str, Any]) -> Dict[str, Any]:
+    '''Подбор размера шрифта и переносов строк для пачки текстов по метрикам шрифтов.
+    { template_id, rows: [{participant_name, ...}] } — раскладка всех полей шаблона для каждой строки;
+    { font_family, font_weight, font_size, line_height, width, height, texts: [...] } — одно поле (размеры в px).'''
+    body = json.loads(event.get('body') or '{}')
+
+    if body.get('template_id'):
+        rows = body.get('rows') or []
+        if not rows or len(rows) > MAX_FIT_TEXTS:
+            return _resp(400, {'error': f'rows обязателен (не больше {MAX_FIT_TEXTS})'})
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f'SELECT orientation FROM {SCHEMA}.diploma_templates WHERE id = %s', (body['template_id'],))
+            template = cur.fetchone()
+            if not template:
+                return _resp(404, {'error': 'Шаблон не найден'})
+            cur.execute(f'''
+                SELECT id, data_key, custom_text, prefix_text, pos_x, pos_y, width, height, font_family, font_size,
+                       font_color, font_weight, line_height, text_align, group_id, auto_fit
+                FROM {SCHEMA}.diploma_template_fields
+                WHERE template_id = %s ORDER BY sort_order, id
+            ''', (body['template_id'],))
+            fields = [dict(f) for f in cur.fetchall()]
+
+        portrait = template['orientation'] == 'portrait'
+        page_w = (A4_WIDTH_MM if portrait else A4_HEIGHT_MM) * MM_TO_PX
+        page_h = (A4_HEIGHT_MM if portrait else A4_WIDTH_MM) * MM_TO_PX
+        metrics = load_font_metrics(conn, {(f['font_family'], _is_bold(f['font_weight'])) for f in fields})
+        _render_init(page_w, page_h, fields, {}, b'', metrics)
+        results = [
+            [{'field_id': f['id'], 'x': x, 'y': y, 'width': w, 'height': h, 'font_size': size, 'lines': lines}
+             for f, x, y, w, h, size, lines in _layout_fields({k: str(v or '') for k, v in values.items()})]
+            for values in rows
+        ]
+        return _resp(200, {'page_width': page_w, 'page_height': page_h, 'results': results})
+
+    texts = body.get('texts') or []
+    if not body.get('font_family') or not texts or len(texts) > MAX_FIT_TEXTS:
+        return _resp(400, {'error': f'font_family и texts обязательны (не больше {MAX_FIT_TEXTS})'})
+    field = {
+        'font_family': body['font_family'],
+        'font_weight': body.get('font_weight', 'normal'),
+        'font_size': float(body.get('font_size', 16)),
+        'line_height': float(body.get('line_height', 1.2)),
+    }
+    width, height = float(body.get('width', 0)), float(body.get('height', 0))
+    bold = _is_bold(field['font_weight'])
+    _render_init(0, 0, [], {}, b'', load_font_metrics(conn, {(field['font_family'], bold)}))
+    results = []
+    for text in texts:
+        text = str(text or '')
+        size = _auto_fit_size(text, width, height, field)
+        results.append({'font_size': size, 'lines': _wrap_lines(text, max(0.0, width - 4), field['font_family'], bold, size)})
+    return _resp(200, {'results': results})
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# КОНСТРУКТОР ДИПЛОМОВ: СЕРВЕРНЫЙ РЕНДЕР В PDF
+# ══════════════════════════════════════════════════════════════════════════════
+# Раскладка повторяет src/lib/diplomaLayout.ts и renderDiplomaToCanvas.ts: те же проценты
+# от страницы, тот же перенос по словам, подбор размера шрифта и авто-раскладка групп.
+# Диплом рисуется растром через Pillow (как и в браузере — через canvas) и сохраняется в PDF.
+
+def _http_get(url: str) -> bytes:
+    with urllib.request.urlopen(url, timeout=20) as r:
+        return r.read()
+
+
+def _is_bold(font_weight: str) -> bool:
+    w = str(font_weight or 'normal')
+    return w == 'bold' or (w.isdigit() and int(w) >= 600)
+
+
+def _google_font_bytes(family: str, bold: bool):
+    '''TTF стандартного шрифта конструктора из Google Fonts (без браузерного User-Agent CSS API отдаёт truetype)'''
+    for weight in ((700, 400) if bold else (400,)):
+        try:
+            css = _http_get(f"{GOOGLE_FONTS_CSS}?family={family.replace(' ', '+')}:wght@{weight}").decode()
+            url = re.search(r'src:\s*url\(([^)]+)\)', css).group(1)
+            return _http_get(url)
+        except Exception:
+            continue
+    return None
+
+
+def _woff2_to_ttf(data: bytes) -> bytes:
+    from fontTools.ttLib import TTFont
+    font = TTFont(io.BytesIO(data))
+    font.flavor = None
+    buf = io.BytesIO()
+    font.save(buf)
+    return buf.getvalue()
+
+
+def load_render_fonts(conn, template_id, fields) -> Dict[tuple, Any]:
+    '''Байты шрифтов для всех (семейство, жирность), встречающихся в полях шаблона.
+    Загруженные пользователем шрифты берутся подмножеством глифов шаблона (см. ensure_font_subsets),
+    стандартные — из Google Fonts.'''
+    needed = {(f['font_family'], _is_bold(f['font_weight'])) for f in fields}
+    needed.add((RENDER_FALLBACK_FONT, False))
+    custom = {f['name']: f['subset_url'] for f in ensure_font_subsets(conn, template_id, fields)}
+
+    fonts = {}
+    for family, bold in needed:
+        try:
+            fonts[(family, bold)] = _woff2_to_ttf(_http_get(custom[family])) if family in custom else _google_font_bytes(family, bold)
+        except Exception:
+            fonts[(family, bold)] = None
+    return fonts
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def sign_diploma_token(diploma_number: str, participant_name: str, contest_id, award: str) -> str:
+    '''
+    Подписанный токен диплома для QR-кода: base64url(payload).base64url(HMAC-SHA256[:16]) — формат jury-scoring,
+    проверяется в diploma-check без обращения к БД. Без DIPLOMA_TOKEN_SECRET или звания — пустая строка.
+    '''
+    secret = os.environ.get('DIPLOMA_TOKEN_SECRET')
+    if not secret or not diploma_number or award not in AWARD_CODES:
+        return ''
+    payload = json.dumps({'n': diploma_number, 'p': participant_name, 'c': int(contest_id), 'a': AWARD_CODES[award]},
+                         ensure_ascii=False, separators=(',', ':')).encode()
+    signature = hmac.new(secret.encode(), payload, hashlib.sha256).digest()[:16]
+    return f'{_b64url(payload)}.{_b64url(signature)}'
+
+
+def qr_image(token: str):
+    '''QR-код токена как чёрно-белое изображение Pillow, по пикселю на модуль'''
+    import qrcode
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=1, border=2)
+    qr.add_data(token)
+    qr.make(fit=True)
+    return qr.make_image(fill_color='black', back_color='white').get_image().convert('L')
+
+
+def get_diploma_qr_codes(conn, contest_id) -> Dict[str, Any]:
+    '''QR-коды подписанных токенов для строк программы с итоговым званием: {rows: [{id, diploma_qr}]}'''
+    if not contest_id:
+        return _resp(400, {'error': 'contest_id обязателен'})
+    recompute_stale_awards(conn, contest_id)
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'''
+            SELECT id, participant_name, diploma_number, award
+            FROM {SCHEMA}.contest_program
+            WHERE contest_id = %s AND all_scored AND COALESCE(award, '') != ''
+            ORDER BY order_number, id
+        ''', (contest_id,))
+        rows = cur.fetchall()
+
+    result = []
+    for row in rows:
+        token = sign_diploma_token(row['diploma_number'], row['participant_name'], contest_id, row['award'])
+        if not token:
+            continue
+        buf = io.BytesIO()
+        qr_image(token).save(buf, 'PNG')
+        result.append({'id': row['id'], 'diploma_qr': 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode()})
+    return _resp(200, {'rows': result})
+
+
+# Состояние процесса-рендерера: заполняется один раз на процесс в _render_init,
+# шрифты нужных размеров и подготовленная подложка кэшируются между дипломами.
+_RENDER: Dict[str, Any] = {}
+
+
+def _render_init(page_w: float, page_h: float, fields, font_bytes, background, metrics=None, static_layer=False) -> None:
+    '''static_layer=True: background — уже готовый статический слой (подложка + статические поля)'''
+    _RENDER.clear()
+    _RENDER.update({'page_w': page_w, 'page_h': page_h, 'fields': fields, 'font_bytes': font_bytes,
+                    'background': background, 'metrics': metrics or {}, 'static_layer': static_layer,
+                    'fonts': {}, 'bg_image': None})
+
+
+def _font(family: str, bold: bool, size: float):
+    '''ImageFont в пикселях итогового изображения (с учётом RENDER_SCALE), с кэшем по размеру'''
+    from PIL import ImageFont
+    px = max(1, int(round(size * RENDER_SCALE)))
+    key = (family, bold, px)
+    cache = _RENDER['fonts']
+    if key not in cache:
+        data = (_RENDER['font_bytes'].get((family, bold)) or _RENDER['font_bytes'].get((family, False))
+                or _RENDER['font_bytes'].get((RENDER_FALLBACK_FONT, False)))
+        cache[key] = ImageFont.truetype(io.BytesIO(data), px) if data else ImageFont.load_default(px)
+    return cache[key]
+
+
+def _measure(text: str, family: str, bold: bool, size: float) -> float:
+    '''Ширина однострочного текста в CSS-пикселях страницы: по метрикам шрифта, а если их нет — через Pillow'''
+    if not text:
+        return 0.0
+    metrics = _RENDER['metrics'].get((family, bold)) or _RENDER['metrics'].get((family, False))
+    if metrics:
+        return metrics_text_width(metrics, text, size)
+    return _font(family, bold, size).getlength(text) / RENDER_SCALE
+
+
+def _wrap_lines(text: str, max_width: float, family: str, bold: bool, size: float) -> list:
+    '''Перенос по словам — как wrapTextLines из diplomaLayout.ts'''
+    lines = []
+    for paragraph in text.split('\n'):
+        if paragraph == '':
+            lines.append('')
+            continue
+        line = ''
+        for word in paragraph.split(' '):
+            test = f'{line} {word}' if line else word
+            if line and _measure(test, family, bold, size) > max_width:
+                lines.append(line)
+                line = word
+            else:
+                line = test
+        if line:
+            lines.append(line)
+    return lines or ['']
+
+
+def _auto_fit_size(text: str, width: float, height: float, f: Dict[str, Any]) -> float:
+    '''Наибольший размер шрифта (не больше заданного), при котором текст помещается в поле — как computeAutoFitFontSize'''
+    max_size = float(f['font_size'])
+    avail_w, avail_h = max(0.0, width - 8), max(0.0, height - 8)
+    if not text.strip() or avail_w <= 0 or avail_h <= 0:
+        return max_size
+    bold = _is_bold(f['font_weight'])
+    size = max_size
+    while size >= 6:
+        lines = _wrap_lines(text, avail_w, f['font_family'], bold, size)
+        if len(lines) * size * float(f['line_height']) <= avail_h:
+            return size
+        size -= 0.5
+    return 6.0
+
+
+def _field_text(f: Dict[str, Any], values: Dict[str, str]) -> str:
+    prefix = f"{f['prefix_text']} " if f.get('prefix_text') else ''
+    if f['data_key'] == 'custom':
+        return prefix + (f.get('custom_text') or 'Текст')
+    return prefix + (values.get(f['data_key']) or '—')
+
+
+def _field_font_size(f: Dict[str, Any], text: str, width: float, height: float) -> float:
+    return _auto_fit_size(text, width, height, f) if f.get('auto_fit') is not False else float(f['font_size'])
+
+
+def _group_layout(fields, page_w: float, page_h: float, values: Dict[str, str]) -> Dict[int, tuple]:
+    '''Объединённые поля выстраиваются в одну строку по фактической ширине текста — как computeGroupLayout'''
+    groups: Dict[int, list] = {}
+    for i, f in enumerate(fields):
+        if f.get('group_id') is not None:
+            groups.setdefault(f['group_id'], []).append(i)
+
+    overrides = {}
+    for idxs in groups.values():
+        if len(idxs) < 2:
+            continue
+        idxs.sort(key=lambda i: float(fields[i]['pos_x']))
+        boxes = [(float(fields[i]['pos_x']) / 100 * page_w, float(fields[i]['pos_y']) / 100 * page_h,
+                  float(fields[i]['width']) / 100 * page_w, float(fields[i]['height']) / 100 * page_h) for i in idxs]
+        left = min(b[0] for b in boxes)
+        right = max(b[0] + b[2] for b in boxes)
+        top = min(b[1] for b in boxes)
+        bottom = max(b[1] + b[3] for b in boxes)
+
+        measured = []
+        for i, (_, _, w, h) in zip(idxs, boxes):
+            f = fields[i]
+            text = _field_text(f, values)
+            size = _field_font_size(f, text, w, h)
+            text_w = _measure(text, f['font_family'], _is_bold(f['font_weight']), size)
+            measured.append((i, (text_w or w) + 8, size))
+
+        gap = max(4.0, sum(m[2] for m in measured) / len(measured) * 0.35)
+        total = sum(m[1] for m in measured) + gap * (len(measured) - 1)
+        cursor = left + max(0.0, (right - left - total) / 2)
+        for i, w, size in measured:
+            overrides[i] = (cursor, top, w, bottom - top, size)
+            cursor += w + gap
+    return overrides
+
+
+def _background_image():
+    '''Подложка, обрезанная по object-cover и приведённая к размеру страницы — один раз на процесс'''
+    from PIL import Image
+    if _RENDER['bg_image'] is None and _RENDER['static_layer']:
+        _RENDER['bg_image'] = Image.open(io.BytesIO(_RENDER['background'])).convert('RGB')
+    elif _RENDER['bg_image'] is None:
+        size = (int(round(_RENDER['page_w'] * RENDER_SCALE)), int(round(_RENDER['page_h'] * RENDER_SCALE)))
+        page = Image.new('RGB', size, 'white')
+        if _RENDER['background']:
+            img = Image.open(io.BytesIO(_RENDER['background'])).convert('RGBA')
+            area_ratio = size[0] / size[1]
+            if img.width / img.height > area_ratio:
+                sw = img.height * area_ratio
+                box = ((img.width - sw) / 2, 0, (img.width + sw) / 2, img.height)
+            else:
+                sh = img.width / area_ratio
+                box = (0, (img.height - sh) / 2, img.width, (img.height + sh) / 2)
+            img = img.resize(size, Image.LANCZOS, box=box)
+            page.paste(img, (0, 0), img)
+        _RENDER['bg_image'] = page
+    return _RENDER['bg_image']
+
+
+def _layout_fields(values: Dict[str, str]) -> list:
+    '''Раскладка полей шаблона для одного диплома: (поле, x, y, ширина, высота, размер шрифта, строки)'''
+    page_w, page_h, fields = _RENDER['page_w'], _RENDER['page_h'], _RENDER['fields']
+    overrides = _group_layout(fields, page_w, page_h, values)
+    layout = []
+    for i, f in enumerate(fields):
+        text = _field_text(f, values)
+        if i in overrides:
+            x, y, w, h, size = overrides[i]
+        else:
+            x, y = float(f['pos_x']) / 100 * page_w, float(f['pos_y']) / 100 * page_h
+            w, h = float(f['width']) / 100 * page_w, float(f['height']) / 100 * page_h
+            size = float(f['font_size']) if f['data_key'] == DIPLOMA_QR_KEY else _field_font_size(f, text, w, h)
+        if f['data_key'] == DIPLOMA_QR_KEY:
+            lines = [values.get(DIPLOMA_QR_KEY) or '']
+        else:
+            lines = _wrap_lines(text, max(0.0, w - 4), f['font_family'], _is_bold(f['font_weight']), size)
+        layout.append((f, x, y, w, h, size, lines))
+    return layout
+
+
+def _static_field_ids(fields) -> set:
+    '''Индексы полей, одинаковых на всех дипломах шаблона: статический текст вне групп
+    или в группе, где все поля статические (раскладка группы зависит от текста каждого поля)'''
+    dynamic_groups = {f['group_id'] for f in fields if f.get('group_id') is not None and f['data_key'] != 'custom'}
+    return {i for i, f in enumerate(fields) if f['data_key'] == 'custom' and f.get('group_id') not in dynamic_groups}
+
+
+def _draw_fields(page, layout) -> None:
+    from PIL import ImageDraw
+    from PIL import Image
+    draw = ImageDraw.Draw(page)
+    for f, x, y, w, h, size, lines in layout:
+        if f['data_key'] == DIPLOMA_QR_KEY:
+            # Квадрат по меньшей стороне поля, по центру; модули масштабируются без сглаживания
+            if lines[0]:
+                side = int(min(w, h) * RENDER_SCALE)
+                qr = qr_image(lines[0]).resize((side, side), Image.NEAREST)
+                page.paste(qr, (int((x + (w - min(w, h)) / 2) * RENDER_SCALE), int((y + (h - min(w, h)) / 2) * RENDER_SCALE)))
+            continue
+        bold = _is_bold(f['font_weight'])
+        font = _font(f['font_family'], bold, size)
+        line_h = size * float(f['line_height'])
+        cursor_y = y + (h - len(lines) * line_h) / 2 + line_h * 0.8
+        for line in lines:
+            line_w = _measure(line, f['font_family'], bold, size)
+            if f['text_align'] == 'center':
+                line_x = x + (w - line_w) / 2
+            elif f['text_align'] == 'right':
+                line_x = x + w - 2 - line_w
+            else:
+                line_x = x + 2
+            draw.text((line_x * RENDER_SCALE, cursor_y * RENDER_SCALE), line, font=font,
+                      fill=f['font_color'] or '#000000', anchor='ls')
+            cursor_y += line_h
+
+
+def compose_static_layer() -> bytes:
+    '''Статический слой шаблона (подложка + статические поля) в PNG — общий для всех дипломов'''
+    page = _background_image().copy()
+    static = _static_field_ids(_RENDER['fields'])
+    _draw_fields(page, [item for i, item in enumerate(_layout_fields({})) if i in static])
+    buf = io.BytesIO()
+    page.save(buf, 'PNG', compress_level=1)
+    return buf.getvalue()
+
+
+def _render_diploma(job: tuple) -> tuple:
+    '''Рендер одного диплома в PDF: (имя файла, значения полей) -> (имя файла, байты PDF).
+    Поверх статического слоя рисуются только поля, зависящие от данных строки.'''
+    file_name, values = job
+    page = _background_image().copy()
+    layout = _layout_fields(values)
+    if _RENDER['static_layer']:
+        static = _static_field_ids(_RENDER['fields'])
+        layout = [item for i, item in enumerate(layout) if i not in static]
+    _draw_fields(page, layout)
+
+    buf = io.BytesIO()
+    page.save(buf, 'PDF', resolution=96 * RENDER_SCALE, quality=95)
+    return file_name, buf.getvalue()
+
+
+def _render_all(jobs: list, init_args: tuple):
+    '''Рендер пачки дипломов в пуле процессов; если пул недоступен в окружении — в текущем процессе'''
+    try:
+        pool = ProcessPoolExecutor(max_workers=min(RENDER_WORKERS, os.cpu_count() or 1),
+                                   initializer=_render_init, initargs=init_args)
+    except (OSError, NotImplementedError):
+        _render_init(*init_args)
+        yield from map(_render_diploma, jobs)
+        return
+    with pool:
+        yield from pool.map(_render_diploma, jobs, chunksize=max(1, len(jobs) // (RENDER_WORKERS * 4)))
+
+
+def _sanitize_file_name(name: str) -> str:
+    return re.sub(r'\s+', ' ', re.sub(r'[\\/:*?"<>|]', '', name or '')).strip()
+
+
+def render_diplomas(conn, event: Dict[str, Any]) -> Dict[str, Any]:
+    '''Серверная генерация дипломов конкурса в PDF { contest_id, template_id, nomination_id?, row_ids? }.
+    Каждый диплом загружается в бакет отдельным файлом, плюс общий zip-архив.'''
+    body = json.loads(event.get('body') or '{}')
+    contest_id = body.get('contest_id')
+    template_id = body.get('template_id')
+    if not contest_id or not template_id:
+        return _resp(400, {'error': 'contest_id и template_id обязательны'})
+
+    conditions = ['cp.contest_id = %s']
+    args = [contest_id]
+    if body.get('nomination_id'):
+        conditions.append('cp.nomination_id = %s')
+        args.append(body['nomination_id'])
+    if body.get('row_ids'):
+        conditions.append('cp.id = ANY(%s)')
+        args.append([int(i) for i in body['row_ids']])
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'''
+            SELECT orientation, COALESCE(NULLIF(background_print_url, ''), background_url) AS background_url
+            FROM {SCHEMA}.diploma_templates WHERE id = %s
+        ''', (template_id,))
+        template = cur.fetchone()
+        if not template:
+            return _resp(404, {'error': 'Шаблон не найден'})
+        cur.execute(f'''
+            SELECT data_key, custom_text, prefix_text, pos_x, pos_y, width, height, font_family, font_size,
+                   font_color, font_weight, line_height, text_align, group_id, auto_fit
+            FROM {SCHEMA}.diploma_template_fields
+            WHERE template_id = %s ORDER BY sort_order, id
+        ''', (template_id,))
+        fields = [dict(f) for f in cur.fetchall()]
+
+        cur.execute(f'SELECT title, location, event_date FROM {SCHEMA}.contests WHERE id = %s', (contest_id,))
+        contest = cur.fetchone()
+        if not contest:
+            return _resp(404, {'error': 'Конкурс не найден'})
+        recompute_stale_awards(conn, contest_id)
+        cur.execute(f'''
+            SELECT cp.id, cp.participant_name, cp.director_name, cp.region, cp.directing_party, cp.age,
+                   cp.nomination, cp.piece_title, cp.duration, cp.participation_format, cp.diploma_number,
+                   COALESCE(cp.award, '') AS award, cp.all_scored
+            FROM {SCHEMA}.contest_program cp
+            WHERE {' AND '.join(conditions)}
+            ORDER BY cp.order_number, cp.id
+        ''', args)
+        rows = list(cur.fetchall())
+
+    if not rows:
+        return _resp(400, {'error': 'Нет строк программы для генерации'})
+    if len(rows) > MAX_RENDER_ROWS:
+        return _resp(400, {'error': f'За один раз можно сформировать не больше {MAX_RENDER_ROWS} дипломов'})
+
+    portrait = template['orientation'] == 'portrait'
+    page_w = (A4_WIDTH_MM if portrait else A4_HEIGHT_MM) * MM_TO_PX
+    page_h = (A4_HEIGHT_MM if portrait else A4_WIDTH_MM) * MM_TO_PX
+    metrics = load_font_metrics(conn, {(f['font_family'], _is_bold(f['font_weight'])) for f in fields})
+    fonts = load_render_fonts(conn, template_id, fields)
+    s3 = _s3_client()
+
+    # Статический слой кэшируется в бакете по хэшу всего, что на него влияет: подложки,
+    # полей шаблона, ориентации и самих файлов шрифтов. Подложка декодируется один раз
+    # на версию шаблона, а не на каждый диплом.
+    layer_hash = hashlib.sha256(json.dumps({
+        'orientation': template['orientation'],
+        'background': template['background_url'],
+        'fields': fields,
+        'scale': RENDER_SCALE,
+        'fonts': sorted([family, bold, hashlib.sha1(data).hexdigest() if data else '']
+                        for (family, bold), data in fonts.items()),
+    }, sort_keys=True, default=json_serial).encode()).hexdigest()[:24]
+    layer_key = f'diploma-templates/{template_id}/static/{layer_hash}.png'
+    layer = get_s3_object(s3, layer_key)
+    if layer is None:
+        background = _http_get(template['background_url']) if template['background_url'] else b''
+        _render_init(page_w, page_h, fields, fonts, background, metrics)
+        layer = compose_static_layer()
+        put_s3_object(s3, layer_key, layer, 'image/png')
+    init_args = (page_w, page_h, fields, fonts, layer, metrics, True)
+
+    contest_values = {
+        'contest_title': contest['title'] or '',
+        'contest_location': contest['location'] or '',
+        'contest_event_date': json_serial(contest['event_date']) if contest['event_date'] else '',
+    }
+    name_counts: Dict[str, int] = {}
+    for row in rows:
+        base = _sanitize_file_name(row['participant_name']) or 'Диплом'
+        name_counts[base] = name_counts.get(base, 0) + 1
+    jobs, files = [], []
+    for row in rows:
+        base = _sanitize_file_name(row['participant_name']) or 'Диплом'
+        file_name = f"{base} ({row['diploma_number'] or row['id']})" if name_counts[base] > 1 else base
+        values = {k: str(v or '') for k, v in row.items() if k not in ('id', 'all_scored')}
+        values.update(contest_values)
+        if row['all_scored']:
+            values[DIPLOMA_QR_KEY] = sign_diploma_token(row['diploma_number'], row['participant_name'], contest_id, row['award'])
+        jobs.append((f'{file_name}.pdf', values))
+        files.append({'id': row['id'], 'file_name': f'{file_name}.pdf',
+                      'key': f"{row['id']}_{row['diploma_number'] or 'diploma'}.pdf"})
+
+    batch = f"diplomas/{contest_id}/{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    # Готовые PDF сразу уходят в zip на диске и в бакет, не накапливаясь в памяти;
+    # pool.map отдаёт результаты в порядке заданий, поэтому они сопоставляются с files по позиции.
+    with tempfile.TemporaryFile() as zip_file, ThreadPoolExecutor(max_workers=8) as uploader:
+        uploads = []
+        with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_STORED) as zf:
+            for info, (file_name, pdf) in zip(files, _render_all(jobs, init_args)):
+                zf.writestr(file_name, pdf)
+                uploads.append(uploader.submit(put_s3_object, s3, f"{batch}/{info['key']}", pdf, 'application/pdf'))
+        for f, fut in zip(files, uploads):
+            f['url'] = fut.result()
+        zip_file.seek(0)
+        zip_url = put_s3_object(s3, f'{batch}.zip', zip_file, 'application/zip')
+
+    for f in files:
+        f.pop('key')
+    return _resp(200, {'success': True, 'count': len(files), 'zip_url': zip_url, 'files': files})
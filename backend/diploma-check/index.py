@@ -1,34 +1,307 @@
+import base64
+import hashlib
+import hmac
 import json
 import os
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 SCHEMA = 't_p73771717_multi_page_site_proj'
 
 JURY_COUNTS = [1, 2, 3, 4, 5]
 LEVELS = ['grand_prix_min', 'laureate_1_min', 'laureate_2_min', 'laureate_3_min', 'diplom_1_min', 'diplom_2_min', 'diplom_3_min']
+AWARD_COLS = ['grand_prix', 'laureate_1', 'laureate_2', 'laureate_3', 'diplom_1', 'diplom_2', 'diplom_3']
+MAX_BULK_NUMBERS = 500
+# Коды званий в подписанном токене диплома (выпускается в jury-scoring, results_table)
+AWARD_BY_CODE = {
+    'gp': 'ОБЛАДАТЕЛЯ ГРАН-ПРИ',
+    'l1': 'ЛАУРЕАТА I СТЕПЕНИ',
+    'l2': 'ЛАУРЕАТА II СТЕПЕНИ',
+    'l3': 'ЛАУРЕАТА III СТЕПЕНИ',
+    'd1': 'ДИПЛОМАНТА I СТЕПЕНИ',
+    'd2': 'ДИПЛОМАНТА II СТЕПЕНИ',
+    'd3': 'ДИПЛОМАНТА III СТЕПЕНИ',
+    'p': 'УЧАСТНИКА',
+}
 DEFAULT_THRESHOLDS = {n: {'grand_prix': n*95, 'laureate_1': n*85, 'laureate_2': n*75, 'laureate_3': n*65, 'diplom_1': n*55, 'diplom_2': n*45, 'diplom_3': n*35} for n in range(1, 6)}
 
 
+def get_award(total: float, jury_count: int, thresholds: Dict[int, Dict[str, int]]) -> str:
+    '''Звание по сумме баллов и количеству судей'''
+    t = thresholds.get(jury_count, DEFAULT_THRESHOLDS.get(jury_count, {}))
+    if total >= t.get('grand_prix', 9999): return 'ОБЛАДАТЕЛЯ ГРАН-ПРИ'
+    if total >= t.get('laureate_1', 9999): return 'ЛАУРЕАТА I СТЕПЕНИ'
+    if total >= t.get('laureate_2', 9999): return 'ЛАУРЕАТА II СТЕПЕНИ'
+    if total >= t.get('laureate_3', 9999): return 'ЛАУРЕАТА III СТЕПЕНИ'
+    if total >= t.get('diplom_1', 9999): return 'ДИПЛОМАНТА I СТЕПЕНИ'
+    if total >= t.get('diplom_2', 9999): return 'ДИПЛОМАНТА II СТЕПЕНИ'
+    if total >= t.get('diplom_3', 9999): return 'ДИПЛОМАНТА III СТЕПЕНИ'
+    return 'УЧАСТНИКА'
+
+
+def load_thresholds(cur, contest_ids: List[int]) -> Dict[int, Dict[int, Dict[str, int]]]:
+    '''Пороги званий для набора конкурсов одним запросом (для конкурсов без правил — дефолтные)'''
+    keys = [f'jury_count_{n}_{lvl}' for n in JURY_COUNTS for lvl in LEVELS]
+    cur.execute(f'''
+        SELECT contest_id, {', '.join(keys)}
+        FROM {SCHEMA}.contest_scoring_rules
+        WHERE contest_id = ANY(%s)
+    ''', (contest_ids,))
+    result = {}
+    for scoring_row in cur.fetchall():
+        thresholds = {}
+        for i, n in enumerate(JURY_COUNTS):
+            thresholds[n] = {AWARD_COLS[j]: scoring_row[keys[i*7+j]] for j in range(7)}
+        result[scoring_row['contest_id']] = thresholds
+    return result
+
+
+def calc_awards(cur, rows: List[Dict[str, Any]]) -> Dict[int, str]:
+    '''
+    Звания для набора строк программы (нужны id, contest_id, nomination_id).
+    Назначения, оценки, количество критериев и правила оценивания читаются
+    несколькими запросами на весь набор, звания считаются в памяти.
+    Возвращает {id строки программы: звание}, '' — если оценивание не завершено.
+    '''
+    if not rows:
+        return {}
+    row_ids = [r['id'] for r in rows]
+    contest_ids = list({r['contest_id'] for r in rows})
+    nomination_ids = list({r['nomination_id'] for r in rows if r.get('nomination_id')})
+
+    cur.execute(f'''
+        SELECT program_row_id, contest_id, jury_member_id
+        FROM {SCHEMA}.program_jury_assignments
+        WHERE program_row_id = ANY(%s)
+    ''', (row_ids,))
+    assignments: Dict[tuple, List[int]] = {}
+    for a in cur.fetchall():
+        assignments.setdefault((a['program_row_id'], a['contest_id']), []).append(a['jury_member_id'])
+
+    criteria_count_by_nomination = {}
+    if nomination_ids:
+        cur.execute(f'''
+            SELECT nomination_id, COUNT(*) AS cnt
+            FROM {SCHEMA}.nomination_criteria
+            WHERE nomination_id = ANY(%s)
+            GROUP BY nomination_id
+        ''', (nomination_ids,))
+        criteria_count_by_nomination = {c['nomination_id']: c['cnt'] for c in cur.fetchall()}
+
+    cur.execute(f'''
+        SELECT program_row_id, contest_id, jury_member_id, SUM(score) AS total_score, COUNT(*) AS scored_count
+        FROM {SCHEMA}.program_criteria_scores
+        WHERE program_row_id = ANY(%s)
+        GROUP BY program_row_id, contest_id, jury_member_id
+    ''', (row_ids,))
+    criteria_scores = {(s['program_row_id'], s['contest_id'], s['jury_member_id']): s for s in cur.fetchall()}
+
+    cur.execute(f'''
+        SELECT program_row_id, contest_id, jury_member_id, score
+        FROM {SCHEMA}.program_scores
+        WHERE program_row_id = ANY(%s)
+    ''', (row_ids,))
+    plain_scores = {(s['program_row_id'], s['contest_id'], s['jury_member_id']): float(s['score']) for s in cur.fetchall()}
+
+    thresholds_by_contest = load_thresholds(cur, contest_ids)
+
+    awards = {}
+    for r in rows:
+        row_id, contest_id = r['id'], r['contest_id']
+        jury_ids = assignments.get((row_id, contest_id), [])
+        if not jury_ids:
+            awards[row_id] = ''
+            continue
+        criteria_count = criteria_count_by_nomination.get(r.get('nomination_id'), 0)
+
+        total = 0.0
+        all_scored = True
+        for jury_id in jury_ids:
+            key = (row_id, contest_id, jury_id)
+            if criteria_count > 0:
+                crit = criteria_scores.get(key)
+                score = float(crit['total_score']) if crit and crit['scored_count'] >= criteria_count else None
+            else:
+                score = plain_scores.get(key)
+            if score is None:
+                all_scored = False
+                break
+            total += score
+
+        thresholds = thresholds_by_contest.get(contest_id, DEFAULT_THRESHOLDS)
+        awards[row_id] = get_award(total, len(jury_ids), thresholds) if all_scored else ''
+    return awards
+
+
+def _b64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def decode_diploma_token(token: str, secret: str) -> Optional[Dict[str, Any]]:
+    '''Проверяет HMAC-подпись токена диплома и возвращает его содержимое (None — подпись неверна)'''
+    try:
+        payload_b64, signature_b64 = token.split('.', 1)
+        payload, signature = _b64url_decode(payload_b64), _b64url_decode(signature_b64)
+    except (ValueError, TypeError):
+        return None
+    expected = hmac.new(secret.encode(), payload, hashlib.sha256).digest()[:16]
+    if not hmac.compare_digest(signature, expected):
+        return None
+    try:
+        data = json.loads(payload.decode())
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    if not isinstance(data, dict) or data.get('a') not in AWARD_BY_CODE:
+        return None
+    return data
+
+
+def verify_token(params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Офлайн-проверка диплома по подписанному токену из QR-кода — без запросов к БД.
+    С check_revocation=1 дополнительно сверяет токен с актуальной строкой программы
+    (диплом удалён, перенесён в другой конкурс или звание пересчитано — токен отозван).
+    '''
+    headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+    secret = os.environ.get('DIPLOMA_TOKEN_SECRET')
+    if not secret:
+        return {'statusCode': 500, 'headers': headers, 'body': json.dumps({'error': 'Проверка токенов не настроена'})}
+
+    data = decode_diploma_token((params.get('token') or '').strip(), secret)
+    if not data:
+        return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'valid': False, 'error': 'Недействительный токен диплома'})}
+
+    result = {
+        'valid': True,
+        'diploma_number': data.get('n'),
+        'participant_name': data.get('p'),
+        'contest_id': data.get('c'),
+        'award': AWARD_BY_CODE[data['a']],
+        'revocation_checked': False,
+    }
+
+    if params.get('check_revocation') in ('1', 'true'):
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn.autocommit = True
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(f'''
+                    SELECT cp.id, cp.contest_id, cp.nomination_id, cp.award, cp.award_computed_at
+                    FROM {SCHEMA}.contest_program cp
+                    WHERE UPPER(cp.diploma_number) = %s
+                ''', (str(result['diploma_number'] or '').upper(),))
+                row = cur.fetchone()
+                award = None
+                if row:
+                    award = row['award'] if row['award_computed_at'] is not None else calc_awards(cur, [dict(row)]).get(row['id'], '')
+        finally:
+            conn.close()
+        result['revocation_checked'] = True
+        result['revoked'] = not row or row['contest_id'] != result['contest_id'] or award != result['award']
+
+    return {'statusCode': 200, 'headers': headers, 'body': json.dumps(result)}
+
+
+def bulk_check(event: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Пакетная проверка дипломов для учреждений: { diploma_numbers: [...] }.
+    Все номера ищутся одним запросом, звания берутся из строк программы
+    (недостающие досчитываются пачкой). Результат — по одному элементу на каждый номер.
+    '''
+    headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except json.JSONDecodeError:
+        body = {}
+    raw_numbers = body.get('diploma_numbers')
+    if not isinstance(raw_numbers, list) or not raw_numbers:
+        return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Укажите список номеров дипломов'})}
+
+    numbers = []
+    seen = set()
+    for n in raw_numbers:
+        n = str(n or '').strip().upper()
+        if n and n not in seen:
+            seen.add(n)
+            numbers.append(n)
+    if not numbers:
+        return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Укажите список номеров дипломов'})}
+    if len(numbers) > MAX_BULK_NUMBERS:
+        return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': f'Не более {MAX_BULK_NUMBERS} номеров за один запрос'})}
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f'''
+                SELECT cp.id, cp.contest_id, cp.nomination_id, UPPER(cp.diploma_number) AS diploma_number,
+                       cp.participant_name, cp.director_name, cp.directing_party, cp.piece_title, cp.nomination,
+                       cp.award, cp.award_computed_at,
+                       c.title AS contest_title, c.location AS contest_location, c.event_date AS contest_event_date
+                FROM {SCHEMA}.contest_program cp
+                LEFT JOIN {SCHEMA}.contests c ON c.id = cp.contest_id
+                WHERE UPPER(cp.diploma_number) = ANY(%s)
+            ''', (numbers,))
+            rows = {r['diploma_number']: dict(r) for r in cur.fetchall()}
+            awards = calc_awards(cur, [r for r in rows.values() if r['award_computed_at'] is None])
+    finally:
+        conn.close()
+
+    results = []
+    for n in numbers:
+        row = rows.get(n)
+        if not row:
+            results.append({'diploma_number': n, 'found': False})
+            continue
+        results.append({
+            'diploma_number': n,
+            'found': True,
+            'participant_name': row['participant_name'],
+            'director_name': row['director_name'],
+            'directing_party': row['directing_party'],
+            'piece_title': row['piece_title'],
+            'nomination': row['nomination'],
+            'award': awards.get(row['id'], '') if row['award_computed_at'] is None else row['award'],
+            'contest_title': row['contest_title'] or '',
+            'contest_location': row['contest_location'] or '',
+            'contest_event_date': row['contest_event_date'] or '',
+        })
+
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({'results': results, 'found': len([r for r in results if r['found']]), 'total': len(results)})
+    }
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Проверка диплома по серии и номеру
     GET /?diploma_number=XX000001 - получить данные диплома
+    GET /?participant_id=N - все дипломы участника (личный кабинет)
+    GET /?action=verify_token&token=...[&check_revocation=1] - проверка подписанного токена из QR-кода
+    POST / { diploma_numbers: [...] } - пакетная проверка (до 500 номеров)
     """
     if event.get('httpMethod') == 'OPTIONS':
         return {
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
 
+    if event.get('httpMethod') == 'POST':
+        return bulk_check(event)
+
     params = event.get('queryStringParameters') or {}
+    if params.get('action') == 'verify_token':
+        return verify_token(params)
+
     diploma_number = (params.get('diploma_number') or '').strip().upper()
     participant_name = (params.get('participant_name') or '').strip()
     participant_id = (params.get('participant_id') or '').strip()
@@ -43,78 +316,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     conn = psycopg2.connect(os.environ['DATABASE_URL'])
     conn.autocommit = True
 
-    def calc_award(cur, row_id: int, contest_id: int, nomination_id) -> str:
-        cur.execute(f'''
-            SELECT pja.jury_member_id
-            FROM {SCHEMA}.program_jury_assignments pja
-            WHERE pja.program_row_id = %s AND pja.contest_id = %s
-        ''', (row_id, contest_id))
-        assignments = cur.fetchall()
-        jury_count = len(assignments)
-        if jury_count == 0:
-            return ''
-
-        criteria_count = 0
-        if nomination_id:
-            cur.execute(f'''
-                SELECT COUNT(*) AS cnt FROM {SCHEMA}.nomination_criteria WHERE nomination_id = %s
-            ''', (nomination_id,))
-            criteria_count = cur.fetchone()['cnt']
-
-        if criteria_count > 0:
-            cur.execute(f'''
-                SELECT jury_member_id, SUM(score) AS total_score, COUNT(*) AS scored_count
-                FROM {SCHEMA}.program_criteria_scores
-                WHERE program_row_id = %s AND contest_id = %s
-                GROUP BY jury_member_id
-            ''', (row_id, contest_id))
-            scores_raw = {r['jury_member_id']: float(r['total_score']) for r in cur.fetchall() if r['scored_count'] >= criteria_count}
-        else:
-            cur.execute(f'''
-                SELECT ps.jury_member_id, ps.score
-                FROM {SCHEMA}.program_scores ps
-                WHERE ps.program_row_id = %s AND ps.contest_id = %s
-            ''', (row_id, contest_id))
-            scores_raw = {r['jury_member_id']: float(r['score']) for r in cur.fetchall()}
-
-        cur.execute(f'''
-            SELECT {', '.join([f'jury_count_{n}_{lvl}' for n in JURY_COUNTS for lvl in LEVELS])}
-            FROM {SCHEMA}.contest_scoring_rules
-            WHERE contest_id = %s
-        ''', (contest_id,))
-        scoring_row = cur.fetchone()
-
-        if scoring_row:
-            cols = ['grand_prix', 'laureate_1', 'laureate_2', 'laureate_3', 'diplom_1', 'diplom_2', 'diplom_3']
-            keys = [f'jury_count_{n}_{lvl}' for n in JURY_COUNTS for lvl in LEVELS]
-            thresholds = {}
-            for i, n in enumerate(range(1, 6)):
-                thresholds[n] = {cols[j]: scoring_row[keys[i*7+j]] for j in range(7)}
-        else:
-            thresholds = DEFAULT_THRESHOLDS
-
-        total = 0.0
-        all_scored = True
-        for a in assignments:
-            score = scores_raw.get(a['jury_member_id'])
-            if score is not None:
-                total += score
-            else:
-                all_scored = False
-
-        if not all_scored:
-            return ''
-
-        t = thresholds.get(jury_count, DEFAULT_THRESHOLDS.get(jury_count, {}))
-        if total >= t.get('grand_prix', 9999): return 'ОБЛАДАТЕЛЯ ГРАН-ПРИ'
-        if total >= t.get('laureate_1', 9999): return 'ЛАУРЕАТА I СТЕПЕНИ'
-        if total >= t.get('laureate_2', 9999): return 'ЛАУРЕАТА II СТЕПЕНИ'
-        if total >= t.get('laureate_3', 9999): return 'ЛАУРЕАТА III СТЕПЕНИ'
-        if total >= t.get('diplom_1', 9999): return 'ДИПЛОМАНТА I СТЕПЕНИ'
-        if total >= t.get('diplom_2', 9999): return 'ДИПЛОМАНТА II СТЕПЕНИ'
-        if total >= t.get('diplom_3', 9999): return 'ДИПЛОМАНТА III СТЕПЕНИ'
-        return 'УЧАСТНИКА'
-
     # Поиск дипломов конкретного участника — строго по его заявкам (participant_id),
     # чтобы не показывать чужие дипломы с других конкурсов при совпадении имени
     if participant_id and not diploma_number:
@@ -123,6 +324,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 cur.execute(f'''
                     SELECT DISTINCT cp.id, cp.contest_id, cp.nomination_id, cp.diploma_number, cp.participant_name, cp.director_name,
                            cp.piece_title, cp.nomination, cp.directing_party, cp.order_number,
+                           cp.award, cp.award_computed_at,
                            c.title as contest_title, c.location as contest_location,
                            c.event_date as contest_event_date
                     FROM {SCHEMA}.applications a
@@ -133,16 +335,27 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     ORDER BY c.event_date DESC
                 ''', (participant_id,))
                 rows = [dict(r) for r in cur.fetchall()]
-                for r in rows:
-                    contest_id = r.pop('contest_id')
-                    r['award'] = calc_award(cur, r.pop('id'), contest_id, r.pop('nomination_id'))
+
+                # Звание хранится в строке программы; пачкой досчитываем только строки,
+                # для которых оно ещё не было рассчитано. Категории магазина — одним запросом
+                awards = calc_awards(cur, [r for r in rows if r['award_computed_at'] is None])
+                contest_ids = list({r['contest_id'] for r in rows})
+                shop_categories = {}
+                if contest_ids:
                     cur.execute(f'''
-                        SELECT id FROM {SCHEMA}.shop_categories
-                        WHERE contest_id = %s AND is_active = TRUE
-                        LIMIT 1
-                    ''', (contest_id,))
-                    shop_cat = cur.fetchone()
-                    r['shop_category_id'] = shop_cat['id'] if shop_cat else None
+                        SELECT DISTINCT ON (contest_id) contest_id, id
+                        FROM {SCHEMA}.shop_categories
+                        WHERE contest_id = ANY(%s) AND is_active = TRUE
+                        ORDER BY contest_id, id
+                    ''', (contest_ids,))
+                    shop_categories = {s['contest_id']: s['id'] for s in cur.fetchall()}
+
+                for r in rows:
+                    row_id = r.pop('id')
+                    if r.pop('award_computed_at') is None:
+                        r['award'] = awards.get(row_id, '')
+                    r['shop_category_id'] = shop_categories.get(r.pop('contest_id'))
+                    r.pop('nomination_id')
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -153,11 +366,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Получаем строку программы
+            # Строка программы вместе с конкурсом и сохранённым званием
             cur.execute(f'''
                 SELECT cp.id, cp.contest_id, cp.nomination_id, cp.participant_name, cp.director_name,
-                       cp.piece_title, cp.nomination, cp.age, cp.region, cp.directing_party
+                       cp.piece_title, cp.nomination, cp.age, cp.region, cp.directing_party,
+                       cp.award, cp.award_computed_at,
+                       c.title AS contest_title, c.location AS contest_location, c.event_date AS contest_event_date
                 FROM {SCHEMA}.contest_program cp
+                LEFT JOIN {SCHEMA}.contests c ON c.id = cp.contest_id
                 WHERE UPPER(cp.diploma_number) = %s
             ''', (diploma_number,))
             row = cur.fetchone()
@@ -171,18 +387,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
             row = dict(row)
             contest_id = row['contest_id']
-            row_id = row['id']
-
-            # Получаем данные конкурса
-            cur.execute(f'''
-                SELECT title, location, event_date
-                FROM {SCHEMA}.contests
-                WHERE id = %s
-            ''', (contest_id,))
-            contest = cur.fetchone()
+            award = row['award']
 
-            # Считаем звание (с учётом критериев номинации, если они есть)
-            award = calc_award(cur, row_id, contest_id, row.get('nomination_id'))
+            # Звание ещё не сохранялось (строка добавлена до появления пересчёта) — считаем на лету
+            if row['award_computed_at'] is None:
+                award = calc_awards(cur, [row]).get(row['id'], '')
 
             # Фото жюри
             cur.execute(f'''
@@ -205,9 +414,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'piece_title': row['piece_title'],
                 'nomination': row['nomination'],
                 'award': award,
-                'contest_title': contest['title'] if contest else '',
-                'contest_location': contest['location'] if contest else '',
-                'contest_event_date': contest['event_date'] if contest else '',
+                'contest_title': row['contest_title'] or '',
+                'contest_location': row['contest_location'] or '',
+                'contest_event_date': row['contest_event_date'] or '',
                 'jury_members': jury_members,
             })
         }
@@ -1,11 +1,29 @@
 import json
 import os
 import psycopg2
+from psycopg2.extras import execute_values
+import base64
 import hashlib
+import hmac
 import secrets
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 
+SCHEMA = 't_p73771717_multi_page_site_proj'
+AWARD_LEVELS = ['grand_prix', 'laureate_1', 'laureate_2', 'laureate_3', 'diplom_1', 'diplom_2', 'diplom_3']
+# Короткие коды званий для подписанного токена диплома (QR-код должен оставаться компактным)
+AWARD_CODES = {
+    'ОБЛАДАТЕЛЯ ГРАН-ПРИ': 'gp',
+    'ЛАУРЕАТА I СТЕПЕНИ': 'l1',
+    'ЛАУРЕАТА II СТЕПЕНИ': 'l2',
+    'ЛАУРЕАТА III СТЕПЕНИ': 'l3',
+    'ДИПЛОМАНТА I СТЕПЕНИ': 'd1',
+    'ДИПЛОМАНТА II СТЕПЕНИ': 'd2',
+    'ДИПЛОМАНТА III СТЕПЕНИ': 'd3',
+    'УЧАСТНИКА': 'p',
+}
+DEFAULT_THRESHOLDS = {n: {'grand_prix': n*95, 'laureate_1': n*85, 'laureate_2': n*75, 'laureate_3': n*65, 'diplom_1': n*55, 'diplom_2': n*45, 'diplom_3': n*35} for n in range(1, 6)}
+
 def verify_jury_token(token: str, conn) -> int:
     '''Проверка токена жюри и возврат ID члена жюри'''
     cur = conn.cursor()
@@ -22,6 +40,173 @@ def verify_jury_token(token: str, conn) -> int:
     
     return result[0]
 
+
+def load_thresholds(cur, contest_id) -> Dict[int, Dict[str, int]]:
+    '''Пороги званий конкурса по количеству судей (дефолтные, если система оценивания не задана)'''
+    cols = [f'jury_count_{n}_{lvl}_min' for n in range(1, 6) for lvl in AWARD_LEVELS]
+    cur.execute(f'''
+        SELECT {', '.join(cols)}
+        FROM {SCHEMA}.contest_scoring_rules
+        WHERE contest_id = %s
+    ''', (contest_id,))
+    scoring_row = cur.fetchone()
+    if not scoring_row:
+        return DEFAULT_THRESHOLDS
+    return {n: {AWARD_LEVELS[j]: scoring_row[i*7 + j] for j in range(7)} for i, n in enumerate(range(1, 6))}
+
+
+def get_award(total: float, jury_count: int, thresholds: Dict[int, Dict[str, int]]) -> str:
+    '''Звание по сумме баллов и количеству судей'''
+    if jury_count < 1 or jury_count > 5:
+        return ''
+    t = thresholds.get(jury_count, DEFAULT_THRESHOLDS.get(jury_count, {}))
+    if total >= t.get('grand_prix', 9999):
+        return 'ОБЛАДАТЕЛЯ ГРАН-ПРИ'
+    elif total >= t.get('laureate_1', 9999):
+        return 'ЛАУРЕАТА I СТЕПЕНИ'
+    elif total >= t.get('laureate_2', 9999):
+        return 'ЛАУРЕАТА II СТЕПЕНИ'
+    elif total >= t.get('laureate_3', 9999):
+        return 'ЛАУРЕАТА III СТЕПЕНИ'
+    elif total >= t.get('diplom_1', 9999):
+        return 'ДИПЛОМАНТА I СТЕПЕНИ'
+    elif total >= t.get('diplom_2', 9999):
+        return 'ДИПЛОМАНТА II СТЕПЕНИ'
+    elif total >= t.get('diplom_3', 9999):
+        return 'ДИПЛОМАНТА III СТЕПЕНИ'
+    return 'УЧАСТНИКА'
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def sign_diploma_token(diploma_number: str, participant_name: str, contest_id: int, award: str) -> Optional[str]:
+    '''
+    Компактный подписанный токен диплома для QR-кода: base64url(payload).base64url(HMAC-SHA256[:16]).
+    Проверяется в diploma-check без обращения к БД. Без DIPLOMA_TOKEN_SECRET токены не выпускаются.
+    '''
+    secret = os.environ.get('DIPLOMA_TOKEN_SECRET')
+    if not secret or not diploma_number or award not in AWARD_CODES:
+        return None
+    payload = json.dumps({'n': diploma_number, 'p': participant_name, 'c': int(contest_id), 'a': AWARD_CODES[award]},
+                         ensure_ascii=False, separators=(',', ':')).encode()
+    signature = hmac.new(secret.encode(), payload, hashlib.sha256).digest()[:16]
+    return f'{_b64url(payload)}.{_b64url(signature)}'
+
+
+def score_program_rows(cur, contest_id, row_ids: Optional[List[int]] = None):
+    '''
+    Итоги оценивания строк программы конкурса: оценки каждого назначенного судьи, сумма и звание.
+    row_ids ограничивает расчёт конкретными строками (после сохранения оценки пересчитываем одну строку).
+    Возвращает (пороги, {id строки: итог}).
+    '''
+    row_filter = ' AND cp.id = ANY(%s)' if row_ids is not None else ''
+    row_params = (contest_id, row_ids) if row_ids is not None else (contest_id,)
+
+    cur.execute(f'''
+        SELECT cp.id, cp.nomination_id
+        FROM {SCHEMA}.contest_program cp
+        WHERE cp.contest_id = %s{row_filter}
+    ''', row_params)
+    program_rows = cur.fetchall()
+
+    # Назначенные судьи каждого участника (в порядке назначения)
+    cur.execute(f'''
+        SELECT pja.program_row_id, pja.jury_member_id, jm.name,
+               ROW_NUMBER() OVER (PARTITION BY pja.program_row_id ORDER BY pja.id) AS jury_order
+        FROM {SCHEMA}.program_jury_assignments pja
+        JOIN {SCHEMA}.jury_members jm ON jm.id = pja.jury_member_id
+        JOIN {SCHEMA}.contest_program cp ON cp.id = pja.program_row_id
+        WHERE pja.contest_id = %s{row_filter}
+        ORDER BY pja.program_row_id, pja.id
+    ''', row_params)
+    assignments_by_row: Dict[int, list] = {}
+    for row_id, jury_id, jury_name, order in cur.fetchall():
+        assignments_by_row.setdefault(row_id, []).append({'jury_member_id': jury_id, 'jury_name': jury_name, 'order': order})
+
+    # Оценки по старой схеме (один общий балл на участника, для строк без номинации с критериями)
+    cur.execute(f'''
+        SELECT ps.program_row_id, ps.jury_member_id, ps.score
+        FROM {SCHEMA}.program_scores ps
+        JOIN {SCHEMA}.contest_program cp ON cp.id = ps.program_row_id
+        WHERE ps.contest_id = %s{row_filter}
+    ''', row_params)
+    scores_index = {(r[0], r[1]): float(r[2]) for r in cur.fetchall()}
+
+    # Оценки по критериям номинации: сумма баллов всех критериев на судью для каждого участника
+    cur.execute(f'''
+        SELECT pcs.program_row_id, pcs.jury_member_id, SUM(pcs.score) AS total_score, COUNT(*) AS scored_count
+        FROM {SCHEMA}.program_criteria_scores pcs
+        JOIN {SCHEMA}.contest_program cp ON cp.id = pcs.program_row_id
+        WHERE pcs.contest_id = %s{row_filter}
+        GROUP BY pcs.program_row_id, pcs.jury_member_id
+    ''', row_params)
+    criteria_scores_index = {(r[0], r[1]): {'total': float(r[2]), 'count': r[3]} for r in cur.fetchall()}
+
+    # Количество критериев в каждой номинации (для проверки, что судья оценил все критерии)
+    cur.execute(f'''
+        SELECT n.id, COUNT(nc.id)
+        FROM {SCHEMA}.nominations n
+        LEFT JOIN {SCHEMA}.nomination_criteria nc ON nc.nomination_id = n.id
+        WHERE n.contest_id = %s
+        GROUP BY n.id
+    ''', (contest_id,))
+    criteria_count_by_nomination = {r[0]: r[1] for r in cur.fetchall()}
+
+    thresholds = load_thresholds(cur, contest_id)
+
+    results = {}
+    for row_id, nomination_id in program_rows:
+        criteria_count = criteria_count_by_nomination.get(nomination_id, 0) if nomination_id else 0
+        jury_list = assignments_by_row.get(row_id, [])
+        jury_scores = []
+        total = 0.0
+        all_scored = len(jury_list) > 0
+        for j in jury_list:
+            if criteria_count > 0:
+                # Оценивание по критериям номинации: балл судьи = сумма его оценок по всем критериям
+                crit = criteria_scores_index.get((row_id, j['jury_member_id']))
+                score = crit['total'] if crit and crit['count'] >= criteria_count else None
+            else:
+                # Старая схема: один общий балл на участника
+                score = scores_index.get((row_id, j['jury_member_id']))
+            jury_scores.append({'order': j['order'], 'score': score, 'jury_member_id': j['jury_member_id'], 'jury_name': j['jury_name']})
+            if score is not None:
+                total += score
+            else:
+                all_scored = False
+
+        jury_count = len(jury_list)
+        results[row_id] = {
+            'jury_scores': jury_scores,
+            'jury_count': jury_count,
+            'total': round(total, 2) if all_scored else None,
+            'award': get_award(total, jury_count, thresholds) if all_scored else '',
+            'all_scored': all_scored,
+            'has_criteria': criteria_count > 0,
+        }
+    return thresholds, results
+
+
+def recompute_awards(conn, contest_id, row_ids: Optional[List[int]] = None) -> int:
+    '''
+    Пересчёт сохранённых в contest_program звания, суммы баллов и признака завершённости оценивания.
+    Вызывается после изменения оценок и назначений жюри, чтобы проверка диплома читала готовое звание.
+    '''
+    cur = conn.cursor()
+    _, results = score_program_rows(cur, contest_id, row_ids)
+    if results:
+        execute_values(cur, f'''
+            UPDATE {SCHEMA}.contest_program AS cp
+            SET award = v.award, total_score = v.total_score, all_scored = v.all_scored, award_computed_at = NOW()
+            FROM (VALUES %s) AS v (id, award, total_score, all_scored)
+            WHERE cp.id = v.id
+        ''', [(row_id, r['award'], r['total'], r['all_scored']) for row_id, r in results.items()],
+            template='(%s, %s, %s::numeric, %s)')
+    cur.close()
+    return len(results)
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     API для авторизации жюри и выставления оценок конкурсантам
@@ -32,7 +217,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     DELETE /delete_participant?participant_id=N - удаление участника и всех его оценок
     GET /jury_program?contest_id=N - программа конкурса для жюри с критериями номинации (X-Jury-Token)
     POST /criteria_score - оценка по критерию номинации (program_row_id, criterion_id, contest_id, score, comment) (X-Jury-Token)
-    GET /results_table?contest_id=N - таблица результатов: сумма баллов по критериям номинации, звание
+    GET /results_table?contest_id=N - таблица результатов: сумма баллов по критериям номинации, звание, подписанный токен диплома для QR
+    POST /recompute_awards - пересчёт сохранённых званий программы конкурса (contest_id)
     '''
     method: str = event.get('httpMethod', 'GET')
     params = event.get('queryStringParameters') or {}
@@ -54,7 +240,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     # Действия, доступные только администратору сайта (не жюри) — требуют ключ доступа
     # GET jury_access публичный (список жюри конкурса показывается на публичной странице конкурса),
     # POST jury_access (изменение доступа) остаётся защищённым
-    admin_only_actions = {'program_scores', 'results_table', 'program_assignments', 'program_assignment', 'delete_participant', 'admin_score', 'admin_criteria_scores', 'admin_criteria_score'}
+    admin_only_actions = {'program_scores', 'results_table', 'program_assignments', 'program_assignment', 'delete_participant', 'admin_score', 'admin_criteria_scores', 'admin_criteria_score', 'recompute_awards'}
     if method == 'POST' and action == 'jury_access':
         admin_only_actions = admin_only_actions | {'jury_access'}
     if action in admin_only_actions:
@@ -381,135 +567,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
             # Получаем всех участников программы
             cur.execute(f'''
-                SELECT cp.id, cp.order_number, cp.participant_name, cp.age, cp.nomination, cp.piece_title, cp.region, cp.directing_party, cp.director_name, cp.diploma_number, cp.nomination_id
+                SELECT cp.id, cp.order_number, cp.participant_name, cp.age, cp.nomination, cp.piece_title, cp.region, cp.directing_party, cp.director_name, cp.diploma_number
                 FROM {schema}.contest_program cp
                 WHERE cp.contest_id = %s
                 ORDER BY cp.order_number
             ''', (contest_id,))
             program_rows = cur.fetchall()
 
-            # Получаем всех назначенных судей для каждого участника (в порядке назначения)
-            cur.execute(f'''
-                SELECT pja.program_row_id, pja.jury_member_id, jm.name,
-                       ROW_NUMBER() OVER (PARTITION BY pja.program_row_id ORDER BY pja.id) AS jury_order
-                FROM {schema}.program_jury_assignments pja
-                JOIN {schema}.jury_members jm ON jm.id = pja.jury_member_id
-                WHERE pja.contest_id = %s
-                ORDER BY pja.program_row_id, pja.id
-            ''', (contest_id,))
-            assignments_raw = cur.fetchall()
-
-            # Оценки по старой схеме (один общий балл на участника, для строк без номинации с критериями)
-            cur.execute(f'''
-                SELECT ps.program_row_id, ps.jury_member_id, ps.score
-                FROM {schema}.program_scores ps
-                WHERE ps.contest_id = %s
-            ''', (contest_id,))
-            scores_raw = list(cur.fetchall())
-
-            # Оценки по критериям номинации: сумма баллов всех критериев на судью для каждого участника
-            cur.execute(f'''
-                SELECT program_row_id, jury_member_id, SUM(score) AS total_score, COUNT(*) AS scored_count
-                FROM {schema}.program_criteria_scores
-                WHERE contest_id = %s
-                GROUP BY program_row_id, jury_member_id
-            ''', (contest_id,))
-            criteria_scores_raw = cur.fetchall()
-
-            # Количество критериев в каждой номинации (для проверки, что судья оценил все критерии)
-            cur.execute(f'''
-                SELECT n.id, COUNT(nc.id)
-                FROM {schema}.nominations n
-                LEFT JOIN {schema}.nomination_criteria nc ON nc.nomination_id = n.id
-                WHERE n.contest_id = %s
-                GROUP BY n.id
-            ''', (contest_id,))
-            criteria_count_by_nomination = {r[0]: r[1] for r in cur.fetchall()}
-
-            # Получаем систему оценивания
-            cur.execute(f'''
-                SELECT jury_count_1_grand_prix_min, jury_count_1_laureate_1_min, jury_count_1_laureate_2_min, jury_count_1_laureate_3_min,
-                       jury_count_1_diplom_1_min, jury_count_1_diplom_2_min, jury_count_1_diplom_3_min,
-                       jury_count_2_grand_prix_min, jury_count_2_laureate_1_min, jury_count_2_laureate_2_min, jury_count_2_laureate_3_min,
-                       jury_count_2_diplom_1_min, jury_count_2_diplom_2_min, jury_count_2_diplom_3_min,
-                       jury_count_3_grand_prix_min, jury_count_3_laureate_1_min, jury_count_3_laureate_2_min, jury_count_3_laureate_3_min,
-                       jury_count_3_diplom_1_min, jury_count_3_diplom_2_min, jury_count_3_diplom_3_min,
-                       jury_count_4_grand_prix_min, jury_count_4_laureate_1_min, jury_count_4_laureate_2_min, jury_count_4_laureate_3_min,
-                       jury_count_4_diplom_1_min, jury_count_4_diplom_2_min, jury_count_4_diplom_3_min,
-                       jury_count_5_grand_prix_min, jury_count_5_laureate_1_min, jury_count_5_laureate_2_min, jury_count_5_laureate_3_min,
-                       jury_count_5_diplom_1_min, jury_count_5_diplom_2_min, jury_count_5_diplom_3_min
-                FROM {schema}.contest_scoring_rules
-                WHERE contest_id = %s
-            ''', (contest_id,))
-            scoring_row = cur.fetchone()
+            thresholds, scored = score_program_rows(cur, contest_id)
             cur.close()
 
-            # Дефолтные пороги
-            default_thresholds = {n: {'grand_prix': n*95, 'laureate_1': n*85, 'laureate_2': n*75, 'laureate_3': n*65, 'diplom_1': n*55, 'diplom_2': n*45, 'diplom_3': n*35} for n in range(1, 6)}
-            if scoring_row:
-                thresholds = {}
-                cols = ['grand_prix', 'laureate_1', 'laureate_2', 'laureate_3', 'diplom_1', 'diplom_2', 'diplom_3']
-                for i, n in enumerate(range(1, 6)):
-                    thresholds[n] = {cols[j]: scoring_row[i*7 + j] for j in range(7)}
-            else:
-                thresholds = default_thresholds
-
-            # Индексируем назначения и оценки
-            assignments_by_row = {}
-            for row_id, jury_id, jury_name, order in assignments_raw:
-                if row_id not in assignments_by_row:
-                    assignments_by_row[row_id] = []
-                assignments_by_row[row_id].append({'jury_member_id': jury_id, 'jury_name': jury_name, 'order': order})
-
-            scores_index = {(r[0], r[1]): float(r[2]) for r in scores_raw}
-            criteria_scores_index = {(r[0], r[1]): {'total': float(r[2]), 'count': r[3]} for r in criteria_scores_raw}
-
-            def get_award(total, jury_count):
-                if jury_count < 1 or jury_count > 5:
-                    return ''
-                t = thresholds.get(jury_count, default_thresholds.get(jury_count, {}))
-                if total >= t.get('grand_prix', 9999):
-                    return 'ОБЛАДАТЕЛЯ ГРАН-ПРИ'
-                elif total >= t.get('laureate_1', 9999):
-                    return 'ЛАУРЕАТА I СТЕПЕНИ'
-                elif total >= t.get('laureate_2', 9999):
-                    return 'ЛАУРЕАТА II СТЕПЕНИ'
-                elif total >= t.get('laureate_3', 9999):
-                    return 'ЛАУРЕАТА III СТЕПЕНИ'
-                elif total >= t.get('diplom_1', 9999):
-                    return 'ДИПЛОМАНТА I СТЕПЕНИ'
-                elif total >= t.get('diplom_2', 9999):
-                    return 'ДИПЛОМАНТА II СТЕПЕНИ'
-                elif total >= t.get('diplom_3', 9999):
-                    return 'ДИПЛОМАНТА III СТЕПЕНИ'
-                return 'УЧАСТНИКА'
-
             result = []
             for row in program_rows:
                 row_id = row[0]
-                nomination_id = row[10] if len(row) > 10 else None
-                criteria_count = criteria_count_by_nomination.get(nomination_id, 0) if nomination_id else 0
-                jury_list = assignments_by_row.get(row_id, [])
-                jury_scores = []
-                total = 0.0
-                all_scored = len(jury_list) > 0
-                for j in jury_list:
-                    if criteria_count > 0:
-                        # Оценивание по критериям номинации: балл судьи = сумма его оценок по всем критериям
-                        crit = criteria_scores_index.get((row_id, j['jury_member_id']))
-                        score = crit['total'] if crit and crit['count'] >= criteria_count else None
-                    else:
-                        # Старая схема: один общий балл на участника
-                        score = scores_index.get((row_id, j['jury_member_id']))
-                    jury_scores.append({'order': j['order'], 'score': score, 'jury_member_id': j['jury_member_id'], 'jury_name': j['jury_name']})
-                    if score is not None:
-                        total += score
-                    else:
-                        all_scored = False
-
-                jury_count = len(jury_list)
-                award = get_award(total, jury_count) if all_scored and jury_count > 0 else ''
-
+                s = scored.get(row_id) or {'jury_scores': [], 'jury_count': 0, 'total': None, 'award': '', 'all_scored': False, 'has_criteria': False}
                 result.append({
                     'id': row_id,
                     'order_number': row[1],
@@ -519,14 +590,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'piece_title': row[5],
                     'region': row[6],
                     'directing_party': row[7],
-                    'director_name': row[8] if len(row) > 8 else '',
-                    'diploma_number': row[9] if len(row) > 9 else '',
-                    'jury_scores': jury_scores,
-                    'jury_count': jury_count,
-                    'total': round(total, 2) if all_scored and jury_count > 0 else None,
-                    'award': award,
-                    'all_scored': all_scored and jury_count > 0,
-                    'has_criteria': criteria_count > 0,
+                    'director_name': row[8],
+                    'diploma_number': row[9],
+                    'jury_scores': s['jury_scores'],
+                    'jury_count': s['jury_count'],
+                    'total': s['total'],
+                    'award': s['award'],
+                    'all_scored': s['all_scored'],
+                    'has_criteria': s['has_criteria'],
+                    'diploma_token': sign_diploma_token(row[9], row[2], contest_id, s['award']) if s['all_scored'] else None,
                 })
 
             return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'rows': result, 'thresholds': {str(k): v for k, v in thresholds.items()}}), 'isBase64Encoded': False}
@@ -648,6 +720,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 RETURNING id
             ''', (program_row_id, jury_id, criterion_id, contest_id, float(score), comment))
             score_id = cur.fetchone()[0]
+            recompute_awards(conn, contest_id, [int(program_row_id)])
             conn.commit()
             cur.close()
             return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'success': True, 'score_id': score_id}), 'isBase64Encoded': False}
@@ -691,6 +764,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     DELETE FROM {schema}.program_jury_assignments
                     WHERE program_row_id = %s AND jury_member_id = %s
                 ''', (program_row_id, jury_member_id))
+            recompute_awards(conn, contest_id, [int(program_row_id)])
             conn.commit()
             cur.close()
             return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'success': True}), 'isBase64Encoded': False}
@@ -718,6 +792,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 RETURNING id
             ''', (program_row_id, jury_id, contest_id, float(score), comment))
             score_id = cur.fetchone()[0]
+            recompute_awards(conn, contest_id, [int(program_row_id)])
             conn.commit()
             cur.close()
             return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'success': True, 'score_id': score_id}), 'isBase64Encoded': False}
@@ -768,6 +843,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 RETURNING id
             ''', (program_row_id, jury_member_id, criterion_id, contest_id, float(score)))
             score_id = cur.fetchone()[0]
+            recompute_awards(conn, contest_id, [int(program_row_id)])
             conn.commit()
             cur.close()
             return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'success': True, 'score_id': score_id}), 'isBase64Encoded': False}
@@ -792,10 +868,21 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 RETURNING id
             ''', (program_row_id, jury_member_id, contest_id, float(score)))
             score_id = cur.fetchone()[0]
+            recompute_awards(conn, contest_id, [int(program_row_id)])
             conn.commit()
             cur.close()
             return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'success': True, 'score_id': score_id}), 'isBase64Encoded': False}
 
+        # POST recompute_awards - полный пересчёт сохранённых званий программы конкурса (admin)
+        if method == 'POST' and action == 'recompute_awards':
+            body = json.loads(event.get('body', '{}'))
+            contest_id = body.get('contest_id')
+            if not contest_id:
+                return {'statusCode': 400, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Требуется contest_id'}), 'isBase64Encoded': False}
+            updated = recompute_awards(conn, contest_id)
+            conn.commit()
+            return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'success': True, 'updated': updated}), 'isBase64Encoded': False}
+
         # DELETE participant - удаление участника (админская функция, не требует токена)
         if method == 'DELETE' and action == 'delete_participant':
             participant_id = params.get('participant_id')
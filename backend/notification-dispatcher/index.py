@@ -0,0 +1,440 @@
+import json
+import os
+import time
+import smtplib
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.header import Header
+from typing import Dict, Any, List, Optional, Tuple
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+import requests
+
+SCHEMA = 't_p73771717_multi_page_site_proj'
+CABINET_URL = 'https://индиго-арт.рф/participant-cabinet'
+SUPPORT_EMAIL = 'indigo_fest@mail.ru'
+EXPO_PUSH_URL = 'https://exp.host/--/api/v2/push/send'
+
+DISPATCH_BATCH_SIZE = 50
+DISPATCH_TIME_BUDGET_SECONDS = 20  # не начинаем новую пачку, если до таймаута функции осталось мало
+CLAIM_LEASE_SECONDS = 300  # захваченная строка вернётся в очередь, если диспетчер упадёт, не дописав результат
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30  # 30 с, 1 мин, 2 мин, 4 мин, 8 мин
+SMTP_TIMEOUT_SECONDS = 20
+SMTP_IDLE_SECONDS = 30
+SMTP_MAX_MESSAGES_PER_SESSION = 100
+SELF_KICK_TIMEOUT = 0.5
+
+STATUS_LABELS = {
+    'approved': 'одобрена',
+    'rejected': 'отклонена',
+    'pending': 'возвращена на доработку',
+}
+
+
+class PermanentDeliveryError(Exception):
+    '''Ошибка, при которой повторная отправка не поможет'''
+
+
+def _footer() -> str:
+    return f"""
+      <p style="color:#6b7280; font-size: 14px; margin-top: 24px;">
+        Если у вас есть вопросы, напишите нам в чат поддержки личного кабинета
+        или на почту <a href="mailto:{SUPPORT_EMAIL}" style="color:#6d28d9;">{SUPPORT_EMAIL}</a>.
+      </p>"""
+
+
+def render_status_email(p: Dict[str, Any]) -> Tuple[str, str]:
+    '''Письмо об изменении статуса заявки'''
+    new_status = p.get('new_status')
+    admin_comment = p.get('admin_comment') or ''
+    status_label = STATUS_LABELS.get(new_status, new_status)
+    status_color = '#16a34a' if new_status == 'approved' else ('#dc2626' if new_status in ('rejected', 'pending') else '#6d28d9')
+
+    comment_html = ''
+    if admin_comment and new_status in ('rejected', 'pending'):
+        comment_html = f"""
+      <div style="background: #fef2f2; border-left: 4px solid #dc2626; padding: 12px 16px; margin: 16px 0; border-radius: 4px;">
+        <p style="margin: 0 0 4px 0; font-weight: bold; color: #991b1b;">Комментарий организатора:</p>
+        <p style="margin: 0; white-space: pre-wrap;">{admin_comment}</p>
+      </div>
+        """
+
+    html = f"""
+    <div style="font-family: Arial, sans-serif; max-width: 560px; margin: 0 auto;">
+      <h2 style="color: #6d28d9;">Статус заявки обновлён</h2>
+      <p>Здравствуйте, {p.get('full_name')}!</p>
+      <p>Статус вашей заявки на участие в конкурсе «<b>{p.get('contest_title')}</b>» изменён:</p>
+      <p style="font-size: 20px; font-weight: bold; color: {status_color};">Заявка {status_label}</p>
+      {comment_html}
+      <p>Подробности можно посмотреть в <a href="{CABINET_URL}" style="color:#6d28d9;">личном кабинете участника</a>.</p>{_footer()}
+    </div>
+    """
+    return f"Статус заявки на конкурс «{p.get('contest_title')}» изменён — ИНДИГО", html
+
+
+def render_application_received_email(p: Dict[str, Any]) -> Tuple[str, str]:
+    '''Письмо о том, что заявка принята к рассмотрению'''
+    html = f"""
+    <div style="font-family: Arial, sans-serif; max-width: 560px; margin: 0 auto;">
+      <h2 style="color: #6d28d9;">Заявка получена!</h2>
+      <p>Здравствуйте, {p.get('full_name')}!</p>
+      <p>Ваша заявка на участие в конкурсе «<b>{p.get('contest_title')}</b>» успешно отправлена и находится на рассмотрении организаторов.</p>
+      <p>Как только заявка будет одобрена, мы пришлём вам уведомление на эту электронную почту.</p>
+      <p>Статус заявки в любой момент можно проверить в <a href="{CABINET_URL}" style="color:#6d28d9;">личном кабинете участника</a>.</p>
+      <p style="color:#6b7280; font-size: 14px; margin-top: 24px;">
+        Если статус заявки не обновится в течение 24 часов, пожалуйста, напишите нам в чат поддержки личного кабинета
+        или на почту <a href="mailto:{SUPPORT_EMAIL}" style="color:#6d28d9;">{SUPPORT_EMAIL}</a>.
+      </p>
+    </div>
+    """
+    return f"Заявка на конкурс «{p.get('contest_title')}» принята к рассмотрению — ИНДИГО", html
+
+
+def render_vk_reject_email(p: Dict[str, Any]) -> Tuple[str, str]:
+    '''Письмо об автоматическом отклонении заявки по итогам проверки ВК'''
+    html = f"""
+    <div style="font-family: Arial, sans-serif; max-width: 560px; margin: 0 auto;">
+      <h2 style="color: #dc2626;">Заявка отклонена</h2>
+      <p>Здравствуйте, {p.get('full_name')}!</p>
+      <p>Ваша заявка на участие в конкурсе «<b>{p.get('contest_title')}</b>» была автоматически отклонена: {p.get('reason_text')}.</p>
+      <p>Пожалуйста, выполните условия участия и подайте заявку заново из <a href="{CABINET_URL}" style="color:#6d28d9;">личного кабинета участника</a>.</p>{_footer()}
+    </div>
+    """
+    return f"Заявка на конкурс «{p.get('contest_title')}» отклонена — ИНДИГО", html
+
+
+def render_reset_code_email(p: Dict[str, Any]) -> Tuple[str, str]:
+    '''Письмо с кодом восстановления пароля'''
+    html = f"""
+    <div style="font-family: Arial, sans-serif; max-width: 480px; margin: 0 auto;">
+      <h2 style="color: #6d28d9;">Восстановление пароля</h2>
+      <p>Здравствуйте, {p.get('full_name')}!</p>
+      <p>Вы запросили сброс пароля в личном кабинете ИНДИГО.</p>
+      <p>Ваш код подтверждения:</p>
+      <div style="background: #f3f4f6; border-radius: 8px; padding: 20px; text-align: center; margin: 20px 0;">
+        <span style="font-size: 36px; font-weight: bold; letter-spacing: 8px; color: #6d28d9;">{p.get('code')}</span>
+      </div>
+      <p style="color: #6b7280; font-size: 14px;">Код действителен 15 минут. Если вы не запрашивали сброс пароля — проигнорируйте это письмо.</p>
+    </div>
+    """
+    return 'Восстановление пароля — ИНДИГО', html
+
+
+def render_contact_email(p: Dict[str, Any]) -> Tuple[str, str]:
+    '''Сообщение с формы обратной связи (уходит на почту организации)'''
+    html = f"""
+    <div style="font-family: Arial, sans-serif; max-width: 600px;">
+      <h2 style="color: #6d28d9;">Новое сообщение с сайта ИНДИГО</h2>
+      <p><b>Имя:</b> {p.get('name')}</p>
+      <p><b>Email:</b> {p.get('email')}</p>
+      <p><b>Тема:</b> {p.get('subject') or '—'}</p>
+      <hr/>
+      <p><b>Сообщение:</b></p>
+      <p style="white-space: pre-wrap;">{p.get('message')}</p>
+    </div>
+    """
+    return f"Обратная связь: {p.get('subject') or 'Без темы'}", html
+
+
+EMAIL_RENDERERS = {
+    'status_email': render_status_email,
+    'application_received_email': render_application_received_email,
+    'vk_reject_email': render_vk_reject_email,
+    'reset_code_email': render_reset_code_email,
+    'contact_email': render_contact_email,
+}
+
+
+def build_email(kind: str, payload: Dict[str, Any], smtp_user: str) -> Tuple[str, MIMEMultipart]:
+    '''Адресат и готовое письмо для строки очереди'''
+    subject, html = EMAIL_RENDERERS[kind](payload)
+    # Обратная связь приходит организаторам на служебный ящик, остальные письма — участнику
+    to_email = smtp_user if kind == 'contact_email' else payload.get('to_email')
+    if not to_email:
+        raise PermanentDeliveryError('Не указан адресат письма')
+
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = Header(subject, 'utf-8')
+    msg['From'] = smtp_user
+    msg['To'] = to_email
+    if kind == 'contact_email' and payload.get('email'):
+        msg['Reply-To'] = payload['email']
+    msg.attach(MIMEText(html, 'html'))
+    return to_email, msg
+
+
+class SmtpSession:
+    '''
+    Одна авторизованная SMTP-сессия на пачку писем и на время жизни тёплого контейнера: TLS-рукопожатие
+    и логин выполняются один раз, а не на каждое письмо. Сессия, простоявшая дольше SMTP_IDLE_SECONDS,
+    проверяется NOOP; после SMTP_MAX_MESSAGES_PER_SESSION писем или обрыва соединения — переподключение.
+    '''
+
+    def __init__(self):
+        self.server = None
+        self.sent_in_session = 0
+        self.last_used = 0.0
+
+    def _connect(self) -> None:
+        smtp_host = os.environ['SMTP_HOST']
+        smtp_port = int(os.environ['SMTP_PORT'])
+        if smtp_port == 465:
+            server = smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=SMTP_TIMEOUT_SECONDS)
+        else:
+            server = smtplib.SMTP(smtp_host, smtp_port, timeout=SMTP_TIMEOUT_SECONDS)
+            server.ehlo()
+            server.starttls()
+            server.ehlo()
+        server.login(os.environ['SMTP_USER'], os.environ['SMTP_PASSWORD'])
+        self.server = server
+        self.sent_in_session = 0
+
+    def _usable(self) -> bool:
+        if self.server is None or self.sent_in_session >= SMTP_MAX_MESSAGES_PER_SESSION:
+            return False
+        if time.monotonic() - self.last_used < SMTP_IDLE_SECONDS:
+            return True
+        try:
+            return self.server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, to_email: str, msg: MIMEMultipart) -> None:
+        if not self._usable():
+            self.close()
+            self._connect()
+        try:
+            self.server.sendmail(os.environ['SMTP_USER'], to_email, msg.as_string())
+        except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError) as e:
+            # Отказ по адресату или по самому письму — не проблема соединения, переподключение не поможет
+            # (SMTPException — подкласс OSError, поэтому отсекаем явно)
+            if isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)):
+                raise
+            self.close()
+            self._connect()
+            self.server.sendmail(os.environ['SMTP_USER'], to_email, msg.as_string())
+        self.sent_in_session += 1
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.server = None
+
+
+# Переживает вызовы в тёплом контейнере
+_smtp = SmtpSession()
+
+
+def send_push(payload: Dict[str, Any]) -> None:
+    '''Отправляет push-уведомление через Expo Push Service; ошибка тикета считается ошибкой доставки'''
+    message = {'to': payload.get('push_token'), 'title': payload.get('title'), 'body': payload.get('body')}
+    if payload.get('data'):
+        message['data'] = payload['data']
+    resp = requests.post(
+        EXPO_PUSH_URL,
+        headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
+        json=message,
+        timeout=10,
+    )
+    resp.raise_for_status()
+    ticket = resp.json().get('data', {})
+    if isinstance(ticket, dict) and ticket.get('status') == 'error':
+        details = ticket.get('details') or {}
+        # Токен удалённого приложения повторять бессмысленно
+        if details.get('error') == 'DeviceNotRegistered':
+            raise PermanentDeliveryError(ticket.get('message') or 'DeviceNotRegistered')
+        raise RuntimeError(ticket.get('message') or 'Expo push error')
+
+
+def claim_batch(conn, limit: int, ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    '''
+    Захват пачки готовых к отправке уведомлений (ids — только указанные строки). Строки, занятые
+    другим диспетчером, пропускаются (SKIP LOCKED); захваченным сдвигается next_attempt_at на время
+    аренды, чтобы блокировка не держалась всё время отправки, а при падении диспетчера строки вернулись в очередь.
+    '''
+    id_filter = ' AND id = ANY(%s)' if ids else ''
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f'''
+            UPDATE {SCHEMA}.notification_outbox o
+            SET attempts = o.attempts + 1,
+                next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+            WHERE o.id IN (
+                SELECT id FROM {SCHEMA}.notification_outbox
+                WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP{id_filter}
+                ORDER BY next_attempt_at, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING o.id, o.kind, o.payload, o.attempts
+        ''', (CLAIM_LEASE_SECONDS, ids, limit) if ids else (CLAIM_LEASE_SECONDS, limit))
+        return sorted(cur.fetchall(), key=lambda r: r['id'])
+
+
+def deliver(row: Dict[str, Any]) -> None:
+    payload = row['payload'] if isinstance(row['payload'], dict) else json.loads(row['payload'] or '{}')
+    kind = row['kind']
+    if kind == 'push':
+        send_push(payload)
+    elif kind in EMAIL_RENDERERS:
+        to_email, msg = build_email(kind, payload, os.environ['SMTP_USER'])
+        try:
+            _smtp.send(to_email, msg)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentDeliveryError(f'Адрес отклонён сервером: {to_email}') from e
+    else:
+        raise PermanentDeliveryError(f'Неизвестный тип уведомления: {kind}')
+
+
+def record_results(conn, results: List[Tuple[int, int, Optional[str], bool]]) -> None:
+    '''
+    Запись итогов пачки одним запросом: (id, attempts, error, permanent). Успешные — sent;
+    неудачные — повтор с экспоненциальной задержкой или failed, если попытки исчерпаны.
+    '''
+    if not results:
+        return
+    rows = []
+    for row_id, attempts, error, permanent in results:
+        if error is None:
+            rows.append((row_id, 'sent', 0, None))
+        elif permanent or attempts >= MAX_ATTEMPTS:
+            rows.append((row_id, 'failed', 0, error[:1000]))
+        else:
+            rows.append((row_id, 'pending', BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), error[:1000]))
+
+    with conn.cursor() as cur:
+        execute_values(cur, f'''
+            UPDATE {SCHEMA}.notification_outbox o
+            SET status = v.status,
+                last_error = v.error,
+                sent_at = CASE WHEN v.status = 'sent' THEN CURRENT_TIMESTAMP ELSE o.sent_at END,
+                next_attempt_at = CASE WHEN v.status = 'pending'
+                                       THEN CURRENT_TIMESTAMP + make_interval(secs => v.delay)
+                                       ELSE o.next_attempt_at END
+            FROM (VALUES %s) AS v(id, status, delay, error)
+            WHERE o.id = v.id
+        ''', rows, template='(%s, %s, %s::int, %s::text)', page_size=len(rows))
+
+
+def dispatch(conn, priority_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+    '''
+    Отправка очереди пачками, пока она не опустеет или не выйдет отведённое время.
+    priority_ids отправляются первой пачкой (письмо, которого ждёт пользователь, не стоит в общей очереди).
+    more=True — время вышло, а в очереди ещё есть готовые к отправке строки.
+    '''
+    started = time.monotonic()
+    stats = {'sent': 0, 'retry': 0, 'failed': 0, 'more': False}
+    while True:
+        if time.monotonic() - started >= DISPATCH_TIME_BUDGET_SECONDS:
+            stats['more'] = True
+            break
+        batch = claim_batch(conn, DISPATCH_BATCH_SIZE, priority_ids)
+        if priority_ids:
+            priority_ids = None
+            if not batch:
+                continue
+        if not batch:
+            break
+        results = []
+        for row in batch:
+            try:
+                deliver(row)
+                results.append((row['id'], row['attempts'], None, False))
+                stats['sent'] += 1
+            except PermanentDeliveryError as e:
+                print(f"[OUTBOX FAILED] id={row['id']} kind={row['kind']} error={e}")
+                results.append((row['id'], row['attempts'], str(e), True))
+                stats['failed'] += 1
+            except Exception as e:
+                print(f"[OUTBOX RETRY] id={row['id']} kind={row['kind']} attempt={row['attempts']} error={e}")
+                results.append((row['id'], row['attempts'], str(e) or e.__class__.__name__, False))
+                if row['attempts'] >= MAX_ATTEMPTS:
+                    stats['failed'] += 1
+                else:
+                    stats['retry'] += 1
+        record_results(conn, results)
+    return stats
+
+
+def kick_self() -> None:
+    '''Продолжение разбора очереди новым вызовом, когда время текущего вышло; ответа не ждём'''
+    url = os.environ.get('NOTIFICATION_DISPATCHER_URL')
+    if not url:
+        return
+    try:
+        requests.post(url, headers={'X-Api-Key': os.environ.get('ADMIN_API_KEY', '')}, timeout=SELF_KICK_TIMEOUT)
+    except requests.RequestException:
+        pass
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Диспетчер очереди уведомлений notification_outbox (письма и push).
+    Вызывается по расписанию (.github/workflows/notification-dispatcher.yml, раз в 5 минут — повторы
+    с задержкой и всё, что не успели разобрать) и «будится» функциями, поставившими уведомления в очередь.
+    Если время вызова вышло, а очередь не пуста, диспетчер сам вызывает себя снова (NOTIFICATION_DISPATCHER_URL).
+    POST / — отправить готовые к отправке уведомления, вернуть {sent, retry, failed, more}
+             (body: {ids} — эти строки отправить первыми)
+    GET  / — сводка очереди по статусам
+    Требует X-Api-Key (ADMIN_API_KEY).
+    '''
+    method = event.get('httpMethod', 'POST')
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Api-Key',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    expected_key = os.environ.get('ADMIN_API_KEY')
+    headers = event.get('headers') or {}
+    provided_key = headers.get('X-Api-Key') or headers.get('x-api-key')
+    if not expected_key or provided_key != expected_key:
+        return {
+            'statusCode': 401,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Требуется X-Api-Key'})
+        }
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    try:
+        if method == 'GET':
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(f'''
+                    SELECT status, COUNT(*) AS count, MIN(created_at) AS oldest
+                    FROM {SCHEMA}.notification_outbox
+                    GROUP BY status
+                ''')
+                summary = {
+                    row['status']: {'count': row['count'], 'oldest': row['oldest'].isoformat() if row['oldest'] else None}
+                    for row in cur.fetchall()
+                }
+            return {
+                'statusCode': 200,
+                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+                'body': json.dumps({'queue': summary})
+            }
+
+        body = json.loads(event.get('body') or '{}')
+        priority_ids = [int(i) for i in body.get('ids') or []]
+        stats = dispatch(conn, priority_ids)
+        if stats['more']:
+            kick_self()
+        return {
+            'statusCode': 200,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps(stats)
+        }
+    finally:
+        conn.close()
@@ -188,7 +188,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         INSERT INTO {SCHEMA}.participants (full_name, contact_position, email, phone, vk_link, city, password_hash)
                         VALUES (%s, %s, %s, %s, %s, %s, %s)
                         ON CONFLICT (email)
-                        DO UPDATE SET full_name = EXCLUDED.full_name, contact_position = EXCLUDED.contact_position, phone = EXCLUDED.phone, vk_link = EXCLUDED.vk_link, city = EXCLUDED.city, password_hash = EXCLUDED.password_hash
+                        DO UPDATE SET full_name = EXCLUDED.full_name, contact_position = EXCLUDED.contact_position, phone = EXCLUDED.phone, vk_link = EXCLUDED.vk_link, city = EXCLUDED.city, password_hash = EXCLUDED.password_hash, vk_user_id = NULL, vk_user_id_link = NULL
                         RETURNING id, full_name, contact_position, email, phone, vk_link, city
                         ''',
                         (full_name, contact_position, email, phone, vk_link, city, password_hash)
@@ -382,7 +382,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 if vk_link and not is_valid_vk_link(vk_link):
                     return {'statusCode': 400, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Введите корректную ссылку на профиль ВК, например: https://vk.com/username'}), 'isBase64Encoded': False}
                 with conn.cursor() as cur:
-                    cur.execute(f'UPDATE {SCHEMA}.participants SET vk_link = %s WHERE id = %s', (vk_link, pid))
+                    cur.execute(f'UPDATE {SCHEMA}.participants SET vk_link = %s, vk_user_id = NULL, vk_user_id_link = NULL WHERE id = %s', (vk_link, pid))
                     if cur.rowcount == 0:
                         return {'statusCode': 404, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Участник не найден'}), 'isBase64Encoded': False}
                 return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'success': True, 'vk_link': vk_link}), 'isBase64Encoded': False}
@@ -2,15 +2,14 @@ import json
 import os
 import random
 import string
-import smtplib
 import hashlib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import urllib.request
 from datetime import datetime, timedelta
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
 SCHEMA = os.environ.get('MAIN_DB_SCHEMA', 't_p73771717_multi_page_site_proj')
+RESET_EMAIL_DISPATCH_TIMEOUT = 15
 
 
 def hash_password(password: str) -> str:
@@ -21,45 +20,22 @@ def generate_code() -> str:
     return ''.join(random.choices(string.digits, k=6))
 
 
-def send_email(to_email: str, code: str, full_name: str):
-    smtp_host = os.environ['SMTP_HOST']
-    smtp_port = int(os.environ['SMTP_PORT'])
-    smtp_user = os.environ['SMTP_USER']
-    smtp_password = os.environ['SMTP_PASSWORD']
-
-    msg = MIMEMultipart('alternative')
-    from email.header import Header
-    msg['Subject'] = Header('Восстановление пароля — ИНДИГО', 'utf-8')
-    msg['From'] = smtp_user
-    msg['To'] = to_email
-
-    html = f"""
-    <div style="font-family: Arial, sans-serif; max-width: 480px; margin: 0 auto;">
-      <h2 style="color: #6d28d9;">Восстановление пароля</h2>
-      <p>Здравствуйте, {full_name}!</p>
-      <p>Вы запросили сброс пароля в личном кабинете ИНДИГО.</p>
-      <p>Ваш код подтверждения:</p>
-      <div style="background: #f3f4f6; border-radius: 8px; padding: 20px; text-align: center; margin: 20px 0;">
-        <span style="font-size: 36px; font-weight: bold; letter-spacing: 8px; color: #6d28d9;">{code}</span>
-      </div>
-      <p style="color: #6b7280; font-size: 14px;">Код действителен 15 минут. Если вы не запрашивали сброс пароля — проигнорируйте это письмо.</p>
-    </div>
-    """
-    msg.attach(MIMEText(html, 'html'))
-
-    print(f'[SMTP] Connecting to {smtp_host}:{smtp_port}')
-    if smtp_port == 465:
-        with smtplib.SMTP_SSL(smtp_host, smtp_port) as server:
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, to_email, msg.as_string())
-    else:
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, to_email, msg.as_string())
-    print(f'[SMTP] Email sent to {to_email}')
+def dispatch_notification(outbox_id: int) -> None:
+    '''
+    Просит диспетчер очереди отправить письмо с кодом сразу, первым, и ждёт окончания вызова —
+    чтобы ответить пользователю, ушло ли письмо. Если диспетчер недоступен, письмо уйдёт по расписанию.
+    '''
+    url = os.environ.get('NOTIFICATION_DISPATCHER_URL')
+    if not url:
+        return
+    request = urllib.request.Request(
+        url, data=json.dumps({'ids': [outbox_id]}).encode(), method='POST',
+        headers={'Content-Type': 'application/json', 'X-Api-Key': os.environ.get('ADMIN_API_KEY', '')},
+    )
+    try:
+        urllib.request.urlopen(request, timeout=RESET_EMAIL_DISPATCH_TIMEOUT)
+    except Exception as e:
+        print(f'[RESET] dispatcher call failed: {e}')
 
 
 def handler(event: dict, context) -> dict:
@@ -102,25 +78,36 @@ def handler(event: dict, context) -> dict:
             code = generate_code()
             expires_at = datetime.utcnow() + timedelta(minutes=15)
 
+            # Код и письмо с ним (через очередь уведомлений) сохраняются одним запросом
             cur.execute(
-                f'UPDATE {SCHEMA}.participants SET reset_code = %s, reset_code_expires_at = %s WHERE id = %s',
-                (code, expires_at, participant['id'])
+                f'''
+                WITH updated AS (
+                    UPDATE {SCHEMA}.participants SET reset_code = %s, reset_code_expires_at = %s WHERE id = %s
+                    RETURNING id
+                )
+                INSERT INTO {SCHEMA}.notification_outbox (kind, payload)
+                SELECT 'reset_code_email', %s FROM updated
+                RETURNING id
+                ''',
+                (code, expires_at, participant['id'], json.dumps({
+                    'to_email': participant['email'], 'full_name': participant['full_name'], 'code': code,
+                }, ensure_ascii=False))
             )
+            outbox_id = cur.fetchone()['id']
+            dispatch_notification(outbox_id)
 
-            try:
-                send_email(participant['email'], code, participant['full_name'])
-            except Exception as smtp_err:
-                print(f'[SMTP ERROR] {smtp_err}')
-                return {
-                    'statusCode': 500,
-                    'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                    'body': json.dumps({'error': f'Ошибка отправки письма: {smtp_err}'})
-                }
+            cur.execute(f'SELECT status, last_error FROM {SCHEMA}.notification_outbox WHERE id = %s', (outbox_id,))
+            outbox = cur.fetchone()
+            if outbox['status'] == 'failed' or (outbox['status'] == 'pending' and outbox['last_error']):
+                # Пользователь запросит код заново — повтор старого письма из очереди только запутает
+                cur.execute(f"UPDATE {SCHEMA}.notification_outbox SET status = 'failed' WHERE id = %s AND status = 'pending'", (outbox_id,))
+                return {'statusCode': 500, 'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}, 'body': json.dumps({'error': 'Не удалось отправить письмо. Попробуйте позже'})}
+            message = 'Код отправлен на email' if outbox['status'] == 'sent' else 'Код будет отправлен на email в течение нескольких минут'
 
             return {
                 'statusCode': 200,
                 'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'success': True, 'message': 'Код отправлен на email'})
+                'body': json.dumps({'success': True, 'message': message})
             }
 
         elif action == 'confirm':
@@ -0,0 +1,11 @@
+-- Звание, сумма баллов и признак завершённости оценивания хранятся в строке программы
+-- и пересчитываются при изменении оценок, назначений жюри и системы оценивания
+ALTER TABLE t_p73771717_multi_page_site_proj.contest_program
+    ADD COLUMN IF NOT EXISTS award TEXT NOT NULL DEFAULT '',
+    ADD COLUMN IF NOT EXISTS total_score NUMERIC(7,2) NULL,
+    ADD COLUMN IF NOT EXISTS all_scored BOOLEAN NOT NULL DEFAULT FALSE,
+    ADD COLUMN IF NOT EXISTS award_computed_at TIMESTAMP NULL;
+
+-- Проверка диплома ищет строку по UPPER(diploma_number)
+CREATE INDEX IF NOT EXISTS idx_contest_program_diploma_number_upper
+    ON t_p73771717_multi_page_site_proj.contest_program (UPPER(diploma_number));
@@ -0,0 +1,12 @@
+-- Сквозная нумерация дипломов из последовательности вместо MAX(...) + 1 по всей contest_program
+CREATE SEQUENCE IF NOT EXISTS t_p73771717_multi_page_site_proj.diploma_number_seq;
+
+SELECT setval(
+    't_p73771717_multi_page_site_proj.diploma_number_seq',
+    COALESCE((
+        SELECT MAX(CAST(SUBSTRING(diploma_number FROM 3) AS INTEGER))
+        FROM t_p73771717_multi_page_site_proj.contest_program
+        WHERE diploma_number ~ '^[A-Z]{2}[0-9]{6}$'
+    ), 0) + 1,
+    false
+);
@@ -0,0 +1,3 @@
+-- Версия набора полей шаблона диплома: увеличивается при каждом сохранении полей
+ALTER TABLE t_p73771717_multi_page_site_proj.diploma_templates
+    ADD COLUMN IF NOT EXISTS fields_version INTEGER NOT NULL DEFAULT 0;
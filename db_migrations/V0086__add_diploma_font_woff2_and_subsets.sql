@@ -0,0 +1,17 @@
+-- WOFF2-версия загруженного шрифта диплома и кэш подмножеств глифов по (шрифт, шаблон)
+ALTER TABLE t_p73771717_multi_page_site_proj.diploma_fonts
+    ADD COLUMN IF NOT EXISTS woff2_url TEXT NOT NULL DEFAULT '';
+
+CREATE TABLE IF NOT EXISTS t_p73771717_multi_page_site_proj.diploma_font_subsets (
+    id SERIAL PRIMARY KEY,
+    font_id INTEGER NOT NULL,
+    template_id INTEGER NOT NULL,
+    fields_version INTEGER NOT NULL DEFAULT 0,
+    subset_url TEXT NOT NULL DEFAULT '',
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    UNIQUE (font_id, template_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_diploma_font_subsets_template_id
+    ON t_p73771717_multi_page_site_proj.diploma_font_subsets(template_id);
@@ -0,0 +1,4 @@
+-- Уменьшенные варианты подложки шаблона диплома: превью для конструктора и версия для печати
+ALTER TABLE t_p73771717_multi_page_site_proj.diploma_templates
+    ADD COLUMN IF NOT EXISTS background_preview_url TEXT NOT NULL DEFAULT '',
+    ADD COLUMN IF NOT EXISTS background_print_url TEXT NOT NULL DEFAULT '';
@@ -0,0 +1,3 @@
+-- Постраничная выдача программы конкурса по ключу (order_number, id)
+CREATE INDEX IF NOT EXISTS idx_contest_program_contest_order
+    ON t_p73771717_multi_page_site_proj.contest_program (contest_id, order_number, id);
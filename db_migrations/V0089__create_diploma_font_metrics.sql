@@ -0,0 +1,7 @@
+-- Кэш метрик шрифтов дипломов (ширины глифов и кернинг) для подбора размера текста без растеризации.
+-- font_key: 'font:<id>' для загруженных шрифтов, 'google:<семейство>:<вес>' для стандартных
+CREATE TABLE IF NOT EXISTS t_p73771717_multi_page_site_proj.diploma_font_metrics (
+    font_key TEXT PRIMARY KEY,
+    metrics TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
@@ -0,0 +1,9 @@
+-- Постраничная выдача заявок в админке по ключу (submitted_at, id), в том числе в рамках конкурса
+CREATE INDEX IF NOT EXISTS idx_applications_submitted_id
+    ON t_p73771717_multi_page_site_proj.applications (submitted_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_applications_contest_submitted_id
+    ON t_p73771717_multi_page_site_proj.applications (contest_id, submitted_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_application_files_application_id
+    ON t_p73771717_multi_page_site_proj.application_files (application_id);
@@ -0,0 +1,23 @@
+-- Серверный поиск заявок в админке: триграммные индексы под ILIKE '%...%'
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_participants_full_name_trgm
+    ON t_p73771717_multi_page_site_proj.participants USING gin (full_name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_participants_email_trgm
+    ON t_p73771717_multi_page_site_proj.participants USING gin (email gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_participants_phone_trgm
+    ON t_p73771717_multi_page_site_proj.participants USING gin (phone gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_participants_city_trgm
+    ON t_p73771717_multi_page_site_proj.participants USING gin (city gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_applications_performance_title_trgm
+    ON t_p73771717_multi_page_site_proj.applications USING gin (performance_title gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_applications_nomination_trgm
+    ON t_p73771717_multi_page_site_proj.applications USING gin (nomination gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_nominations_name_trgm
+    ON t_p73771717_multi_page_site_proj.nominations USING gin (name gin_trgm_ops);
@@ -0,0 +1,19 @@
+-- Очередь исходящих уведомлений (письма, push): пишется в той же транзакции, что и изменение данных
+CREATE TABLE IF NOT EXISTS t_p73771717_multi_page_site_proj.notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(30) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+COMMENT ON COLUMN t_p73771717_multi_page_site_proj.notification_outbox.kind IS 'Тип уведомления: status_email, push и т.п.';
+COMMENT ON COLUMN t_p73771717_multi_page_site_proj.notification_outbox.status IS 'pending — ждёт отправки, sent — отправлено, failed — исчерпаны попытки';
+
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending
+    ON t_p73771717_multi_page_site_proj.notification_outbox (next_attempt_at, id)
+    WHERE status = 'pending';
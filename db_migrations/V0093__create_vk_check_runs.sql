@@ -0,0 +1,17 @@
+-- Прогоны проверки ВК по конкурсу: прогресс и аренда для продолжения после таймаута функции
+CREATE TABLE IF NOT EXISTS t_p73771717_multi_page_site_proj.vk_check_runs (
+    contest_id INTEGER PRIMARY KEY REFERENCES t_p73771717_multi_page_site_proj.contests(id),
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    auto_reject BOOLEAN NOT NULL DEFAULT FALSE,
+    reject_comment TEXT,
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0,
+    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+    locked_until TIMESTAMP
+);
+
+COMMENT ON COLUMN t_p73771717_multi_page_site_proj.vk_check_runs.status IS 'running — проверка не завершена (продолжается повторным вызовом run_check), done — завершена';
+COMMENT ON COLUMN t_p73771717_multi_page_site_proj.vk_check_runs.locked_until IS 'Аренда выполняющегося вызова run_check; пока не истекла, параллельный запуск отклоняется';
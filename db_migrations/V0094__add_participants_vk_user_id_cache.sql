@@ -0,0 +1,5 @@
+-- Сохранённый id пользователя ВК, полученный через utils.resolveScreenName, чтобы не резолвить ссылку при каждой проверке
+ALTER TABLE t_p73771717_multi_page_site_proj.participants ADD COLUMN IF NOT EXISTS vk_user_id BIGINT;
+ALTER TABLE t_p73771717_multi_page_site_proj.participants ADD COLUMN IF NOT EXISTS vk_user_id_link TEXT;
+
+COMMENT ON COLUMN t_p73771717_multi_page_site_proj.participants.vk_user_id_link IS 'Значение vk_link, из которого получен vk_user_id; если ссылка изменилась, id считается недействительным';
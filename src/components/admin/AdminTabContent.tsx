@@ -33,11 +33,16 @@ interface AdminTabContentProps {
   setContestFilter: (filter: string) => void;
   contests: any[];
   handleUpdateStatus: (id: number, status: string, adminComment?: string) => Promise<void>;
+  handleBulkUpdateStatus: (ids: number[], status: string) => Promise<boolean>;
   handleDeleteApplication: (id: number) => Promise<void>;
   handleToggleEditingLock: (id: number, locked: boolean) => Promise<void>;
   handleToggleContestLock: (contestId: number, locked: boolean) => Promise<void>;
   handleUpdateFields: (payload: Record<string, unknown>) => Promise<boolean>;
   loadApplications: () => void;
+  applicationsTotal: number;
+  hasMoreApplications: boolean;
+  applicationsLoadingMore: boolean;
+  loadMoreApplications: () => void;
 
   handleCreateClick: () => void;
   openEditModal: (contest: any) => void;
@@ -87,11 +92,16 @@ const AdminTabContent = ({
   setContestFilter,
   contests,
   handleUpdateStatus,
+  handleBulkUpdateStatus,
   handleDeleteApplication,
   handleToggleEditingLock,
   handleToggleContestLock,
   handleUpdateFields,
   loadApplications,
+  applicationsTotal,
+  hasMoreApplications,
+  applicationsLoadingMore,
+  loadMoreApplications,
   handleCreateClick,
   openEditModal,
   handleDeleteContest,
@@ -143,11 +153,16 @@ const AdminTabContent = ({
           setContestFilter={setContestFilter}
           contests={contests}
           onUpdateStatus={handleUpdateStatus}
+          onBulkUpdateStatus={handleBulkUpdateStatus}
           onDeleteApplication={handleDeleteApplication}
           onToggleEditingLock={handleToggleEditingLock}
           onToggleContestLock={handleToggleContestLock}
           onUpdateFields={handleUpdateFields}
           onRefresh={loadApplications}
+          total={applicationsTotal}
+          hasMore={hasMoreApplications}
+          loadingMore={applicationsLoadingMore}
+          onLoadMore={loadMoreApplications}
         />
       );
 
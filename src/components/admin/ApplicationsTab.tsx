@@ -1,6 +1,7 @@
-import { useState, useMemo, useCallback } from 'react';
+import { useState, useCallback, useEffect } from 'react';
 import { Card } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
+import { Checkbox } from '@/components/ui/checkbox';
 import Icon from '@/components/ui/icon';
 import RejectApplicationDialog from './RejectApplicationDialog';
 import MaintenanceNoticeSettings from './MaintenanceNoticeSettings';
@@ -11,6 +12,7 @@ import { ApplicationEditPayload } from './applications/ApplicationEditForm';
 import { adminHeaders } from '@/config/adminApi';
 
 const CONTESTS_API = 'https://functions.poehali.dev/53be7002-a84e-4d38-9e81-96d7078f25b3';
+const APPLICATIONS_API = 'https://functions.poehali.dev/27d46d11-5402-4428-b786-4d2eb3aace8b';
 
 interface ApplicationsTabProps {
   applications: Application[];
@@ -23,11 +25,16 @@ interface ApplicationsTabProps {
   setContestFilter: (filter: string) => void;
   contests: any[];
   onUpdateStatus: (applicationId: number, newStatus: string, adminComment?: string) => void;
+  onBulkUpdateStatus: (applicationIds: number[], newStatus: string) => Promise<boolean>;
   onDeleteApplication: (applicationId: number) => void;
   onToggleEditingLock: (applicationId: number, locked: boolean) => void;
   onToggleContestLock: (contestId: number, locked: boolean) => void;
   onUpdateFields: (payload: ApplicationEditPayload) => Promise<boolean>;
   onRefresh?: () => void;
+  total?: number;
+  hasMore?: boolean;
+  loadingMore?: boolean;
+  onLoadMore?: () => void;
 }
 
 const ApplicationsTab = ({
@@ -40,17 +47,71 @@ const ApplicationsTab = ({
   contestFilter,
   setContestFilter,
   onUpdateStatus,
+  onBulkUpdateStatus,
   onDeleteApplication,
   onToggleEditingLock,
   onToggleContestLock,
   onUpdateFields,
   onRefresh,
+  total,
+  hasMore = false,
+  loadingMore = false,
+  onLoadMore,
 }: ApplicationsTabProps) => {
   const [expandedId, setExpandedId] = useState<number | null>(null);
   const [editingId, setEditingId] = useState<number | null>(null);
   const [savingEdit, setSavingEdit] = useState(false);
   const [fieldDefsByContest, setFieldDefsByContest] = useState<Record<number, CustomFieldDef[]>>({});
   const [rejectDialog, setRejectDialog] = useState<{ appId: number; status: 'rejected' | 'pending' } | null>(null);
+  const [exporting, setExporting] = useState<'csv' | 'xlsx' | null>(null);
+  const [selectedIds, setSelectedIds] = useState<Set<number>>(new Set());
+  const [bulkSaving, setBulkSaving] = useState(false);
+
+  // Смена фильтра, конкурса или поиска меняет список — выбранными остаются только видимые заявки,
+  // чтобы массовое действие не задело скрытые
+  useEffect(() => {
+    setSelectedIds(prev => {
+      const visible = new Set(applications.map(app => app.id));
+      const next = new Set([...prev].filter(id => visible.has(id)));
+      return next.size === prev.size ? prev : next;
+    });
+  }, [applications]);
+
+  const toggleSelect = (appId: number) => {
+    setSelectedIds(prev => {
+      const next = new Set(prev);
+      if (next.has(appId)) next.delete(appId);
+      else next.add(appId);
+      return next;
+    });
+  };
+
+  const allSelected = applications.length > 0 && applications.every(app => selectedIds.has(app.id));
+
+  const handleBulkStatus = async (newStatus: string) => {
+    setBulkSaving(true);
+    const ids = applications.filter(app => selectedIds.has(app.id)).map(app => app.id);
+    const success = await onBulkUpdateStatus(ids, newStatus);
+    setBulkSaving(false);
+    if (success) setSelectedIds(new Set());
+  };
+
+  const handleExport = async (format: 'csv' | 'xlsx') => {
+    setExporting(format);
+    try {
+      const params = new URLSearchParams({ action: 'export', format });
+      if (statusFilter !== 'all') params.append('status', statusFilter);
+      if (contestFilter !== 'all') params.append('contest_id', contestFilter);
+      if (searchQuery.trim()) params.append('search', searchQuery.trim());
+      const res = await fetch(`${APPLICATIONS_API}?${params}`, { headers: adminHeaders() });
+      const data = await res.json();
+      if (data.url) window.open(data.url, '_blank');
+    } catch (error) {
+      console.error('Ошибка выгрузки заявок:', error);
+    } finally {
+      setExporting(null);
+    }
+  };
 
   const loadFieldDefs = useCallback(async (contestId: number) => {
     if (fieldDefsByContest[contestId]) return;
@@ -87,21 +148,19 @@ const ApplicationsTab = ({
     }
   };
 
-  const filteredApplications = useMemo(() => {
-    return applications.filter(
-      (app) =>
-        searchQuery === '' ||
-        app.full_name.toLowerCase().includes(searchQuery.toLowerCase()) ||
-        app.email.toLowerCase().includes(searchQuery.toLowerCase()) ||
-        app.id.toString().includes(searchQuery)
-    );
-  }, [applications, searchQuery]);
-
   return (
     <>
       <MaintenanceNoticeSettings />
 
-      <div className="flex justify-end mb-4">
+      <div className="flex justify-end gap-2 mb-4">
+        <Button variant="outline" onClick={() => handleExport('csv')} disabled={exporting !== null}>
+          <Icon name={exporting === 'csv' ? 'Loader2' : 'FileText'} size={16} className={`mr-2 ${exporting === 'csv' ? 'animate-spin' : ''}`} />
+          CSV
+        </Button>
+        <Button variant="outline" onClick={() => handleExport('xlsx')} disabled={exporting !== null}>
+          <Icon name={exporting === 'xlsx' ? 'Loader2' : 'FileSpreadsheet'} size={16} className={`mr-2 ${exporting === 'xlsx' ? 'animate-spin' : ''}`} />
+          Excel
+        </Button>
         <Button variant="outline" onClick={onRefresh} disabled={loading}>
           <Icon name="RefreshCw" size={16} className={`mr-2 ${loading ? 'animate-spin' : ''}`} />
           Обновить
@@ -127,7 +186,7 @@ const ApplicationsTab = ({
           />
           <p className="text-muted-foreground">Загрузка заявок...</p>
         </Card>
-      ) : filteredApplications.length === 0 ? (
+      ) : applications.length === 0 ? (
         <Card className="p-12 text-center">
           <Icon
             name="Inbox"
@@ -138,10 +197,35 @@ const ApplicationsTab = ({
         </Card>
       ) : (
         <div className="space-y-4">
-          {filteredApplications.map((app) => (
+          <Card className="p-4 flex items-center justify-between flex-wrap gap-3">
+            <label className="flex items-center gap-2 text-sm cursor-pointer">
+              <Checkbox
+                checked={allSelected}
+                onCheckedChange={(checked) =>
+                  setSelectedIds(checked ? new Set(applications.map(app => app.id)) : new Set())
+                }
+              />
+              {selectedIds.size > 0 ? `Выбрано: ${selectedIds.size}` : 'Выбрать все'}
+            </label>
+            {selectedIds.size > 0 && (
+              <div className="flex gap-2">
+                <Button size="sm" onClick={() => handleBulkStatus('approved')} disabled={bulkSaving}>
+                  <Icon name={bulkSaving ? 'Loader2' : 'Check'} size={14} className={`mr-1.5 ${bulkSaving ? 'animate-spin' : ''}`} />
+                  Одобрить выбранные
+                </Button>
+                <Button size="sm" variant="outline" onClick={() => handleBulkStatus('rejected')} disabled={bulkSaving}>
+                  <Icon name="X" size={14} className="mr-1.5" />
+                  Отклонить выбранные
+                </Button>
+              </div>
+            )}
+          </Card>
+          {applications.map((app) => (
             <ApplicationCard
               key={app.id}
               app={app}
+              selected={selectedIds.has(app.id)}
+              onToggleSelect={toggleSelect}
               expandedId={expandedId}
               editingId={editingId}
               savingEdit={savingEdit}
@@ -160,8 +244,17 @@ const ApplicationsTab = ({
         </div>
       )}
 
+      {hasMore && onLoadMore && (
+        <div className="mt-6 text-center">
+          <Button variant="outline" onClick={onLoadMore} disabled={loadingMore}>
+            <Icon name={loadingMore ? 'Loader2' : 'ChevronDown'} size={16} className={`mr-2 ${loadingMore ? 'animate-spin' : ''}`} />
+            Показать ещё
+          </Button>
+        </div>
+      )}
+
       <div className="mt-6 text-center text-sm text-muted-foreground">
-        Показано заявок: {filteredApplications.length} из {applications.length}
+        Показано заявок: {applications.length}{total !== undefined && total > applications.length ? ` из ${total}` : ''}
       </div>
 
       <RejectApplicationDialog
@@ -49,49 +49,40 @@ const ContestProgramTab = ({ contests }: ContestProgramTabProps) => {
     const reader = new FileReader();
     reader.onload = async (evt) => {
       try {
-        const data = new Uint8Array(evt.target?.result as ArrayBuffer);
-        const wb = XLSX.read(data, { type: 'array' });
-        const ws = wb.Sheets[wb.SheetNames[0]];
-        const rawRows = XLSX.utils.sheet_to_json<string[]>(ws, { header: 1 }) as unknown[][];
-
-        const dataRows = rawRows.slice(1).filter(r => Array.isArray(r) && r.some(cell => cell !== undefined && cell !== ''));
-
-        if (dataRows.length === 0) {
-          toast({ title: 'Файл пуст', description: 'Не найдено строк для импорта', variant: 'destructive' });
-          return;
+        let fileName = file.name;
+        let data = new Uint8Array(evt.target?.result as ArrayBuffer);
+        // Старый формат .xls сервер не читает — переводим первый лист в CSV на клиенте
+        if (/\.xls$/i.test(fileName)) {
+          const wb = XLSX.read(data, { type: 'array' });
+          const csv = XLSX.utils.sheet_to_csv(wb.Sheets[wb.SheetNames[0]], { FS: ';' });
+          data = new TextEncoder().encode(csv);
+          fileName = fileName.replace(/\.xls$/i, '.csv');
         }
+        let binary = '';
+        data.forEach(b => { binary += String.fromCharCode(b); });
 
-        let imported = 0;
-        const newRows: ProgramRow[] = [];
-        for (const r of dataRows) {
-          const row = r as (string | number)[];
-          const payload = {
+        const res = await fetch(`${API_URL}?action=import_program`, {
+          method: 'POST',
+          headers: adminHeaders(),
+          body: JSON.stringify({
             contest_id: Number(selectedContestId),
-            order_number: Number(row[0]) || (rows.length + imported + 1),
-            region: String(row[1] ?? ''),
-            directing_party: String(row[2] ?? ''),
-            participant_name: String(row[3] ?? ''),
-            director_name: String(row[4] ?? ''),
-            age: String(row[5] ?? ''),
-            nomination: String(row[6] ?? ''),
-            piece_title: String(row[7] ?? ''),
-            duration: String(row[8] ?? ''),
-            participation_format: String(row[9] ?? ''),
-          };
-          const res = await fetch(API_URL, {
-            method: 'POST',
-            headers: adminHeaders(),
-            body: JSON.stringify(payload),
-          });
-          const result = await res.json();
-          if (result.row) {
-            newRows.push(result.row);
-            imported++;
-          }
+            file_base64: btoa(binary),
+            file_name: fileName,
+          }),
+        });
+        const result = await res.json();
+
+        if (!res.ok) {
+          const details = (result.errors || [])
+            .slice(0, 3)
+            .map((err: { line: number; error: string }) => `стр. ${err.line}: ${err.error}`)
+            .join('; ');
+          toast({ title: 'Ошибка импорта', description: details || result.error || 'Не удалось импортировать файл', variant: 'destructive' });
+          return;
         }
 
-        setRows(prev => [...prev, ...newRows]);
-        toast({ title: 'Импорт завершён', description: `Добавлено строк: ${imported}` });
+        await loadProgram(selectedContestId);
+        toast({ title: 'Импорт завершён', description: `Добавлено строк: ${result.imported}` });
       } catch {
         toast({ title: 'Ошибка', description: 'Не удалось прочитать файл', variant: 'destructive' });
       }
@@ -12,6 +12,11 @@ import { useToast } from '@/hooks/use-toast';
 import { adminHeaders } from '@/config/adminApi';
 
 const VK_CHECK_URL = 'https://functions.poehali.dev/27d46d11-5402-4428-b786-4d2eb3aace8b?endpoint=vk_check';
+// Повтор run_check без прогресса (ошибки ВК): пауза растёт вдвое, после RUN_CHECK_MAX_STALLED попыток останавливаемся
+const RUN_CHECK_RETRY_DELAY_MS = 2000;
+const RUN_CHECK_MAX_STALLED = 3;
+
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
 
 interface Contest {
   id: number;
@@ -40,6 +45,15 @@ interface PostInfo {
   updated_at: string;
 }
 
+interface RunCheckResponse {
+  status?: 'running' | 'done';
+  processed: number;
+  checked: number;
+  total_with_vk_link: number;
+  rejected?: number;
+  error?: string;
+}
+
 interface VkCheckTabProps {
   contests: Contest[];
 }
@@ -62,6 +76,7 @@ const VkCheckTab = ({ contests }: VkCheckTabProps) => {
   const [loading, setLoading] = useState(false);
   const [savingPost, setSavingPost] = useState(false);
   const [checking, setChecking] = useState(false);
+  const [progress, setProgress] = useState<{ processed: number; total: number } | null>(null);
   const [autoReject, setAutoReject] = useState(false);
   const [rejectComment, setRejectComment] = useState('');
 
@@ -118,19 +133,40 @@ const VkCheckTab = ({ contests }: VkCheckTabProps) => {
   const handleRunCheck = async () => {
     if (!selectedContestId) return;
     setChecking(true);
+    setProgress(null);
     try {
-      const res = await fetch(`${VK_CHECK_URL}&action=run_check`, {
-        method: 'POST',
-        headers: adminHeaders(),
-        body: JSON.stringify({
-          contest_id: Number(selectedContestId),
-          auto_reject: autoReject,
-          reject_comment: rejectComment.trim(),
-        }),
-      });
-      const data = await res.json();
-      if (!res.ok) {
-        toast({ title: 'Ошибка', description: data.error || 'Не удалось выполнить проверку', variant: 'destructive' });
+      // Сервер проверяет участников порциями в пределах лимита времени функции:
+      // пока прогон не завершён, вызываем run_check повторно — он продолжит с того же места
+      let data: RunCheckResponse;
+      let lastProcessed = -1;
+      let stalled = 0;
+      do {
+        if (stalled > 0) await sleep(RUN_CHECK_RETRY_DELAY_MS * 2 ** (stalled - 1));
+        const res = await fetch(`${VK_CHECK_URL}&action=run_check`, {
+          method: 'POST',
+          headers: adminHeaders(),
+          body: JSON.stringify({
+            contest_id: Number(selectedContestId),
+            auto_reject: autoReject,
+            reject_comment: rejectComment.trim(),
+          }),
+        });
+        data = await res.json();
+        if (!res.ok) {
+          toast({ title: 'Ошибка', description: data.error || 'Не удалось выполнить проверку', variant: 'destructive' });
+          return;
+        }
+        setProgress({ processed: data.processed, total: data.total_with_vk_link });
+        stalled = data.processed > lastProcessed ? 0 : stalled + 1;
+        lastProcessed = data.processed;
+      } while (data.status === 'running' && stalled < RUN_CHECK_MAX_STALLED);
+      if (data.status === 'running') {
+        toast({
+          title: 'Проверка не завершена',
+          description: `Проверено ${data.checked} из ${data.total_with_vk_link} участников: ВК не отвечает для остальных. Запустите проверку позже — она продолжится с того же места`,
+          variant: 'destructive',
+        });
+        loadData(selectedContestId);
         return;
       }
       const rejectedText = autoReject && typeof data.rejected === 'number' ? `, отклонено заявок: ${data.rejected}` : '';
@@ -140,6 +176,7 @@ const VkCheckTab = ({ contests }: VkCheckTabProps) => {
       toast({ title: 'Ошибка', description: 'Не удалось выполнить проверку', variant: 'destructive' });
     } finally {
       setChecking(false);
+      setProgress(null);
     }
   };
 
@@ -219,7 +256,7 @@ const VkCheckTab = ({ contests }: VkCheckTabProps) => {
                 className="w-full bg-secondary hover:bg-secondary/90"
               >
                 {checking ? (
-                  <><Icon name="Loader2" size={16} className="mr-2 animate-spin" />Проверка...</>
+                  <><Icon name="Loader2" size={16} className="mr-2 animate-spin" />Проверка{progress ? ` ${progress.processed} из ${progress.total}` : ''}...</>
                 ) : (
                   <><Icon name="RefreshCw" size={16} className="mr-2" />Запустить проверку</>
                 )}
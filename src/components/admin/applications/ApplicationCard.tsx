@@ -1,5 +1,6 @@
 import { Card } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
+import { Checkbox } from '@/components/ui/checkbox';
 import Icon from '@/components/ui/icon';
 import { Application, CustomFieldDef } from './applicationTypes';
 import ApplicationDetails from './ApplicationDetails';
@@ -24,6 +25,8 @@ const getStatusBadgeClass = (status: string) => {
 
 interface ApplicationCardProps {
   app: Application;
+  selected?: boolean;
+  onToggleSelect?: (appId: number) => void;
   expandedId: number | null;
   editingId: number | null;
   savingEdit: boolean;
@@ -41,6 +44,8 @@ interface ApplicationCardProps {
 
 const ApplicationCard = ({
   app,
+  selected = false,
+  onToggleSelect,
   expandedId,
   editingId,
   savingEdit,
@@ -61,6 +66,9 @@ const ApplicationCard = ({
         <div className="flex items-start justify-between mb-4">
           <div className="flex-1">
             <div className="flex items-center gap-3 mb-2">
+              {onToggleSelect && (
+                <Checkbox checked={selected} onCheckedChange={() => onToggleSelect(app.id)} />
+              )}
               <h3 className="text-lg font-semibold">{app.full_name}</h3>
               <span
                 className={`inline-flex px-3 py-1 rounded-full text-xs font-semibold ${getStatusBadgeClass(
@@ -38,7 +38,7 @@ const ApplicationsFilters = ({
         <div>
           <label className="text-sm font-medium mb-2 block">Поиск</label>
           <Input
-            placeholder="Имя, email или ID..."
+            placeholder="Имя, email, телефон, город, номер или ID..."
             value={searchQuery}
             onChange={(e) => setSearchQuery(e.target.value)}
           />
@@ -9,12 +9,13 @@ import Icon from '@/components/ui/icon';
 import { useToast } from '@/hooks/use-toast';
 import { useDiplomaTemplates } from '@/hooks/useDiplomaTemplates';
 import { adminHeaders } from '@/config/adminApi';
-import { loadCustomFonts } from '@/lib/loadCustomFonts';
+import { loadCustomFonts, isCustomFontLoaded } from '@/lib/loadCustomFonts';
 import { renderDiplomaToCanvas } from '@/lib/renderDiplomaToCanvas';
-import { DiplomaTemplateField, A4_WIDTH_MM, A4_HEIGHT_MM, MM_TO_PX } from '@/types/diploma';
+import { DiplomaTemplateField, DiplomaFont, A4_WIDTH_MM, A4_HEIGHT_MM, MM_TO_PX } from '@/types/diploma';
 import DiplomaTemplateCanvas from './DiplomaTemplateCanvas';
 
 const RESULTS_API = 'https://functions.poehali.dev/e399905c-0871-434d-90ae-850d12af1c0d';
+const PROGRAM_API = 'https://functions.poehali.dev/9fcbf70c-fd6d-4489-bc77-1e4bcd6f1cb1';
 
 // Убирает символы, недопустимые в именах файлов на Windows/macOS/Linux, и обрезает пробелы по краям.
 const sanitizeFileName = (name: string): string =>
@@ -54,15 +55,40 @@ const DiplomaPrintModal = ({ contest, rows, onClose }: DiplomaPrintModalProps) =
   const [fields, setFields] = useState<DiplomaTemplateField[]>([]);
   const [orientation, setOrientation] = useState<'portrait' | 'landscape'>('portrait');
   const [backgroundUrl, setBackgroundUrl] = useState('');
+  const [previewBackgroundUrl, setPreviewBackgroundUrl] = useState('');
   const bgDataUrlRef = useRef('');
   const [, setBgReadyTick] = useState(0);
   const [selectedIds, setSelectedIds] = useState<Set<number>>(new Set(rows.map(r => r.id)));
   const [awardsById, setAwardsById] = useState<Record<number, string>>({});
+  const [qrCodesById, setQrCodesById] = useState<Record<number, string>>({});
   const [loadingTemplate, setLoadingTemplate] = useState(false);
   const [generating, setGenerating] = useState(false);
+  const [serverRendering, setServerRendering] = useState(false);
   const [previewRow, setPreviewRow] = useState<ProgramRow | null>(rows[0] || null);
   const [, setFontsVersion] = useState(0);
 
+  // Для печати достаточно подмножества глифов, которые встречаются в выбранном шаблоне, —
+  // сервер строит его один раз на (шрифт, шаблон) и кэширует в хранилище. Подмножество
+  // регистрируется под собственным семейством, чтобы не подменить полный шрифт в конструкторе
+  // и предпросмотре; промис отдаёт соответствие «шрифт → семейство подмножества» для печати.
+  const subsetFamiliesRef = useRef<Promise<Record<string, string>>>(Promise.resolve({}));
+  useEffect(() => {
+    if (!templateId) { subsetFamiliesRef.current = Promise.resolve({}); return; }
+    subsetFamiliesRef.current = fetch(`${PROGRAM_API}?action=font_subsets&template_id=${templateId}`, { headers: adminHeaders() })
+      .then(r => r.json())
+      .then(async d => {
+        const subsets: { font_id: number; name: string; subset_url: string }[] = d.fonts || [];
+        const subsetFonts: DiplomaFont[] = subsets.map(f => (
+          { id: f.font_id, name: `${f.name}__subset_${templateId}`, font_url: f.subset_url }
+        ));
+        await loadCustomFonts(subsetFonts);
+        const families: Record<string, string> = {};
+        subsets.forEach((f, i) => { if (isCustomFontLoaded(subsetFonts[i].name)) families[f.name] = subsetFonts[i].name; });
+        return families;
+      })
+      .catch(() => ({}));
+  }, [templateId]);
+
   useEffect(() => { loadCustomFonts(fonts).then(() => setFontsVersion(v => v + 1)); }, [fonts]);
 
   // Подложка хранится на отдельном CDN-домене. Конвертируем её в data-URL один раз при
@@ -94,6 +120,15 @@ const DiplomaPrintModal = ({ contest, rows, onClose }: DiplomaPrintModalProps) =
         setAwardsById(map);
       })
       .catch(() => {});
+    // QR-коды с подписанными токенами — для офлайн-проверки напечатанного диплома
+    fetch(`${PROGRAM_API}?action=diploma_qr_codes&contest_id=${contest.id}`, { headers: adminHeaders() })
+      .then(r => r.json())
+      .then(d => {
+        const map: Record<number, string> = {};
+        (d.rows || []).forEach((r: { id: number; diploma_qr: string }) => { map[r.id] = r.diploma_qr; });
+        setQrCodesById(map);
+      })
+      .catch(() => {});
   }, [contest.id]);
 
   useEffect(() => {
@@ -103,7 +138,8 @@ const DiplomaPrintModal = ({ contest, rows, onClose }: DiplomaPrintModalProps) =
       if (data) {
         setFields(data.fields);
         setOrientation(data.template.orientation);
-        setBackgroundUrl(data.template.background_url);
+        setPreviewBackgroundUrl(data.template.background_preview_url || data.template.background_url);
+        setBackgroundUrl(data.template.background_print_url || data.template.background_url);
       }
       setLoadingTemplate(false);
     });
@@ -121,6 +157,7 @@ const DiplomaPrintModal = ({ contest, rows, onClose }: DiplomaPrintModalProps) =
     participation_format: row.participation_format,
     diploma_number: row.diploma_number,
     award: awardsById[row.id] || '',
+    diploma_qr: qrCodesById[row.id] || '',
     contest_title: contest.title,
     contest_location: contest.location || '',
     contest_event_date: contest.event_date || '',
@@ -142,12 +179,14 @@ const DiplomaPrintModal = ({ contest, rows, onClose }: DiplomaPrintModalProps) =
 
   // Рисует диплом для одного участника напрямую через Canvas 2D (см. renderDiplomaToCanvas.ts) —
   // тем же кодом раскладки, что и живой предпросмотр, поэтому расхождений с превью быть не может.
-  const renderRowToCanvas = async (row: ProgramRow, pageWidthPx: number, pageHeightPx: number) => {
+  const renderRowToCanvas = async (
+    row: ProgramRow, printFields: DiplomaTemplateField[], pageWidthPx: number, pageHeightPx: number,
+  ) => {
     return renderDiplomaToCanvas({
       pageWidthPx,
       pageHeightPx,
       backgroundDataUrl: bgDataUrlRef.current,
-      fields,
+      fields: printFields,
       previewValues: buildPreviewValues(row),
     });
   };
@@ -164,8 +203,12 @@ const DiplomaPrintModal = ({ contest, rows, onClose }: DiplomaPrintModalProps) =
     if (!templateId || selectedRows.length === 0) return;
     setGenerating(true);
     try {
+      const subsetFamilies = await subsetFamiliesRef.current;
       await loadCustomFonts(fonts);
       await document.fonts.ready;
+      const printFields = fields.map(f => (
+        subsetFamilies[f.font_family] ? { ...f, font_family: subsetFamilies[f.font_family] } : f
+      ));
       if (backgroundUrl && !bgDataUrlRef.current) {
         // Подложка ещё конвертируется в data-URL (см. useEffect выше) — ждём готовности,
         // чтобы отрисовать её вместе с текстом на холсте.
@@ -186,7 +229,7 @@ const DiplomaPrintModal = ({ contest, rows, onClose }: DiplomaPrintModalProps) =
 
       if (selectedRows.length === 1) {
         const row = selectedRows[0];
-        const canvas = await renderRowToCanvas(row, pageWidthPx, pageHeightPx);
+        const canvas = await renderRowToCanvas(row, printFields, pageWidthPx, pageHeightPx);
         const imgData = canvas.toDataURL('image/jpeg', 0.95);
         const pdf = new jsPDF({ orientation, unit: 'mm', format: 'a4' });
         pdf.addImage(imgData, 'JPEG', 0, 0, widthMm, heightMm);
@@ -195,7 +238,7 @@ const DiplomaPrintModal = ({ contest, rows, onClose }: DiplomaPrintModalProps) =
         const zip = new JSZip();
         for (let i = 0; i < selectedRows.length; i++) {
           const row = selectedRows[i];
-          const canvas = await renderRowToCanvas(row, pageWidthPx, pageHeightPx);
+          const canvas = await renderRowToCanvas(row, printFields, pageWidthPx, pageHeightPx);
           const imgData = canvas.toDataURL('image/jpeg', 0.95);
           const pdf = new jsPDF({ orientation, unit: 'mm', format: 'a4' });
           pdf.addImage(imgData, 'JPEG', 0, 0, widthMm, heightMm);
@@ -219,6 +262,32 @@ const DiplomaPrintModal = ({ contest, rows, onClose }: DiplomaPrintModalProps) =
     }
   };
 
+  // Большие партии удобнее формировать на сервере: браузер не рисует каждый диплом сам,
+  // а получает ссылку на готовый zip-архив в хранилище.
+  const handleServerRender = async () => {
+    if (!templateId || selectedRows.length === 0) return;
+    setServerRendering(true);
+    try {
+      const res = await fetch(`${PROGRAM_API}?action=render_diplomas`, {
+        method: 'POST',
+        headers: adminHeaders(),
+        body: JSON.stringify({
+          contest_id: contest.id,
+          template_id: Number(templateId),
+          row_ids: selectedRows.map(r => r.id),
+        }),
+      });
+      const result = await res.json();
+      if (!res.ok) throw new Error(result.error);
+      window.open(result.zip_url, '_blank');
+      toast({ title: 'Готово', description: `Сгенерировано дипломов на сервере: ${result.count}` });
+    } catch (e) {
+      toast({ title: 'Ошибка генерации на сервере', description: e instanceof Error ? e.message : undefined, variant: 'destructive' });
+    } finally {
+      setServerRendering(false);
+    }
+  };
+
   return createPortal(
     <div className="fixed inset-0 z-50 bg-black/60 flex items-center justify-center p-4">
       <Card className="w-full max-w-5xl max-h-[90vh] flex flex-col">
@@ -260,6 +329,10 @@ const DiplomaPrintModal = ({ contest, rows, onClose }: DiplomaPrintModalProps) =
               {generating ? <Icon name="Loader" size={16} className="mr-2 animate-spin" /> : <Icon name="Printer" size={16} className="mr-2" />}
               Сформировать PDF ({selectedRows.length})
             </Button>
+            <Button variant="outline" className="w-full" onClick={handleServerRender} disabled={!templateId || selectedRows.length === 0 || serverRendering}>
+              {serverRendering ? <Icon name="Loader" size={16} className="mr-2 animate-spin" /> : <Icon name="Server" size={16} className="mr-2" />}
+              Сформировать на сервере
+            </Button>
           </div>
 
           <div className="flex-1 overflow-auto bg-muted/40 p-6 flex items-start justify-center">
@@ -271,7 +344,7 @@ const DiplomaPrintModal = ({ contest, rows, onClose }: DiplomaPrintModalProps) =
               <div style={{ transform: 'scale(0.6)', transformOrigin: 'top center' }}>
                 <DiplomaTemplateCanvas
                   orientation={orientation}
-                  backgroundUrl={backgroundUrl}
+                  backgroundUrl={previewBackgroundUrl}
                   fields={fields}
                   onUpdateField={() => {}}
                   previewMode
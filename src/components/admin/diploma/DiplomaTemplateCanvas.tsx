@@ -1,6 +1,6 @@
 import { useState } from 'react';
 import { Rnd } from 'react-rnd';
-import { DiplomaTemplateField, DiplomaGuide, MM_TO_PX, A4_WIDTH_MM, A4_HEIGHT_MM } from '@/types/diploma';
+import { DiplomaTemplateField, DiplomaGuide, MM_TO_PX, A4_WIDTH_MM, A4_HEIGHT_MM, DIPLOMA_QR_KEY } from '@/types/diploma';
 import { computeAutoFitFontSize, measureTextWidth } from '@/lib/autoFitText';
 import { fieldPreviewText, computeGroupLayout } from '@/lib/diplomaLayout';
 
@@ -193,6 +193,16 @@ const DiplomaTemplateCanvas = ({
         };
 
         if (previewMode) {
+          if (field.data_key === DIPLOMA_QR_KEY && previewValues) {
+            const qr = previewValues[DIPLOMA_QR_KEY];
+            return (
+              <div key={i} style={{ position: 'absolute', left: xPx, top: yPx, width: wPx, height: hPx }}>
+                {qr && (
+                  <img src={qr} alt="" style={{ width: '100%', height: '100%', objectFit: 'contain', imageRendering: 'pixelated' }} />
+                )}
+              </div>
+            );
+          }
           return (
             <div key={i} style={{ position: 'absolute', left: xPx, top: yPx, width: wPx, height: hPx }}>
               <div style={textStyle}>{text}</div>
@@ -98,8 +98,8 @@ const DiplomaTemplateEditor = ({ templateId, onBack }: DiplomaTemplateEditorProp
       return;
     }
     setUploadingBg(true);
-    const url = await uploadBackground(template.id, file);
-    if (url) setTemplate(prev => prev ? { ...prev, background_url: url } : prev);
+    const urls = await uploadBackground(template.id, file);
+    if (urls) setTemplate(prev => prev ? { ...prev, ...urls } : prev);
     setUploadingBg(false);
   };
 
@@ -107,7 +107,7 @@ const DiplomaTemplateEditor = ({ templateId, onBack }: DiplomaTemplateEditorProp
     if (!template || !template.background_url) return;
     if (!confirm('Удалить подложку?')) return;
     const ok = await deleteBackground(template.id);
-    if (ok) setTemplate(prev => prev ? { ...prev, background_url: '' } : prev);
+    if (ok) setTemplate(prev => prev ? { ...prev, background_url: '', background_preview_url: '', background_print_url: '' } : prev);
   };
 
   const handleOrientationChange = (orientation: string) => {
@@ -225,7 +225,7 @@ const DiplomaTemplateEditor = ({ templateId, onBack }: DiplomaTemplateEditorProp
           <DiplomaRulers pageWidthPx={pageWidthPx} pageHeightPx={pageHeightPx} onAddGuide={addGuide}>
             <DiplomaTemplateCanvas
               orientation={template.orientation}
-              backgroundUrl={template.background_url}
+              backgroundUrl={template.background_preview_url || template.background_url}
               fields={fields}
               selectedIndices={selectedIndices}
               onSelect={setSelectedIndices}
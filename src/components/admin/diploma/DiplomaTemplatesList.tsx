@@ -89,7 +89,7 @@ const DiplomaTemplatesList = ({ onOpenEditor }: DiplomaTemplatesListProps) => {
                 onClick={() => onOpenEditor(t.id)}
               >
                 {t.background_url ? (
-                  <img src={t.background_url} alt={t.name} className="w-full h-full object-cover" />
+                  <img src={t.background_preview_url || t.background_url} alt={t.name} className="w-full h-full object-cover" />
                 ) : (
                   <Icon name="FileBadge" size={32} className="text-muted-foreground/30" />
                 )}
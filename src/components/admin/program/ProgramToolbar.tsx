@@ -113,7 +113,7 @@ const ProgramToolbar = ({
                   Импорт Excel
                 </span>
               </Button>
-              <input type="file" accept=".xlsx,.xls" className="hidden" onChange={onImportExcel} />
+              <input type="file" accept=".xlsx,.xls,.csv" className="hidden" onChange={onImportExcel} />
             </label>
           </>
         )}
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { adminHeaders } from '@/config/adminApi';
 
 interface Application {
@@ -12,23 +12,52 @@ interface Application {
   admin_comment?: string;
 }
 
-export const useAdminApplications = (statusFilter: string, contestFilter: string, enabled: boolean = true) => {
+interface ApplicationsCursor {
+  before_submitted_at: string;
+  before_id: number;
+}
+
+// Заявки грузятся страницами (вместе с файлами), следующие — по next_cursor кнопкой «Показать ещё»
+const APPLICATIONS_PAGE_SIZE = 50;
+const MAX_APPLICATIONS_PAGE = 500;
+
+export const useAdminApplications = (statusFilter: string, contestFilter: string, enabled: boolean = true, searchQuery: string = '') => {
   const [applications, setApplications] = useState<Application[]>([]);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [total, setTotal] = useState(0);
+  const [nextCursor, setNextCursor] = useState<ApplicationsCursor | null>(null);
+  // Сколько заявок уже показано: обновление после изменений перечитывает столько же, а не только первую страницу
+  const loadedCountRef = useRef(0);
+
+  const fetchApplications = async (limit: number, cursor: ApplicationsCursor | null) => {
+    const params = new URLSearchParams();
+    if (statusFilter !== 'all') params.append('status', statusFilter);
+    if (contestFilter !== 'all') params.append('contest_id', contestFilter);
+    if (searchQuery.trim()) params.append('search', searchQuery.trim());
+    params.append('limit', String(limit));
+    if (cursor) {
+      params.append('before_submitted_at', cursor.before_submitted_at);
+      params.append('before_id', String(cursor.before_id));
+    }
+
+    const response = await fetch(
+      `https://functions.poehali.dev/27d46d11-5402-4428-b786-4d2eb3aace8b?${params}`,
+      { headers: adminHeaders() }
+    );
+    return response.json();
+  };
 
   const loadApplications = async () => {
     setLoading(true);
     try {
-      const params = new URLSearchParams();
-      if (statusFilter !== 'all') params.append('status', statusFilter);
-      if (contestFilter !== 'all') params.append('contest_id', contestFilter);
-
-      const response = await fetch(
-        `https://functions.poehali.dev/27d46d11-5402-4428-b786-4d2eb3aace8b?${params}`,
-        { headers: adminHeaders() }
-      );
-      const data = await response.json();
-      setApplications(data.applications || []);
+      const limit = Math.min(Math.max(APPLICATIONS_PAGE_SIZE, loadedCountRef.current), MAX_APPLICATIONS_PAGE);
+      const data = await fetchApplications(limit, null);
+      const loaded = data.applications || [];
+      setApplications(loaded);
+      setTotal(data.total ?? loaded.length);
+      setNextCursor(data.next_cursor || null);
+      loadedCountRef.current = loaded.length;
     } catch (error) {
       console.error('Ошибка загрузки заявок:', error);
     } finally {
@@ -36,6 +65,24 @@ export const useAdminApplications = (statusFilter: string, contestFilter: string
     }
   };
 
+  const loadMoreApplications = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const data = await fetchApplications(APPLICATIONS_PAGE_SIZE, nextCursor);
+      const loaded = data.applications || [];
+      setApplications(prev => {
+        loadedCountRef.current = prev.length + loaded.length;
+        return [...prev, ...loaded];
+      });
+      setNextCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error('Ошибка загрузки заявок:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const updateStatus = async (applicationId: number, newStatus: string, adminComment?: string) => {
     try {
       const response = await fetch(
@@ -63,6 +110,33 @@ export const useAdminApplications = (statusFilter: string, contestFilter: string
     }
   };
 
+  const bulkUpdateStatus = async (applicationIds: number[], newStatus: string, adminComment?: string) => {
+    try {
+      const response = await fetch(
+        'https://functions.poehali.dev/27d46d11-5402-4428-b786-4d2eb3aace8b?action=bulk_status',
+        {
+          method: 'PUT',
+          headers: adminHeaders(),
+          body: JSON.stringify({
+            application_ids: applicationIds,
+            status: newStatus,
+            admin_comment: adminComment || '',
+          }),
+        }
+      );
+
+      if (response.ok) {
+        const data = await response.json();
+        loadApplications();
+        return data;
+      }
+      return null;
+    } catch (error) {
+      console.error('Ошибка массового обновления статуса:', error);
+      return null;
+    }
+  };
+
   const updateFields = async (payload: Record<string, unknown>) => {
     try {
       const response = await fetch(
@@ -114,13 +188,20 @@ export const useAdminApplications = (statusFilter: string, contestFilter: string
 
   useEffect(() => {
     if (!enabled) return;
-    loadApplications();
-  }, [statusFilter, contestFilter, enabled]);
+    loadedCountRef.current = 0;
+    const timer = setTimeout(loadApplications, searchQuery ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [statusFilter, contestFilter, searchQuery, enabled]);
 
   return {
     applications,
     loading,
+    loadingMore,
+    total,
+    hasMore: nextCursor !== null,
+    loadMoreApplications,
     updateStatus,
+    bulkUpdateStatus,
     toggleEditingLock,
     updateFields,
     loadApplications
@@ -90,7 +90,7 @@ export const useDiplomaTemplates = () => {
     }
   }, [toast]);
 
-  const uploadBackground = useCallback(async (id: number, file: File): Promise<string | null> => {
+  const uploadBackground = useCallback(async (id: number, file: File): Promise<Pick<DiplomaTemplate, 'background_url' | 'background_preview_url' | 'background_print_url'> | null> => {
     try {
       const compressed = await compressImage(file, { maxSizeBytes: 5 * 1024 * 1024 });
       const b64 = await new Promise<string>((resolve, reject) => {
@@ -107,7 +107,11 @@ export const useDiplomaTemplates = () => {
       const data = await res.json();
       if (!res.ok) throw new Error(data.error);
       toast({ title: 'Подложка загружена' });
-      return data.background_url;
+      return {
+        background_url: data.background_url,
+        background_preview_url: data.background_preview_url,
+        background_print_url: data.background_print_url,
+      };
     } catch {
       toast({ title: 'Ошибка загрузки подложки', variant: 'destructive' });
       return null;
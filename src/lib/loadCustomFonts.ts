@@ -8,13 +8,16 @@ const failedFonts = new Set<string>();
 // Шрифт сначала скачивается через fetch в ArrayBuffer (а не передаётся в FontFace как URL) —
 // так браузер не делает повторный CORS-запрос и ошибки загрузки видны явно, а не как
 // непрозрачный DOMException.
+export const isCustomFontLoaded = (name: string): boolean => loadedFonts.has(name);
+
 export const loadCustomFonts = async (fonts: DiplomaFont[]): Promise<void> => {
   const toLoad = fonts.filter(f => f.font_url && !loadedFonts.has(f.name));
   if (toLoad.length === 0) return;
 
   await Promise.all(toLoad.map(async font => {
     try {
-      const res = await fetch(font.font_url);
+      // WOFF2-версия (если сервер её сделал при загрузке) в 2-3 раза легче исходного TTF/OTF
+      const res = await fetch(font.woff2_url || font.font_url);
       if (!res.ok) throw new Error(`HTTP ${res.status} при загрузке файла шрифта`);
       const buffer = await res.arrayBuffer();
       const fontFace = new FontFace(font.name, buffer);
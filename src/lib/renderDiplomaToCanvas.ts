@@ -8,7 +8,7 @@
 // использует ту же ctx.measureText(), что и живой предпросмотр (см. diplomaLayout.ts),
 // поэтому расхождений быть не может в принципе — это один и тот же код.
 
-import { DiplomaTemplateField } from '@/types/diploma';
+import { DiplomaTemplateField, DIPLOMA_QR_KEY } from '@/types/diploma';
 import { computeAutoFitFontSize, measureTextWidth } from './autoFitText';
 import { fieldPreviewText, computeGroupLayout, wrapTextLines, canvasFont } from './diplomaLayout';
 
@@ -60,6 +60,7 @@ export const renderDiplomaToCanvas = async (opts: RenderOptions): Promise<HTMLCa
   const groupLayout = computeGroupLayout(
     opts.fields, opts.pageWidthPx, opts.pageHeightPx, opts.previewValues, measureTextWidth, computeAutoFitFontSize,
   );
+  const qrImage = opts.previewValues[DIPLOMA_QR_KEY] ? await loadImage(opts.previewValues[DIPLOMA_QR_KEY]) : null;
 
   opts.fields.forEach((field, i) => {
     const override = groupLayout.get(i);
@@ -68,6 +69,17 @@ export const renderDiplomaToCanvas = async (opts: RenderOptions): Promise<HTMLCa
     const wPx = override ? override.wPx : (field.width / 100) * opts.pageWidthPx;
     const hPx = override ? override.hPx : (field.height / 100) * opts.pageHeightPx;
 
+    if (field.data_key === DIPLOMA_QR_KEY) {
+      // Квадрат по меньшей стороне поля, по центру; модули QR масштабируются без сглаживания
+      if (qrImage) {
+        const side = Math.min(wPx, hPx);
+        ctx.imageSmoothingEnabled = false;
+        ctx.drawImage(qrImage, xPx + (wPx - side) / 2, yPx + (hPx - side) / 2, side, side);
+        ctx.imageSmoothingEnabled = true;
+      }
+      return;
+    }
+
     const text = fieldPreviewText(field, opts.previewValues);
     const autoFit = field.auto_fit !== false;
     const fontSize = override
@@ -57,7 +57,7 @@ const AdminPage = () => {
     setShowEditModal: setShowEditConcertModal,
   } = useAdminConcerts();
 
-  const { applications, loading: applicationsLoading, updateStatus, toggleEditingLock, updateFields, loadApplications } = useAdminApplications(statusFilter, contestFilter, activeTab === 'applications');
+  const { applications, loading: applicationsLoading, loadingMore: applicationsLoadingMore, total: applicationsTotal, hasMore: hasMoreApplications, loadMoreApplications, updateStatus, bulkUpdateStatus, toggleEditingLock, updateFields, loadApplications } = useAdminApplications(statusFilter, contestFilter, activeTab === 'applications', searchQuery);
 
   const handleToggleEditingLock = async (applicationId: number, locked: boolean) => {
     const result = await toggleEditingLock(applicationId, locked);
@@ -128,6 +128,23 @@ const AdminPage = () => {
     }
   };
 
+  const handleBulkUpdateStatus = async (applicationIds: number[], newStatus: string): Promise<boolean> => {
+    const result = await bulkUpdateStatus(applicationIds, newStatus);
+    if (result) {
+      toast({
+        title: 'Статусы обновлены',
+        description: `Заявок: ${result.updated}` + (result.program_created ? `, добавлено в программу: ${result.program_created}` : ''),
+      });
+      return true;
+    }
+    toast({
+      title: 'Ошибка',
+      description: 'Не удалось обновить статусы заявок',
+      variant: 'destructive',
+    });
+    return false;
+  };
+
   const handleDeleteApplication = async (applicationId: number) => {
     try {
       const response = await fetch(`https://functions.poehali.dev/27d46d11-5402-4428-b786-4d2eb3aace8b?id=${applicationId}`, {
@@ -306,11 +323,16 @@ const AdminPage = () => {
             setContestFilter={setContestFilter}
             contests={contests}
             handleUpdateStatus={handleUpdateStatus}
+            handleBulkUpdateStatus={handleBulkUpdateStatus}
             handleDeleteApplication={handleDeleteApplication}
             handleToggleEditingLock={handleToggleEditingLock}
             handleToggleContestLock={handleToggleContestLock}
             handleUpdateFields={handleUpdateFields}
             loadApplications={loadApplications}
+            applicationsTotal={applicationsTotal}
+            hasMoreApplications={hasMoreApplications}
+            applicationsLoadingMore={applicationsLoadingMore}
+            loadMoreApplications={loadMoreApplications}
             handleCreateClick={handleCreateClick}
             openEditModal={openEditModal}
             handleDeleteContest={handleDeleteContest}
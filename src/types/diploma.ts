@@ -10,6 +10,8 @@ export interface DiplomaTemplate {
   template_type: 'diploma' | 'thanks';
   orientation: 'portrait' | 'landscape';
   background_url: string;
+  background_preview_url?: string;
+  background_print_url?: string;
   guides?: DiplomaGuide[];
   fields_count?: number;
   created_at?: string;
@@ -41,6 +43,7 @@ export interface DiplomaFont {
   id: number;
   name: string;
   font_url: string;
+  woff2_url?: string;
 }
 
 export interface DataFieldOption {
@@ -66,8 +69,13 @@ export const DIPLOMA_DATA_FIELDS: DataFieldOption[] = [
   { key: 'contest_title', label: 'Название конкурса' },
   { key: 'contest_location', label: 'Город конкурса' },
   { key: 'contest_event_date', label: 'Дата конкурса' },
+  { key: 'diploma_qr', label: 'QR-код проверки диплома' },
 ];
 
+// Поле с этим ключом рисуется не текстом, а QR-кодом с подписанным токеном диплома
+// (значение — PNG data-URL, который отдаёт contest-program ?action=diploma_qr_codes).
+export const DIPLOMA_QR_KEY = 'diploma_qr';
+
 export const FONT_OPTIONS = ['Montserrat', 'Open Sans', 'Playfair Display', 'Great Vibes', 'PT Serif', 'Cormorant Garamond'];
 
 export const MM_TO_PX = 3.7795275591; // 96 dpi